@@ -1,2 +1,5 @@
 from .player_tracker import PlayerTracker
-from .ball_tracker import BallTracker
\ No newline at end of file
+from .ball_tracker import BallTracker
+from .strided_detection import StridedDetector
+from .ball_kalman import BallKalmanFilter, WindowedBallDetector
+from .online_filters import FixedLagBallInterpolator, OnlineShotDetector
\ No newline at end of file
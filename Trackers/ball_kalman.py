@@ -0,0 +1,185 @@
+from typing import Dict, List
+import numpy as np
+
+
+class BallKalmanFilter:
+    """
+    Class to track the center of the ball with a Kalman filter. The state is [x, y, vx, vy] in pixels and pixels per frame,
+    with a constant velocity model plus an optional constant downward acceleration (gravity, in pixels per frame squared).
+    Measurements are weighted by the confidence of the detection: the measurement noise variance is divided by the confidence.
+    """
+    def __init__(self, process_noise=4.0, measurement_noise=3.0, initial_velocity_std=30.0, gravity=0.0):
+        """Constructor for BallKalmanFilter class
+
+        Args:
+            process_noise (float): variance of the unmodelled acceleration of the ball, in pixels per frame squared, defaults to 4
+            measurement_noise (float): standard deviation of the position of a detection of confidence 1, in pixels, defaults to 3
+            initial_velocity_std (float): standard deviation of the velocity of a new track, in pixels per frame, defaults to 30
+            gravity (float): downward acceleration of the ball in the image, in pixels per frame squared, defaults to 0
+        """
+        self.measurement_noise = measurement_noise
+        self.initial_velocity_std = initial_velocity_std
+        self.transition = np.array([[1.0, 0.0, 1.0, 0.0],
+                                    [0.0, 1.0, 0.0, 1.0],
+                                    [0.0, 0.0, 1.0, 0.0],
+                                    [0.0, 0.0, 0.0, 1.0]])
+        self.control = np.array([0.0, 0.5 * gravity, 0.0, gravity])
+        # white noise acceleration over one frame, for each axis
+        axis_noise = process_noise * np.array([[0.25, 0.5], [0.5, 1.0]])
+        self.process_covariance = np.zeros((4, 4))
+        self.process_covariance[np.ix_([0, 2], [0, 2])] = axis_noise
+        self.process_covariance[np.ix_([1, 3], [1, 3])] = axis_noise
+        self.observation = np.eye(2, 4)
+        self.state = None
+        self.covariance = None
+
+    def is_initialized(self):
+        """Check if the filter is tracking a ball
+
+        Returns:
+            bool: True once the filter has been initialized and until it is reset
+        """
+        return self.state is not None
+
+    def initialize(self, position):
+        """Start a track at a position, with zero velocity
+
+        Args:
+            position: (x, y) of the center of the ball
+        """
+        self.state = np.array([position[0], position[1], 0.0, 0.0])
+        self.covariance = np.diag([self.measurement_noise**2, self.measurement_noise**2, self.initial_velocity_std**2, self.initial_velocity_std**2])
+
+    def reset(self):
+        """Stop tracking"""
+        self.state = None
+        self.covariance = None
+
+    def predict(self):
+        """Advance the filter by one frame
+
+        Returns:
+            array: predicted (x, y) of the center of the ball
+        """
+        self.state = self.transition @ self.state + self.control
+        self.covariance = self.transition @ self.covariance @ self.transition.T + self.process_covariance
+        return self.state[:2].copy()
+
+    def update(self, position, confidence=1.0):
+        """Correct the filter with a detection
+
+        Args:
+            position: (x, y) of the center of the detected ball
+            confidence (float): confidence of the detection, between 0 and 1, defaults to 1
+
+        Returns:
+            array: filtered (x, y) of the center of the ball
+        """
+        measurement_covariance = np.eye(2) * self.measurement_noise**2 / max(confidence, 1e-3)
+        innovation = np.asarray(position, dtype=np.float64) - self.observation @ self.state
+        innovation_covariance = self.observation @ self.covariance @ self.observation.T + measurement_covariance
+        gain = self.covariance @ self.observation.T @ np.linalg.inv(innovation_covariance)
+        self.state = self.state + gain @ innovation
+        self.covariance = (np.eye(4) - gain @ self.observation) @ self.covariance
+        return self.state[:2].copy()
+
+    def get_position_std(self):
+        """Get the uncertainty of the position
+
+        Returns:
+            array: standard deviation of (x, y) in pixels
+        """
+        return np.sqrt(np.diag(self.covariance)[:2])
+
+
+class WindowedBallDetector:
+    """
+    Class to detect the ball in a small search window around the position predicted by a BallKalmanFilter, instead of in the
+    whole frame. The model runs on the window at an input size equal to the window size, so its cost does not depend on
+    the resolution of the video. Detection falls back to the whole frame at the start and after the ball has been missed
+    in more than max_lost_frames consecutive frames. Each frame keeps its most confident box, and the position is the
+    confidence-weighted filtered position instead of the raw box.
+    """
+    def __init__(self, detect_boxes, search_window_size=320, max_lost_frames=5, kalman_filter=None):
+        """Constructor for WindowedBallDetector class
+
+        Args:
+            detect_boxes: function called as detect_boxes(image, imgsz) returning a list of (bbox, confidence) of the balls
+                detected in the image, imgsz being None for the default input size of the model
+            search_window_size (int): side of the square search window in pixels, a multiple of 32, defaults to 320
+            max_lost_frames (int): number of consecutive frames without a detection after which the whole frame is searched, defaults to 5
+            kalman_filter (BallKalmanFilter): filter of the ball position, defaults to a BallKalmanFilter with default parameters
+        """
+        self.detect_boxes = detect_boxes
+        self.search_window_size = search_window_size
+        self.max_lost_frames = max_lost_frames
+        self.kalman_filter = kalman_filter if kalman_filter is not None else BallKalmanFilter()
+        self.lost_frames = 0
+        self.number_of_full_frame_detections = 0
+        self.number_of_window_detections = 0
+
+    def get_search_window(self, predicted_position, frame_shape):
+        """Get the search window around a predicted position, grown with the uncertainty of the prediction and kept inside the frame
+
+        Args:
+            predicted_position: predicted (x, y) of the center of the ball
+            frame_shape: shape of the frame
+
+        Returns:
+            tuple: (x1, y1, x2, y2) of the window
+        """
+        frame_height, frame_width = frame_shape[:2]
+        half_size = max(self.search_window_size / 2, 3 * float(self.kalman_filter.get_position_std().max()))
+        window_width = int(min(2 * half_size, frame_width))
+        window_height = int(min(2 * half_size, frame_height))
+        x1 = int(np.clip(predicted_position[0] - window_width / 2, 0, frame_width - window_width))
+        y1 = int(np.clip(predicted_position[1] - window_height / 2, 0, frame_height - window_height))
+        return x1, y1, x1 + window_width, y1 + window_height
+
+    def detect_frame(self, frame)->Dict:
+        """Detect the ball in the next frame of the video
+
+        Args:
+            frame: frame of a video, the frames being passed in order
+
+        Returns:
+            dict: dictionary containing the bounding box of the ball around its filtered position, empty if the ball is not detected
+        """
+        tracking = self.kalman_filter.is_initialized()
+        if tracking:
+            predicted_position = self.kalman_filter.predict()
+            x1, y1, x2, y2 = self.get_search_window(predicted_position, frame.shape)
+            boxes = [([bbox[0] + x1, bbox[1] + y1, bbox[2] + x1, bbox[3] + y1], confidence)
+                     for bbox, confidence in self.detect_boxes(frame[y1:y2, x1:x2], self.search_window_size)]
+            self.number_of_window_detections += 1
+        else:
+            boxes = self.detect_boxes(frame, None)
+            self.number_of_full_frame_detections += 1
+
+        if not boxes:
+            self.lost_frames += 1
+            if self.lost_frames > self.max_lost_frames:
+                self.kalman_filter.reset()
+            return {}
+
+        bbox, confidence = max(boxes, key=lambda box: box[1])
+        center = ((bbox[0] + bbox[2]) / 2, (bbox[1] + bbox[3]) / 2)
+        if tracking:
+            center = self.kalman_filter.update(center, confidence)
+        else:
+            self.kalman_filter.initialize(center)
+        self.lost_frames = 0
+        half_width = (bbox[2] - bbox[0]) / 2
+        half_height = (bbox[3] - bbox[1]) / 2
+        return {1: [float(center[0] - half_width), float(center[1] - half_height), float(center[0] + half_width), float(center[1] + half_height)]}
+
+    def detect_frames(self, frames)->List[Dict]:
+        """Detect the ball in the frames of a video
+
+        Args:
+            frames: list or iterable of frames of a video
+
+        Returns:
+            list: list of dictionaries containing the bounding box of the ball for each frame
+        """
+        return [self.detect_frame(frame) for frame in frames]
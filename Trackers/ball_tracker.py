@@ -1,21 +1,42 @@
-from ultralytics import YOLO
 import cv2
-from typing import Dict
+from typing import Dict, List
 import pickle
-import pandas as pd
+import numpy as np
+from Utils.video_utils import chunk_frames
+from Utils.detection_cache import DetectionCache
+from Utils.detection_table import DetectionTable
+from Utils.instrumentation import timed
+from Utils.model_registry import model_registry, load_yolo_model
+from .ball_kalman import BallKalmanFilter, WindowedBallDetector
 
 class BallTracker:
     """
     Class to detect a ball in a video using YOLOv5 model
     """
-    def __init__(self, model_path: str):
+    def __init__(self, model_path: str, conf: float = 0.15, inference_region=None, search_window_size=None, max_lost_frames: int = 5):
         """Constructor for BallTracker class
 
         Args:
             model_path (str): path to the YOLOv5 model
+            conf (float): minimum confidence of a ball detection, defaults to 0.15
+            inference_region (InferenceRegion): region of the frame the model runs on, None to run it on the full frame, defaults to None
+            search_window_size (int): side of the window around the position predicted by a Kalman filter in which the ball is searched
+                (see WindowedBallDetector), None to search the whole frame in every frame, defaults to None
+            max_lost_frames (int): number of frames without a detection after which the whole frame is searched again, defaults to 5
         """
-        self.model = YOLO(model_path)
+        # the model is loaded when the tracker first runs it, so detections read from a cache do not load it
+        self.model_path = model_path
+        self.inference_params = {'conf': conf}
+        self.inference_region = inference_region
+        self.search_window_size = search_window_size
+        self.max_lost_frames = max_lost_frames
 
+    @property
+    def model(self):
+        """YOLO model of the tracker, loaded on first use and shared with the other trackers of the same weights (see ModelRegistry)"""
+        return model_registry.get(('yolo', self.model_path), lambda: load_yolo_model(self.model_path))
+
+    @timed(count_frames=1)
     def detect_frame(self, frame)->Dict:
         """Detect a ball in a single frame using YOLOv5 model, and return the bounding box of the ball
 
@@ -25,22 +46,109 @@ class BallTracker:
         Returns:
             dict: dictionary containing the bounding box of the ball
         """
-        results = self.model.predict(frame,conf=0.15)[0] # we will not track since there is only one ball
+        if self.inference_region is not None:
+            frame = self.inference_region.crop(frame)
+        results = self.model.predict(frame,**self.inference_params)[0] # we will not track since there is only one ball
+        return self.get_ball_dict(results)
+
+    @timed(count_frames=len)
+    def detect_batch(self, frames)->List[Dict]:
+        """Detect a ball in a batch of frames with a single call to the YOLOv5 model
+
+        Args:
+            frames: list of frames of a video to detect a ball in
+
+        Returns:
+            list: list of dictionaries containing the bounding box of the ball, one per frame
+        """
+        if self.inference_region is not None:
+            frames = [self.inference_region.crop(frame) for frame in frames]
+        results = self.model.predict(frames,**self.inference_params)
+        return [self.get_ball_dict(result) for result in results]
+
+    def get_ball_dict(self, results)->Dict:
+        """Convert the YOLO results of one frame to a dictionary with the bounding box of the ball, in full-frame coordinates
+
+        Args:
+            results: YOLO results of a single frame
+
+        Returns:
+            dict: dictionary containing the bounding box of the ball
+        """
         ball_dict = {}
         for box in results.boxes:
             result = box.xyxy.tolist()[0]
             ball_dict[1] = result
+        if self.inference_region is not None:
+            ball_dict = self.inference_region.to_frame_detections(ball_dict)
         return ball_dict
+
+    @timed(count_frames=1)
+    def detect_boxes(self, image, imgsz=None)->List:
+        """Detect all the balls in an image with their confidences. Used by WindowedBallDetector, on whole frames (cropped to the
+        inference region if there is one) when imgsz is None, and on search windows at an input size of imgsz otherwise.
+
+        Args:
+            image: frame, or search window of a frame
+            imgsz (int): input size of the model, None for a whole frame, defaults to None
+
+        Returns:
+            list: list of (bounding box, confidence), the bounding boxes being in the coordinates of the image
+        """
+        region = self.inference_region if imgsz is None else None
+        if region is not None:
+            image = region.crop(image)
+        params = self.inference_params if imgsz is None else {**self.inference_params, 'imgsz': imgsz}
+        results = self.model.predict(image,**params)[0]
+        boxes = []
+        for box in results.boxes:
+            bbox = box.xyxy.tolist()[0]
+            if region is not None:
+                bbox = region.to_frame_bbox(bbox)
+            boxes.append((bbox, box.conf.tolist()[0]))
+        return boxes
     
-    def detect_frames(self, frames, read_from_stub=False, stub_path=None):
-        """Detect a ball in multiple frames using YOLOv5 model. Calls detect_frame() for each frame.
+    def detect_uncached_frames(self, frames, batch_size=1):
+        """Detect a ball in multiple frames with the model, for detect_frames(). Not timed itself, so that the frames and the
+        time of detect_frames() are counted once whether or not the detections go through the cache.
+
+        Args:
+            frames: list or iterable of frames of a video
+            batch_size: number of frames sent to the model in one call, defaults to 1
+
+        Returns:
+            list: list of dictionaries containing the track IDs as keys and the bounding boxes as values for each frame
+        """
+        ball_detections = []
+        if self.search_window_size is not None:
+            windowed_detector = WindowedBallDetector(self.detect_boxes, self.search_window_size, self.max_lost_frames, BallKalmanFilter())
+            ball_detections = windowed_detector.detect_frames(frames)
+        elif batch_size > 1:
+            for batch in chunk_frames(frames, batch_size):
+                ball_detections.extend(self.detect_batch(batch))
+        else:
+            for frame in frames:
+                ball_dict = self.detect_frame(frame)
+                ball_detections.append(ball_dict)
+        return ball_detections
+
+    @timed(count_frames=len)
+    def detect_frames(self, frames, read_from_stub=False, stub_path=None, batch_size=1, cache=None):
+        """Detect a ball in multiple frames using YOLOv5 model. Calls detect_frame() for each frame, or detect_batch() for
+        every batch_size frames when batch_size is greater than 1.
+        When the tracker has a search_window_size, the ball is tracked with a Kalman filter and searched in a window around
+        its predicted position (see WindowedBallDetector), and batch_size is not used.
         If read_from_stub is True, then the ball detections are read from a pickle file at stub_path.
         If running for the first time, then the ball detections are saved to the pickle file at stub_path if provided.
+        If a cache is given, then the ball detections are read from the cache, or detected and saved to it chunk by chunk, or once
+        the whole video is detected when the Kalman filter carries state across frames (see get_detection_cache()).
 
         Args:
-            frames: list of frames of a video to detect a ball in
+            frames: list or iterable of frames of a video to detect a ball in
             read_from_stub: bool to read ball detections from a pickle file
             stub_path: path to the pickle file to read ball detections from or to save ball detections to in the first run
+            batch_size: number of frames sent to the model in one call, defaults to 1
+            cache (DetectionCache): cache of the detections of the video, defaults to None
 
         Returns:
             list: list of dictionaries containing the track IDs as keys and the bounding boxes of the ball as values for each frame
@@ -50,82 +158,136 @@ class BallTracker:
                 ball_detections = pickle.load(f)
             return ball_detections
 
-        ball_detections = []
-        for frame in frames:
-            ball_dict = self.detect_frame(frame)
-            ball_detections.append(ball_dict)
-        
+        if cache is not None:
+            # the Kalman filter of the search window runs across the whole video, so it is not restarted at each chunk
+            return cache.get_or_detect(frames, lambda cache_frames: self.detect_uncached_frames(cache_frames, batch_size),
+                                       resumable=self.search_window_size is None)
+
+        ball_detections = self.detect_uncached_frames(frames, batch_size)
+
         if stub_path is not None:
             with open(stub_path, 'wb') as f:
                 pickle.dump(ball_detections, f)
 
         return ball_detections
     
+    def get_detection_cache(self, video_path, cache_dir="tracker_stubs/cache", chunk_size=256):
+        """Get the cache of the detections of this model on a video, keyed by the video content, the model weights and the inference parameters.
+
+        Args:
+            video_path (str): path to the video
+            cache_dir (str): directory holding the caches, defaults to "tracker_stubs/cache"
+            chunk_size (int): number of frames stored in one chunk file, defaults to 256
+
+        Returns:
+            DetectionCache: cache to pass to detect_frames()
+        """
+        params = {'tracker': type(self).__name__, **self.inference_params}
+        if self.search_window_size is not None:
+            params.update({'search_window_size': self.search_window_size, 'max_lost_frames': self.max_lost_frames})
+        if self.inference_region is not None:
+            params.update(self.inference_region.get_params())
+        return DetectionCache(cache_dir, video_path, self.model_path, params, chunk_size)
+
     def draw_bboxes(self, frames, ball_detections):
         """Draw bounding boxes around the detected ball in the frames
 
         Args:
-            frames: list of frames of a video
-            ball_detections: list of dictionaries containing the track IDs as keys and the bounding boxes of the ball as values for each frame (output of detect_frames() method)
+            frames: list or iterable of frames of a video
+            ball_detections: DetectionTable or list of dictionaries containing the track IDs as keys and the bounding boxes of the ball as values for each frame (output of detect_frames() method)
 
         Returns:
             frames: list of frames with bounding boxes drawn around the detected ball
         """
         output_frames = []
         for frame, ball_dict in zip(frames, ball_detections):
-            # draw bounding boxes
-            for track_id, bbox in ball_dict.items():
-                x1, y1, x2, y2 = bbox
-                cv2.putText(frame, f"Ball ID: {track_id}", (int(x1),int(y1-10)), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 100, 255), 2)
-                cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 100, 255), 2)
+            frame = self.draw_frame_bboxes(frame, ball_dict)
             output_frames.append(frame)
         return output_frames
+
+    def draw_frame_bboxes(self, frame, ball_dict):
+        """Draw bounding boxes around the detected ball in one frame, in place
+
+        Args:
+            frame: frame of a video
+            ball_dict (dict): dictionary containing the track IDs as keys and the bounding boxes of the ball as values for the frame
+
+        Returns:
+            frame: frame with bounding boxes drawn around the detected ball
+        """
+        for track_id, bbox in ball_dict.items():
+            x1, y1, x2, y2 = bbox
+            cv2.putText(frame, f"Ball ID: {track_id}", (int(x1),int(y1-10)), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 100, 255), 2)
+            cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 100, 255), 2)
+        return frame
     
+    @timed(count_frames=len)
     def interpolate_ball_positions(self, ball_detections):
         """Interpolate the ball positions between the frames using linear interpolation and fill the missing values using backfill for edge cases
 
         Args:
-            ball_detections: list of dictionaries containing the track IDs as keys and the bounding boxes of the ball as values for each frame (output of detect_frames() method)
+            ball_detections: DetectionTable or list of dictionaries containing the track IDs as keys and the bounding boxes of the ball as values for each frame (output of detect_frames() method)
 
         Returns:
-            list: list of dictionaries containing the track IDs as keys and the interpolated bounding boxes of the ball as values for each frame
+            DetectionTable or list (same as ball_detections): the interpolated bounding boxes of the ball for each frame
         """
-        ball_positions = [x.get(1,[]) for x in ball_detections]
-        df_ball_positions = pd.DataFrame(ball_positions, columns=['x1','y1','x2','y2'])
+        import pandas as pd
+        if isinstance(ball_detections, DetectionTable):
+            df_ball_positions = pd.DataFrame(ball_detections.to_dense(1), columns=['x1','y1','x2','y2'])
+        else:
+            ball_positions = [x.get(1,[]) for x in ball_detections]
+            df_ball_positions = pd.DataFrame(ball_positions, columns=['x1','y1','x2','y2'])
         df_ball_positions = df_ball_positions.interpolate(method='linear', axis=0).copy()
         df_ball_positions = df_ball_positions.bfill().copy()
+        if isinstance(ball_detections, DetectionTable):
+            return DetectionTable.from_dense(df_ball_positions.to_numpy())
         ball_positions = [{1:x} for x in df_ball_positions.values.tolist()]
         return ball_positions
     
+    @timed()
     def get_ball_shot_frames(self,ball_positions):
-        ball_positions = [x.get(1,[]) for x in ball_positions]
-        # convert the list into pandas dataframe
-        df_ball_positions = pd.DataFrame(ball_positions,columns=['x1','y1','x2','y2'])
+        """Detect the frames in which the ball is hit. Frame i is a hit when the vertical direction of the ball (the sign of the change
+        of the rolling mean of its mid y) flips between frames i and i+1, and the new direction holds in at least 25 of the next 30 frames.
+        The counts over the next 30 frames are differences of cumulative sums of the direction, so the detection is O(N).
 
-        df_ball_positions['ball_hit'] = 0
+        Args:
+            ball_positions: DetectionTable or list of dictionaries containing the track IDs as keys and the bounding boxes of the ball as values for each frame (output of interpolate_ball_positions() method)
+
+        Returns:
+            list: list of frame numbers in which the ball is hit
+        """
+        import pandas as pd
+        if isinstance(ball_positions, DetectionTable):
+            df_ball_positions = pd.DataFrame(ball_positions.to_dense(1), columns=['x1','y1','x2','y2'])
+        else:
+            ball_positions = [x.get(1,[]) for x in ball_positions]
+            # convert the list into pandas dataframe
+            df_ball_positions = pd.DataFrame(ball_positions,columns=['x1','y1','x2','y2'])
 
         df_ball_positions['mid_y'] = (df_ball_positions['y1'] + df_ball_positions['y2'])/2
         df_ball_positions['mid_y_rolling_mean'] = df_ball_positions['mid_y'].rolling(window=5, min_periods=1, center=False).mean()
         df_ball_positions['delta_y'] = df_ball_positions['mid_y_rolling_mean'].diff()
+        delta_y = df_ball_positions['delta_y'].to_numpy()
+
         minimum_change_frames_for_hit = 25
-        for i in range(1,len(df_ball_positions)- int(minimum_change_frames_for_hit*1.2) ):
-            negative_position_change = df_ball_positions['delta_y'].iloc[i] >0 and df_ball_positions['delta_y'].iloc[i+1] <0
-            positive_position_change = df_ball_positions['delta_y'].iloc[i] <0 and df_ball_positions['delta_y'].iloc[i+1] >0
-
-            if negative_position_change or positive_position_change:
-                change_count = 0 
-                for change_frame in range(i+1, i+int(minimum_change_frames_for_hit*1.2)+1):
-                    negative_position_change_following_frame = df_ball_positions['delta_y'].iloc[i] >0 and df_ball_positions['delta_y'].iloc[change_frame] <0
-                    positive_position_change_following_frame = df_ball_positions['delta_y'].iloc[i] <0 and df_ball_positions['delta_y'].iloc[change_frame] >0
-
-                    if negative_position_change and negative_position_change_following_frame:
-                        change_count+=1
-                    elif positive_position_change and positive_position_change_following_frame:
-                        change_count+=1
-            
-                if change_count>minimum_change_frames_for_hit-1:
-                    df_ball_positions['ball_hit'].iloc[i] = 1
-
-        frame_nums_with_ball_hits = df_ball_positions[df_ball_positions['ball_hit']==1].index.tolist()
-
-        return frame_nums_with_ball_hits
\ No newline at end of file
+        following_frames = int(minimum_change_frames_for_hit*1.2)
+        number_of_frames = len(delta_y)
+        if number_of_frames - following_frames <= 1:
+            return []
+
+        # NaN deltas are neither moving down nor moving up
+        moving_down = delta_y > 0
+        moving_up = delta_y < 0
+        # moving_*_count[i] is the number of frames in [i+1, i+following_frames] with that direction
+        moving_down_cumsum = np.concatenate([[0], np.cumsum(moving_down)])
+        moving_up_cumsum = np.concatenate([[0], np.cumsum(moving_up)])
+        candidates = np.arange(1, number_of_frames - following_frames)
+        moving_down_count = moving_down_cumsum[candidates + following_frames + 1] - moving_down_cumsum[candidates + 1]
+        moving_up_count = moving_up_cumsum[candidates + following_frames + 1] - moving_up_cumsum[candidates + 1]
+
+        negative_position_change = moving_down[candidates] & moving_up[candidates + 1] & (moving_up_count > minimum_change_frames_for_hit-1)
+        positive_position_change = moving_up[candidates] & moving_down[candidates + 1] & (moving_down_count > minimum_change_frames_for_hit-1)
+
+        frame_nums_with_ball_hits = candidates[negative_position_change | positive_position_change].tolist()
+
+        return frame_nums_with_ball_hits
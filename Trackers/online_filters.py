@@ -0,0 +1,129 @@
+from collections import deque
+import math
+
+
+class FixedLagBallInterpolator:
+    """
+    Class to fill the frames without a ball detection as they arrive, waiting at most lag frames. A gap closed by a detection
+    within lag frames is filled by linear interpolation, as interpolate_ball_positions() does offline; frames at the start
+    are filled with the first detection (as the offline backfill). A frame still missing the ball after lag more frames
+    is released with the last detected position, so no frame waits more than lag frames.
+    """
+    def __init__(self, lag=5):
+        """Constructor for FixedLagBallInterpolator class
+
+        Args:
+            lag (int): maximum number of frames a frame waits for the next detection, defaults to 5
+        """
+        self.lag = lag
+        self.pending_frames = deque()
+        self.last_frame_num = None
+        self.last_bbox = None
+
+    def push(self, frame_num, ball_dict):
+        """Add the detection of the next frame
+
+        Args:
+            frame_num (int): index of the frame, frames being pushed in order
+            ball_dict (dict): dictionary containing the bounding box of the ball, empty if it is not detected
+
+        Returns:
+            list: list of (frame_num, ball_dict) of the frames released, in order
+        """
+        bbox = ball_dict.get(1)
+        if bbox is None:
+            self.pending_frames.append(frame_num)
+            released = []
+            while len(self.pending_frames) > self.lag:
+                released.append(self.release(self.pending_frames.popleft()))
+            return released
+
+        released = []
+        while self.pending_frames:
+            pending_frame_num = self.pending_frames.popleft()
+            if self.last_bbox is None:
+                released.append((pending_frame_num, {1: list(bbox)}))
+            else:
+                weight = (pending_frame_num - self.last_frame_num) / (frame_num - self.last_frame_num)
+                released.append((pending_frame_num, {1: [start + (end - start) * weight for start, end in zip(self.last_bbox, bbox)]}))
+        released.append((frame_num, {1: list(bbox)}))
+        self.last_frame_num = frame_num
+        self.last_bbox = list(bbox)
+        return released
+
+    def release(self, frame_num):
+        """Release a frame without waiting for the next detection
+
+        Args:
+            frame_num (int): index of the frame
+
+        Returns:
+            tuple: (frame_num, ball_dict) with the last detected position, or an empty dictionary before the first detection
+        """
+        return (frame_num, {1: list(self.last_bbox)} if self.last_bbox is not None else {})
+
+    def flush(self):
+        """Release all the waiting frames, at the end of the video
+
+        Returns:
+            list: list of (frame_num, ball_dict) of the frames released, in order
+        """
+        released = [self.release(frame_num) for frame_num in self.pending_frames]
+        self.pending_frames.clear()
+        return released
+
+
+class OnlineShotDetector:
+    """
+    Class to detect ball hits frame by frame, with the same rule as BallTracker.get_ball_shot_frames(): frame i is a hit when
+    the vertical direction of the ball (the sign of the change of the rolling mean of its mid y over 5 frames) flips between
+    frames i and i+1, and the new direction holds in at least 25 of the next 30 frames. A hit at frame i is therefore
+    confirmed when frame i+30 arrives, a fixed lag of 30 frames.
+    """
+    def __init__(self, minimum_change_frames_for_hit=25, rolling_window=5):
+        """Constructor for OnlineShotDetector class
+
+        Args:
+            minimum_change_frames_for_hit (int): number of frames the new direction must hold, defaults to 25
+            rolling_window (int): number of frames of the rolling mean of the mid y of the ball, defaults to 5
+        """
+        self.minimum_change_frames_for_hit = minimum_change_frames_for_hit
+        self.following_frames = int(minimum_change_frames_for_hit*1.2)
+        self.mid_y_window = deque(maxlen=rolling_window)
+        self.previous_rolling_mean = math.nan
+        # directions of the last following_frames+1 frames, as (moving_down, moving_up)
+        self.directions = deque(maxlen=self.following_frames + 1)
+        self.number_of_frames = 0
+
+    def push(self, ball_dict):
+        """Add the ball position of the next frame
+
+        Args:
+            ball_dict (dict): dictionary containing the bounding box of the ball, empty if it is unknown
+
+        Returns:
+            int: frame number of the hit confirmed by this frame, None if there is none
+        """
+        bbox = ball_dict.get(1)
+        self.mid_y_window.append((bbox[1] + bbox[3]) / 2 if bbox is not None else math.nan)
+        known_mid_y = [mid_y for mid_y in self.mid_y_window if not math.isnan(mid_y)]
+        rolling_mean = sum(known_mid_y) / len(known_mid_y) if known_mid_y else math.nan
+        delta_y = rolling_mean - self.previous_rolling_mean
+        self.previous_rolling_mean = rolling_mean
+        # NaN deltas are neither moving down nor moving up
+        self.directions.append((delta_y > 0, delta_y < 0))
+        self.number_of_frames += 1
+
+        candidate = self.number_of_frames - 1 - self.following_frames
+        if candidate < 1:
+            return None
+        candidate_down, candidate_up = self.directions[0]
+        next_down, next_up = self.directions[1]
+        following_directions = list(self.directions)[1:]
+        moving_down_count = sum(moving_down for moving_down, _ in following_directions)
+        moving_up_count = sum(moving_up for _, moving_up in following_directions)
+        negative_position_change = candidate_down and next_up and moving_up_count > self.minimum_change_frames_for_hit-1
+        positive_position_change = candidate_up and next_down and moving_down_count > self.minimum_change_frames_for_hit-1
+        if negative_position_change or positive_position_change:
+            return candidate
+        return None
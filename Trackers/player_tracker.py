@@ -1,21 +1,83 @@
-from ultralytics import YOLO
 import cv2
-from typing import Dict
+from typing import Dict, List
 import pickle
 from Utils.bbox_utils import get_center_of_bbox, measure_distance
+from Utils.video_utils import chunk_frames
+from Utils.detection_cache import DetectionCache
+from Utils.detection_table import DetectionTable
+from Utils.instrumentation import timed
+from Utils.model_registry import model_registry, load_yolo_model
+from .strided_detection import StridedDetector
 
 class PlayerTracker:
     """
     Class to detect players in a video using YOLOv8x model
     """
-    def __init__(self, model_path: str):
+    def __init__(self, model_path: str, stride: int = 1, motion_threshold: float = 0.25, inference_region=None):
         """Constructor for PlayerTracker class
 
         Args:
             model_path (str): path to the YOLOv8x model
+            stride (int): run the model on every stride-th frame and interpolate the boxes in between, 1 to run it on every frame, defaults to 1
+            motion_threshold (float): displacement of a player between two detected frames, in player heights, above which the model
+                runs on every frame for a while (see StridedDetector), defaults to 0.25
+            inference_region (InferenceRegion): region of the frame the model runs on, None to run it on the full frame, defaults to None
         """
-        self.model = YOLO(model_path)
+        # the model is loaded when the tracker first runs it, so detections read from a cache do not load it
+        self.model_path = model_path
+        self.inference_params = {'persist': True}
+        self.stride = stride
+        self.motion_threshold = motion_threshold
+        self.inference_region = inference_region
+        self.number_of_detected_frames = 0
 
+    @property
+    def model(self):
+        """YOLO model of the tracker, loaded on first use and shared with the other trackers of the same weights (see ModelRegistry)"""
+        return model_registry.get(('yolo', self.model_path), lambda: load_yolo_model(self.model_path))
+
+    def reset_tracks(self):
+        """Forget the tracks kept by the tracker (persist=True), so that the next frame starts new track IDs from 1.
+        Used when the tracker is reused on frames that do not follow the previous ones, e.g. another segment of the video or another video.
+        """
+        if not model_registry.is_loaded(('yolo', self.model_path)):
+            return
+        predictor = getattr(self.model, 'predictor', None)
+        if predictor is not None and hasattr(predictor, 'trackers'):
+            del predictor.trackers
+
+    def get_track_state(self):
+        """Get the tracks kept by the tracker, to continue them later with set_track_state() after tracking another video.
+        The ID of the next new track is counted by ultralytics on its BaseTrack class, shared by every tracker of the process,
+        so it is saved along with the tracks.
+
+        Returns:
+            tuple: (the trackers of the model, the count of the track IDs given so far), None if there are no tracks
+        """
+        if not model_registry.is_loaded(('yolo', self.model_path)):
+            return None
+        predictor = getattr(self.model, 'predictor', None)
+        trackers = getattr(predictor, 'trackers', None)
+        if trackers is None:
+            return None
+        from ultralytics.trackers.basetrack import BaseTrack
+        return trackers, BaseTrack._count
+
+    def set_track_state(self, track_state):
+        """Restore the tracks returned by get_track_state(), so that the next frame continues them and their track IDs.
+        Used to track several videos with one model, switching the tracks between the batches of each video (see BatchRunner).
+
+        Args:
+            track_state: state returned by get_track_state(), None to start new tracks (and track IDs from 1)
+        """
+        if track_state is None:
+            self.reset_tracks()
+            return
+        from ultralytics.trackers.basetrack import BaseTrack
+        trackers, BaseTrack._count = track_state
+        self.model.predictor.trackers = trackers
+
+    @timed(count_frames=1)
     def detect_frame(self, frame)->Dict:
         """Detect players in a single frame using YOLOv8x model, and return the bounding boxes of the players along with their track IDs
 
@@ -25,8 +87,37 @@ class PlayerTracker:
         Returns:
             dict: dictionary containing the track IDs as keys and the bounding boxes of the players as values
         """
-        results = self.model.track(frame,persist=True)[0] 
+        if self.inference_region is not None:
+            frame = self.inference_region.crop(frame)
+        results = self.model.track(frame,**self.inference_params)[0] 
         # persist=True means that the tracker will remember the object from the previous frame
+        return self.get_player_dict(results)
+
+    @timed(count_frames=len)
+    def detect_batch(self, frames)->List[Dict]:
+        """Detect players in a batch of frames with a single call to the YOLOv8x model. The frames are passed to the tracker in order,
+        so the track IDs persist across batches exactly as they do with detect_frame()
+
+        Args:
+            frames: list of consecutive frames of a video to detect players in
+
+        Returns:
+            list: list of dictionaries containing the track IDs as keys and the bounding boxes of the players as values, one per frame
+        """
+        if self.inference_region is not None:
+            frames = [self.inference_region.crop(frame) for frame in frames]
+        results = self.model.track(frames,**self.inference_params)
+        return [self.get_player_dict(result) for result in results]
+
+    def get_player_dict(self, results)->Dict:
+        """Convert the YOLO results of one frame to a dictionary of player bounding boxes, in full-frame coordinates
+
+        Args:
+            results: YOLO results of a single frame
+
+        Returns:
+            dict: dictionary containing the track IDs as keys and the bounding boxes of the players as values
+        """
         id_name_dict = results.names
         player_dict = {}
         for box in results.boxes:
@@ -36,17 +127,53 @@ class PlayerTracker:
             object_cls_name = id_name_dict[object_cls_id]
             if object_cls_name == "person":
                 player_dict[track_id] = result
+        if self.inference_region is not None:
+            player_dict = self.inference_region.to_frame_detections(player_dict)
         return player_dict
     
-    def detect_frames(self, frames, read_from_stub=False, stub_path=None):
-        """Detect players in multiple frames using YOLOv8x model. Calls detect_frame() for each frame.
+    def detect_uncached_frames(self, frames, batch_size=1):
+        """Detect players in multiple frames with the model, for detect_frames(). Not timed itself, so that the frames and the
+        time of detect_frames() are counted once whether or not the detections go through the cache.
+
+        Args:
+            frames: list or iterable of frames of a video
+            batch_size: number of frames sent to the model in one call, defaults to 1
+
+        Returns:
+            list: list of dictionaries containing the track IDs as keys and the bounding boxes as values for each frame
+        """
+        player_detections = []
+        if self.stride > 1:
+            strided_detector = StridedDetector(self.detect_frame, self.stride, self.motion_threshold)
+            player_detections = strided_detector.detect_frames(frames)
+            self.number_of_detected_frames += strided_detector.number_of_detected_frames
+        elif batch_size > 1:
+            for batch in chunk_frames(frames, batch_size):
+                player_detections.extend(self.detect_batch(batch))
+            self.number_of_detected_frames += len(player_detections)
+        else:
+            for frame in frames:
+                player_dict = self.detect_frame(frame)
+                player_detections.append(player_dict)
+            self.number_of_detected_frames += len(player_detections)
+        return player_detections
+
+    @timed(count_frames=len)
+    def detect_frames(self, frames, read_from_stub=False, stub_path=None, batch_size=1, cache=None):
+        """Detect players in multiple frames using YOLOv8x model. Calls detect_frame() for each frame, or detect_batch() for
+        every batch_size frames when batch_size is greater than 1.
+        When the tracker stride is greater than 1, detect_frame() is called on every stride-th frame only and the other frames
+        are interpolated (see StridedDetector), and batch_size is not used.
         If read_from_stub is True, then the player detections are read from a pickle file at stub_path.
         If running for the first time, then the player detections are saved to the pickle file at stub_path if provided.
+        If a cache is given, then the player detections are read from the cache, or detected and saved to it (see get_detection_cache()).
 
         Args:
-            frames: list of frames of a video to detect players in
+            frames: list or iterable of frames of a video to detect players in
             read_from_stub: bool to read player detections from a pickle file
             stub_path: path to the pickle file to read player detections from or to save player detections to in the first run
+            batch_size: number of frames sent to the model in one call, defaults to 1
+            cache (DetectionCache): cache of the detections of the video, defaults to None
 
         Returns:
             list: list of dictionaries containing the track IDs as keys and the bounding boxes of the players as values for each frame
@@ -56,36 +183,68 @@ class PlayerTracker:
                 player_detections = pickle.load(f)
             return player_detections
 
-        player_detections = []
-        for frame in frames:
-            player_dict = self.detect_frame(frame)
-            player_detections.append(player_dict)
-        
+        if cache is not None:
+            # the tracks and the stride state run across the whole video, so the video is detected in one call and a partial cache is not resumed
+            return cache.get_or_detect(frames, lambda all_frames: self.detect_uncached_frames(all_frames, batch_size), resumable=False)
+
+        player_detections = self.detect_uncached_frames(frames, batch_size)
+
         if stub_path is not None:
             with open(stub_path, 'wb') as f:
                 pickle.dump(player_detections, f)
 
         return player_detections
     
+    def get_detection_cache(self, video_path, cache_dir="tracker_stubs/cache", chunk_size=256):
+        """Get the cache of the detections of this model on a video, keyed by the video content, the model weights and the inference parameters.
+        The detections are saved once the whole video is tracked, so that the track IDs are consistent across the video.
+
+        Args:
+            video_path (str): path to the video
+            cache_dir (str): directory holding the caches, defaults to "tracker_stubs/cache"
+            chunk_size (int): number of frames stored in one chunk file, defaults to 256
+
+        Returns:
+            DetectionCache: cache to pass to detect_frames()
+        """
+        params = {'tracker': type(self).__name__, **self.inference_params}
+        if self.stride > 1:
+            params.update({'stride': self.stride, 'motion_threshold': self.motion_threshold})
+        if self.inference_region is not None:
+            params.update(self.inference_region.get_params())
+        return DetectionCache(cache_dir, video_path, self.model_path, params, chunk_size)
+
     def draw_bboxes(self, frames, player_detections):
         """Draw bounding boxes around the detected players in the frames
 
         Args:
-            frames: list of frames of a video
-            player_detections: list of dictionaries containing the track IDs as keys and the bounding boxes of the players as values for each frame (output of detect_frames() method)
+            frames: list or iterable of frames of a video
+            player_detections: DetectionTable or list of dictionaries containing the track IDs as keys and the bounding boxes of the players as values for each frame (output of detect_frames() method)
 
         Returns:
             frames: list of frames with bounding boxes drawn around the detected players
         """
         output_frames = []
         for frame, player_dict in zip(frames, player_detections):
-            # draw bounding boxes
-            for track_id, bbox in player_dict.items():
-                x1, y1, x2, y2 = bbox
-                cv2.putText(frame, f"Player ID: {track_id}", (int(x1),int(y1-10)), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 255), 2)
-                cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 0, 255), 2)
+            frame = self.draw_frame_bboxes(frame, player_dict)
             output_frames.append(frame)
         return output_frames
+
+    def draw_frame_bboxes(self, frame, player_dict):
+        """Draw bounding boxes around the detected players in one frame, in place
+
+        Args:
+            frame: frame of a video
+            player_dict (dict): dictionary containing the track IDs as keys and the bounding boxes of the players as values for the frame
+
+        Returns:
+            frame: frame with bounding boxes drawn around the detected players
+        """
+        for track_id, bbox in player_dict.items():
+            x1, y1, x2, y2 = bbox
+            cv2.putText(frame, f"Player ID: {track_id}", (int(x1),int(y1-10)), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 255), 2)
+            cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 0, 255), 2)
+        return frame
     
     def choose_players(self, court_keypoints, player_detections_dict):
         """Choose the two players closest to the court keypoints
@@ -112,18 +271,21 @@ class PlayerTracker:
         return chosen_players
             
 
+    @timed()
     def choose_and_filter_players(self, court_keypoints, player_detections):
         """Choose the two players closest to the court keypoints and filter the player detections to only include the chosen players. Calls choose_players() for the first frame's player detections.
 
         Args:
             court_keypoints: list of keypoints of the court
-            player_detections: list of dictionaries containing the track IDs as keys and the bounding boxes of the players as values for each frame
+            player_detections: DetectionTable or list of dictionaries containing the track IDs as keys and the bounding boxes of the players as values for each frame
 
         Returns:
-            list: list of dictionaries containing the track IDs as keys and the bounding boxes of the chosen players as values for each frame
+            DetectionTable or list (same as player_detections): the bounding boxes of the chosen players for each frame
         """
         player_detections_first_frame = player_detections[0]
         chosen_players = self.choose_players(court_keypoints, player_detections_first_frame)
+        if isinstance(player_detections, DetectionTable):
+            return player_detections.filter_tracks(chosen_players)
         filtered_player_detections = []
         for player_dict in player_detections:
             filtered_player_dict = {track_id: bbox for track_id, bbox in player_dict.items() if track_id in chosen_players}
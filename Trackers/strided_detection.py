@@ -0,0 +1,119 @@
+from typing import Dict, List
+from Utils.bbox_utils import get_center_of_bbox, get_height_of_bbox
+
+
+class StridedDetector:
+    """
+    Class to run a detector on every stride-th frame (the keyframes) and fill the frames in between by linearly interpolating
+    the bounding box of each track between the two keyframes around them, as interpolate_ball_positions() does for the ball.
+    When a track moves more than motion_threshold between two keyframes, the frames between them are detected instead of
+    interpolated, and the detector runs on every frame for the next dense_frames frames, since linear interpolation is only
+    accurate for slow, smooth motion.
+    Keyframes are detected in the order of the video, so a tracker keeping state across calls (persist=True) sees the frames in
+    order, except after large motion: the skipped frames are then detected after the keyframe that revealed the motion, and the
+    keyframe is detected once more after them.
+    """
+    def __init__(self, detect_frame, stride=4, motion_threshold=0.25, dense_frames=None):
+        """Constructor for StridedDetector class
+
+        Args:
+            detect_frame: function returning the dictionary of track IDs and bounding boxes of one frame
+            stride (int): number of frames between two keyframes, defaults to 4
+            motion_threshold (float): largest displacement of a box center between two keyframes, in heights of the box,
+                above which detection runs on every frame, defaults to 0.25
+            dense_frames (int): number of frames detected one by one after large motion, defaults to 4 * stride
+        """
+        self.detect_frame = detect_frame
+        self.stride = stride
+        self.motion_threshold = motion_threshold
+        self.dense_frames = dense_frames if dense_frames is not None else 4 * stride
+        self.number_of_frames = 0
+        self.number_of_detected_frames = 0
+
+    def get_motion(self, start_dict, end_dict)->float:
+        """Get the largest displacement of a track between two keyframes, relative to the height of its box
+
+        Args:
+            start_dict (dict): detections of the first keyframe
+            end_dict (dict): detections of the second keyframe
+
+        Returns:
+            float: largest displacement of the center of a box over its mean height, 0 if no track is in both keyframes
+        """
+        motion = 0.0
+        for track_id in start_dict.keys() & end_dict.keys():
+            start_x, start_y = get_center_of_bbox(start_dict[track_id])
+            end_x, end_y = get_center_of_bbox(end_dict[track_id])
+            height = (get_height_of_bbox(start_dict[track_id]) + get_height_of_bbox(end_dict[track_id])) / 2
+            if height > 0:
+                motion = max(motion, ((end_x - start_x)**2 + (end_y - start_y)**2)**0.5 / height)
+        return motion
+
+    def interpolate(self, start_dict, end_dict, number_of_frames)->List[Dict]:
+        """Interpolate the boxes of the frames between two keyframes. A track is filled in only if it is in both keyframes.
+
+        Args:
+            start_dict (dict): detections of the first keyframe
+            end_dict (dict): detections of the second keyframe
+            number_of_frames (int): number of frames strictly between the two keyframes
+
+        Returns:
+            list: list of dictionaries containing the track IDs as keys and the interpolated bounding boxes as values, one per frame
+        """
+        track_ids = [track_id for track_id in start_dict if track_id in end_dict]
+        interpolated_detections = []
+        for step in range(1, number_of_frames + 1):
+            weight = step / (number_of_frames + 1)
+            interpolated_detections.append({
+                track_id: [start + (end - start) * weight for start, end in zip(start_dict[track_id], end_dict[track_id])]
+                for track_id in track_ids
+            })
+        return interpolated_detections
+
+    def detect_frames(self, frames)->List[Dict]:
+        """Detect objects in the keyframes and interpolate the other frames
+
+        Args:
+            frames: list or iterable of frames of a video
+
+        Returns:
+            list: list of dictionaries containing the track IDs as keys and the bounding boxes as values for each frame
+        """
+        detections = []
+        skipped_frames = []
+        last_keyframe_dict = None
+        dense_frames_left = 0
+
+        for frame in frames:
+            self.number_of_frames += 1
+            if last_keyframe_dict is not None and dense_frames_left == 0 and len(skipped_frames) < self.stride - 1:
+                skipped_frames.append(frame)
+                continue
+
+            frame_dict = self.detect_frame(frame)
+            self.number_of_detected_frames += 1
+            if skipped_frames:
+                if self.get_motion(last_keyframe_dict, frame_dict) > self.motion_threshold:
+                    # the skipped frames are still held, so they are detected instead of interpolated, followed by the
+                    # keyframe again for a tracker keeping state to end on the frames in order
+                    for skipped_frame in skipped_frames:
+                        detections.append(self.detect_frame(skipped_frame))
+                    frame_dict = self.detect_frame(frame)
+                    self.number_of_detected_frames += len(skipped_frames) + 1
+                    dense_frames_left = self.dense_frames
+                else:
+                    detections.extend(self.interpolate(last_keyframe_dict, frame_dict, len(skipped_frames)))
+                skipped_frames = []
+            elif dense_frames_left > 0:
+                dense_frames_left -= 1
+            detections.append(frame_dict)
+            last_keyframe_dict = frame_dict
+
+        # the last frame of the video is always detected, so that no frame is extrapolated
+        if skipped_frames:
+            frame_dict = self.detect_frame(skipped_frames[-1])
+            self.number_of_detected_frames += 1
+            detections.extend(self.interpolate(last_keyframe_dict, frame_dict, len(skipped_frames) - 1))
+            detections.append(frame_dict)
+
+        return detections
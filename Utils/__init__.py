@@ -1,4 +1,12 @@
-from .video_utils import read_video, save_video
-from .bbox_utils import get_center_of_bbox, measure_distance, get_foot_position, get_closest_keypoint_index, get_height_of_bbox, measure_xy_distance, get_center_of_bbox
+from .video_utils import read_video, save_video, iter_video_frames, chunk_frames, read_video_chunks, read_first_frame, get_video_frame_count
+from .video_writers import get_video_fps, get_video_writer, OpenCVVideoWriter, FFmpegVideoWriter
+from .detection_cache import DetectionCache, hash_file
+from .detection_table import DetectionTable, to_detection_table
+from .keypoint_segments import CourtKeypointSegments
+from .inference_region import InferenceRegion
+from .bbox_utils import get_center_of_bbox, measure_distance, get_foot_position, get_closest_keypoint_index, get_height_of_bbox, measure_xy_distance, get_center_of_bbox, get_iou
 from .conversions import convert_pixel_distance_to_meters, convert_meters_to_pixel_distance
-from .player_stats_drawer import draw_player_stats
\ No newline at end of file
+from .match_stats import MatchStatsAccumulator
+from .player_stats_drawer import draw_player_stats, get_player_stats_values, PlayerStatsPanel, PLAYER_STATS_COLUMNS
+from .instrumentation import TimerRegistry, timer_registry, timer, timed
+from .model_registry import ModelRegistry, model_registry, load_yolo_model
\ No newline at end of file
@@ -91,4 +91,20 @@ def get_center_of_bbox(bbox):
     Returns:
         tuple: tuple containing the coordinates of the center of the bounding box in the format (x_center, y_center)
     """
-    return (int((bbox[0]+bbox[2])/2),int((bbox[1]+bbox[3])/2))
\ No newline at end of file
+    return (int((bbox[0]+bbox[2])/2),int((bbox[1]+bbox[3])/2))
+
+def get_iou(bbox_a, bbox_b):
+    """Get the intersection over union of two bounding boxes
+
+    Args:
+        bbox_a (list): list containing the coordinates of the first bounding box in the format [x1, y1, x2, y2]
+        bbox_b (list): list containing the coordinates of the second bounding box in the format [x1, y1, x2, y2]
+
+    Returns:
+        float: area of the intersection over area of the union of the two bounding boxes, 0 if the union is empty
+    """
+    width = max(0.0, min(bbox_a[2], bbox_b[2]) - max(bbox_a[0], bbox_b[0]))
+    height = max(0.0, min(bbox_a[3], bbox_b[3]) - max(bbox_a[1], bbox_b[1]))
+    intersection = width * height
+    union = (bbox_a[2] - bbox_a[0]) * (bbox_a[3] - bbox_a[1]) + (bbox_b[2] - bbox_b[0]) * (bbox_b[3] - bbox_b[1]) - intersection
+    return intersection / union if union > 0 else 0.0
\ No newline at end of file
@@ -0,0 +1,197 @@
+import hashlib
+import json
+import os
+import pickle
+from functools import lru_cache
+from Utils.video_utils import chunk_frames
+
+
+@lru_cache(maxsize=None)
+def _hash_file_cached(path, size, modified_time):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+def hash_file(path):
+    """Get the SHA-256 of the content of a file. The hash is computed once per process for a given size and modification time.
+
+    Args:
+        path: path to the file
+
+    Returns:
+        str: hex digest of the content of the file
+    """
+    stat = os.stat(path)
+    return _hash_file_cached(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
+class DetectionCache:
+    """
+    Class to cache per-frame detections on disk. The cache is keyed by a hash of the video content, the model weights and the
+    inference parameters, so changing any of them invalidates the cache automatically. Detections are stored as one pickle
+    per chunk of frames, so an interrupted run of per-frame detections resumes from the last saved chunk and a reader loads
+    only the chunks it needs.
+    """
+    def __init__(self, cache_dir, video_path, model_path, params, chunk_size=256):
+        """Constructor for DetectionCache class
+
+        Args:
+            cache_dir (str): directory holding the caches of all videos and models
+            video_path (str): path to the video the detections belong to
+            model_path (str): path to the model weights used for the detections
+            params (dict): inference parameters that change the detections, e.g. {'conf': 0.15}
+            chunk_size (int): number of frames stored in one chunk file
+        """
+        self.chunk_size = chunk_size
+        self.metadata = {
+            'video_sha256': hash_file(video_path),
+            'model_sha256': hash_file(model_path),
+            'params': params,
+            'chunk_size': chunk_size,
+        }
+        key = hashlib.sha256(json.dumps(self.metadata, sort_keys=True).encode()).hexdigest()
+        self.directory = os.path.join(cache_dir, key)
+
+    def chunk_path(self, chunk_index):
+        """Path of the file holding the detections of a chunk"""
+        return os.path.join(self.directory, f"chunk_{chunk_index:06d}.pkl")
+
+    def metadata_path(self):
+        """Path of the file recording the key of the cache and, once complete, the number of frames"""
+        return os.path.join(self.directory, "metadata.json")
+
+    def has_chunk(self, chunk_index):
+        """Check if the detections of a chunk are saved
+
+        Args:
+            chunk_index (int): index of the chunk, the chunk holds frames [chunk_index*chunk_size, (chunk_index+1)*chunk_size)
+
+        Returns:
+            bool: True if the chunk is saved
+        """
+        return os.path.exists(self.chunk_path(chunk_index))
+
+    def load_chunk(self, chunk_index):
+        """Load the detections of a chunk
+
+        Args:
+            chunk_index (int): index of the chunk
+
+        Returns:
+            list: list of per-frame detection dictionaries of the chunk
+        """
+        with open(self.chunk_path(chunk_index), 'rb') as f:
+            return pickle.load(f)
+
+    def save_chunk(self, chunk_index, detections):
+        """Save the detections of a chunk. The file is written under a temporary name and renamed, so an interrupted
+        run never leaves a partial chunk behind.
+
+        Args:
+            chunk_index (int): index of the chunk
+            detections (list): list of per-frame detection dictionaries of the chunk
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.chunk_path(chunk_index)
+        with open(path + ".tmp", 'wb') as f:
+            pickle.dump(detections, f)
+        os.replace(path + ".tmp", path)
+
+    def get_number_of_frames(self):
+        """Get the number of frames of a complete cache
+
+        Returns:
+            int: number of frames, None if the cache is not complete
+        """
+        if not os.path.exists(self.metadata_path()):
+            return None
+        with open(self.metadata_path()) as f:
+            return json.load(f).get('number_of_frames')
+
+    def is_complete(self):
+        """Check if the detections of every frame of the video are saved"""
+        return self.get_number_of_frames() is not None
+
+    def mark_complete(self, number_of_frames):
+        """Record that the detections of every frame of the video are saved
+
+        Args:
+            number_of_frames (int): number of frames of the video
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.metadata_path(), 'w') as f:
+            json.dump({**self.metadata, 'number_of_frames': number_of_frames}, f, indent=2)
+
+    def load_range(self, start_frame, end_frame):
+        """Load the detections of frames [start_frame, end_frame), reading only the chunks covering the range
+
+        Args:
+            start_frame (int): first frame to load
+            end_frame (int): frame after the last frame to load
+
+        Returns:
+            list: list of per-frame detection dictionaries
+        """
+        detections = []
+        first_chunk = start_frame // self.chunk_size
+        last_chunk = (end_frame - 1) // self.chunk_size
+        for chunk_index in range(first_chunk, last_chunk + 1):
+            detections.extend(self.load_chunk(chunk_index))
+        offset = first_chunk * self.chunk_size
+        return detections[start_frame - offset:end_frame - offset]
+
+    def load_all(self):
+        """Load the detections of every frame of a complete cache
+
+        Returns:
+            list: list of per-frame detection dictionaries
+        """
+        return self.load_range(0, self.get_number_of_frames())
+
+    def save_all(self, detections):
+        """Save the detections of every frame of the video, chunk by chunk, and mark the cache complete
+
+        Args:
+            detections (list): list of per-frame detection dictionaries of the video
+        """
+        for chunk_index, chunk_detections in enumerate(chunk_frames(detections, self.chunk_size)):
+            self.save_chunk(chunk_index, chunk_detections)
+        self.mark_complete(len(detections))
+
+    def get_or_detect(self, frames, detect_chunk, resumable=True):
+        """Get the detections of every frame, running detect_chunk only on the chunks that are not saved yet.
+        Each chunk is saved as soon as it is detected, so an interrupted run resumes from where it stopped.
+        Detections that depend on the previous frames (tracks, strided or Kalman-filtered detections) must not restart at a
+        chunk boundary: with resumable=False, detect_chunk is called once on all the frames, a partially saved cache being
+        detected again whole, and the detections are saved once they are all detected.
+
+        Args:
+            frames: list or iterable of frames of the video
+            detect_chunk: function returning the list of per-frame detection dictionaries of a list of frames, or with
+                resumable=False of all the frames
+            resumable (bool): detect and save the frames chunk by chunk, resuming from the saved chunks, defaults to True
+
+        Returns:
+            list: list of per-frame detection dictionaries
+        """
+        if self.is_complete():
+            return self.load_all()
+
+        if not resumable:
+            detections = detect_chunk(frames)
+            self.save_all(detections)
+            return detections
+
+        detections = []
+        for chunk_index, chunk in enumerate(chunk_frames(frames, self.chunk_size)):
+            if self.has_chunk(chunk_index):
+                detections.extend(self.load_chunk(chunk_index))
+                continue
+            chunk_detections = detect_chunk(chunk)
+            self.save_chunk(chunk_index, chunk_detections)
+            detections.extend(chunk_detections)
+
+        self.mark_complete(len(detections))
+        return detections
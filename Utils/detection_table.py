@@ -0,0 +1,235 @@
+import numpy as np
+
+DETECTION_DTYPE = np.dtype([
+    ('frame_idx', np.int64),
+    ('track_id', np.int64),
+    ('x1', np.float64),
+    ('y1', np.float64),
+    ('x2', np.float64),
+    ('y2', np.float64),
+    ('conf', np.float64),
+])
+
+# track ID of the last row of a saved .npy table, whose frame_idx holds the number of frames of the table
+NUMBER_OF_FRAMES_TRACK_ID = -1
+
+
+class DetectionTable:
+    """
+    Class to hold the detections of a video in one array with the columns frame_idx, track_id, x1, y1, x2, y2 and conf.
+    The rows are sorted by frame, so the detections of a frame are a contiguous slice of the array, found in O(1).
+    The table also behaves like the list of {track_id: [x1, y1, x2, y2]} dictionaries used across the code:
+    table[i] is the dictionary of frame i, table[a:b] is the table of frames a to b and iterating yields one dictionary per frame.
+    """
+    def __init__(self, data, number_of_frames=None):
+        """Constructor for DetectionTable class
+
+        Args:
+            data: structured array with dtype DETECTION_DTYPE, sorted by frame_idx
+            number_of_frames (int): number of frames of the video, defaults to the last frame with a detection + 1
+        """
+        self.data = data
+        if number_of_frames is None:
+            number_of_frames = int(data['frame_idx'][-1]) + 1 if len(data) else 0
+        self.number_of_frames = number_of_frames
+        self.frame_offsets = np.searchsorted(data['frame_idx'], np.arange(number_of_frames + 1), side='left')
+
+    @classmethod
+    def from_dicts(cls, detections, confidences=None):
+        """Build a table from a list of per-frame detection dictionaries
+
+        Args:
+            detections: list of dictionaries containing the track IDs as keys and the bounding boxes as values for each frame
+            confidences: list of dictionaries containing the track IDs as keys and the confidences as values for each frame,
+                defaults to None (confidences are stored as NaN)
+
+        Returns:
+            DetectionTable: table of the detections
+        """
+        rows = []
+        for frame_idx, frame_dict in enumerate(detections):
+            frame_confidences = confidences[frame_idx] if confidences is not None else {}
+            for track_id, bbox in frame_dict.items():
+                rows.append((frame_idx, track_id, *bbox[:4], frame_confidences.get(track_id, np.nan)))
+        return cls(np.array(rows, dtype=DETECTION_DTYPE), len(detections))
+
+    @classmethod
+    def from_arrays(cls, frame_idx, track_id, boxes, conf=None, number_of_frames=None):
+        """Build a table from column arrays
+
+        Args:
+            frame_idx: array of the frame index of each detection
+            track_id: array of the track ID of each detection
+            boxes: array of shape (N, 4) with the x1, y1, x2, y2 of each detection
+            conf: array of the confidence of each detection, defaults to None (stored as NaN)
+            number_of_frames (int): number of frames of the video
+
+        Returns:
+            DetectionTable: table of the detections
+        """
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        data = np.empty(len(boxes), dtype=DETECTION_DTYPE)
+        data['frame_idx'] = frame_idx
+        data['track_id'] = track_id
+        data['x1'], data['y1'], data['x2'], data['y2'] = boxes.T
+        data['conf'] = np.nan if conf is None else conf
+        order = np.argsort(data['frame_idx'], kind='stable')
+        return cls(data[order], number_of_frames)
+
+    @classmethod
+    def from_dense(cls, boxes, track_id=1):
+        """Build a table of one track from an array with one box per frame
+
+        Args:
+            boxes: array of shape (number_of_frames, 4), rows with NaN are frames without a detection
+            track_id (int): track ID of the boxes, defaults to 1
+
+        Returns:
+            DetectionTable: table of the detections
+        """
+        boxes = np.asarray(boxes, dtype=np.float64)
+        frame_idx = np.flatnonzero(~np.isnan(boxes).any(axis=1))
+        return cls.from_arrays(frame_idx, track_id, boxes[frame_idx], number_of_frames=len(boxes))
+
+    def __len__(self):
+        return self.number_of_frames
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.number_of_frames)
+            if step != 1:
+                raise ValueError("DetectionTable only supports contiguous slices")
+            stop = max(start, stop)
+            rows = self.data[self.frame_offsets[start]:self.frame_offsets[stop]].copy()
+            rows['frame_idx'] -= start
+            return DetectionTable(rows, stop - start)
+        if index < 0:
+            index += self.number_of_frames
+        if not 0 <= index < self.number_of_frames:
+            raise IndexError("frame index out of range")
+        return {track_id: [x1, y1, x2, y2] for _, track_id, x1, y1, x2, y2, _ in self.frame(index).tolist()}
+
+    def __iter__(self):
+        for frame_idx in range(self.number_of_frames):
+            yield self[frame_idx]
+
+    def frame(self, frame_idx):
+        """Get the rows of a frame
+
+        Args:
+            frame_idx (int): index of the frame
+
+        Returns:
+            structured array view of the detections of the frame
+        """
+        return self.data[self.frame_offsets[frame_idx]:self.frame_offsets[frame_idx + 1]]
+
+    def track(self, track_id):
+        """Get the rows of a track
+
+        Args:
+            track_id (int): track ID
+
+        Returns:
+            structured array of the detections of the track, sorted by frame
+        """
+        return self.data[self.data['track_id'] == track_id]
+
+    def track_ids(self):
+        """Get the track IDs present in the table
+
+        Returns:
+            array of the sorted unique track IDs
+        """
+        return np.unique(self.data['track_id'])
+
+    def boxes(self):
+        """Get the boxes of every row
+
+        Returns:
+            array of shape (N, 4) with the x1, y1, x2, y2 of each detection
+        """
+        return np.stack([self.data['x1'], self.data['y1'], self.data['x2'], self.data['y2']], axis=1)
+
+    def to_dense(self, track_id):
+        """Get the boxes of a track with one row per frame
+
+        Args:
+            track_id (int): track ID
+
+        Returns:
+            array of shape (number_of_frames, 4) with the x1, y1, x2, y2 of the track in each frame, NaN where it is not detected
+        """
+        dense = np.full((self.number_of_frames, 4), np.nan)
+        rows = self.track(track_id)
+        dense[rows['frame_idx']] = np.stack([rows['x1'], rows['y1'], rows['x2'], rows['y2']], axis=1)
+        return dense
+
+    def filter_tracks(self, track_ids):
+        """Keep only the detections of some tracks
+
+        Args:
+            track_ids: track IDs to keep
+
+        Returns:
+            DetectionTable: table with the detections of the given tracks
+        """
+        mask = np.isin(self.data['track_id'], list(track_ids))
+        return DetectionTable(self.data[mask], self.number_of_frames)
+
+    def to_dicts(self):
+        """Convert the table to a list of per-frame detection dictionaries
+
+        Returns:
+            list: list of dictionaries containing the track IDs as keys and the bounding boxes as values for each frame
+        """
+        return list(self)
+
+    def save(self, path):
+        """Save the table. A .npz file holds the rows and the number of frames. A .npy file holds the rows followed by
+        one row with track_id NUMBER_OF_FRAMES_TRACK_ID whose frame_idx is the number of frames, so it can be memory-mapped by load().
+
+        Args:
+            path (str): path of the .npy or .npz file
+        """
+        if path.endswith('.npz'):
+            np.savez(path, detections=self.data, number_of_frames=np.int64(self.number_of_frames))
+            return
+        footer = np.zeros(1, dtype=DETECTION_DTYPE)
+        footer['frame_idx'] = self.number_of_frames
+        footer['track_id'] = NUMBER_OF_FRAMES_TRACK_ID
+        np.save(path, np.concatenate([np.asarray(self.data, dtype=DETECTION_DTYPE), footer]))
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load a table saved with save(). A .npy file is memory-mapped unless mmap is False, so only the pages
+        of the frames that are read are loaded from disk.
+
+        Args:
+            path (str): path of the .npy or .npz file
+            mmap (bool): memory-map a .npy file, defaults to True
+
+        Returns:
+            DetectionTable: the loaded table
+        """
+        if path.endswith('.npz'):
+            with np.load(path) as archive:
+                return cls(archive['detections'], int(archive['number_of_frames']))
+        data = np.load(path, mmap_mode='r' if mmap else None)
+        if len(data) and data['track_id'][-1] == NUMBER_OF_FRAMES_TRACK_ID:
+            return cls(data[:-1], int(data['frame_idx'][-1]))
+        return cls(data)
+
+
+def to_detection_table(detections):
+    """Get detections as a DetectionTable
+
+    Args:
+        detections: DetectionTable or list of per-frame detection dictionaries
+
+    Returns:
+        DetectionTable: the detections as a table
+    """
+    if isinstance(detections, DetectionTable):
+        return detections
+    return DetectionTable.from_dicts(detections)
@@ -0,0 +1,103 @@
+import cv2
+import numpy as np
+
+
+class InferenceRegion:
+    """
+    Class to restrict detection to the region of the frame around the court. Frames are cropped to a padded bounding box of the
+    court keypoints and optionally downscaled before they are passed to a model, and the detected boxes are mapped back
+    to full-frame coordinates. The crop is a view of the frame, so without downscaling it costs no copy.
+    """
+    def __init__(self, x1, y1, x2, y2, scale=1.0):
+        """Constructor for InferenceRegion class
+
+        Args:
+            x1 (int): left of the region in the frame
+            y1 (int): top of the region in the frame
+            x2 (int): right of the region in the frame (exclusive)
+            y2 (int): bottom of the region in the frame (exclusive)
+            scale (float): factor applied to the cropped region before detection, 1 to keep the full resolution, defaults to 1
+        """
+        self.x1 = x1
+        self.y1 = y1
+        self.x2 = x2
+        self.y2 = y2
+        self.scale = scale
+
+    @classmethod
+    def from_keypoints(cls, keypoints, frame_shape, padding=0.2, max_size=None):
+        """Build the region from the court keypoints
+
+        Args:
+            keypoints: flat list of the 14 court keypoints [x0, y0, x1, y1, ...]
+            frame_shape: shape of the frames
+            padding (float): margin added on every side of the bounding box of the keypoints, as a fraction of its width and height,
+                so that the far player (whose body is above the baseline) and the ball close to the court are kept, defaults to 0.2
+            max_size (int): largest side of the region after downscaling, None to keep the full resolution, defaults to None
+
+        Returns:
+            InferenceRegion: region of the frame around the court
+        """
+        frame_height, frame_width = frame_shape[:2]
+        keypoints = np.asarray(keypoints, dtype=np.float64).reshape(-1, 2)
+        min_x, min_y = keypoints.min(axis=0)
+        max_x, max_y = keypoints.max(axis=0)
+        padding_x = (max_x - min_x) * padding
+        padding_y = (max_y - min_y) * padding
+        x1 = int(max(min_x - padding_x, 0))
+        y1 = int(max(min_y - padding_y, 0))
+        x2 = int(min(np.ceil(max_x + padding_x), frame_width))
+        y2 = int(min(np.ceil(max_y + padding_y), frame_height))
+        if x2 <= x1 or y2 <= y1:
+            raise ValueError("The court keypoints are outside of the frame")
+
+        scale = 1.0
+        if max_size is not None and max(x2 - x1, y2 - y1) > max_size:
+            scale = max_size / max(x2 - x1, y2 - y1)
+        return cls(x1, y1, x2, y2, scale)
+
+    def crop(self, frame):
+        """Crop a frame to the region, and downscale it if the region has a scale
+
+        Args:
+            frame: full frame
+
+        Returns:
+            image of the region, a view of the frame when the scale is 1
+        """
+        region = frame[self.y1:self.y2, self.x1:self.x2]
+        if self.scale == 1.0:
+            return region
+        size = (max(int(round(region.shape[1] * self.scale)), 1), max(int(round(region.shape[0] * self.scale)), 1))
+        return cv2.resize(region, size, interpolation=cv2.INTER_AREA)
+
+    def to_frame_bbox(self, bbox):
+        """Map a bounding box detected in the cropped region back to the full frame
+
+        Args:
+            bbox: [x1, y1, x2, y2] in the cropped region
+
+        Returns:
+            list: [x1, y1, x2, y2] in the full frame
+        """
+        x1, y1, x2, y2 = bbox
+        return [x1 / self.scale + self.x1, y1 / self.scale + self.y1, x2 / self.scale + self.x1, y2 / self.scale + self.y1]
+
+    def to_frame_detections(self, detections_dict):
+        """Map the detections of one frame back to the full frame
+
+        Args:
+            detections_dict (dict): dictionary containing the track IDs as keys and the bounding boxes in the cropped region as values
+
+        Returns:
+            dict: dictionary containing the track IDs as keys and the bounding boxes in the full frame as values
+        """
+        return {track_id: self.to_frame_bbox(bbox) for track_id, bbox in detections_dict.items()}
+
+    def get_params(self):
+        """Get the parameters of the region, used to key the detection cache
+
+        Returns:
+            dict: bounds and scale of the region
+        """
+        return {'region': [self.x1, self.y1, self.x2, self.y2], 'region_scale': self.scale}
@@ -0,0 +1,240 @@
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+import numpy as np
+
+# upper bounds in milliseconds of the buckets of the latency histograms, in a 1-2-5 sequence; the last bucket holds the rest
+HISTOGRAM_BUCKETS_MS = [base * 10**exponent for exponent in range(-2, 5) for base in (1, 2, 5)]
+
+
+class TimerRegistry:
+    """
+    Class to record opt-in timings of the stages of the analysis. While the registry is disabled, timer() and the functions
+    decorated with timed() only check a flag. While it is enabled, every timed call records its duration, the number of
+    frames it handled and, with trace_allocations, the change of the memory traced by tracemalloc over the call; the calls
+    are summarised per stage as latency histograms, and can also be exported as a Chrome trace (chrome://tracing, Perfetto).
+    """
+    def __init__(self, max_trace_events=1_000_000):
+        """Constructor for TimerRegistry class
+
+        Args:
+            max_trace_events (int): maximum number of calls kept for the Chrome trace, defaults to 1000000
+        """
+        self.enabled = False
+        self.trace_allocations = False
+        self.started_tracemalloc = False
+        self.max_trace_events = max_trace_events
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget the recorded calls"""
+        with self.lock:
+            self.stages = {}
+            self.trace_events = []
+            self.thread_names = {}
+            self.start_time = time.perf_counter()
+
+    def enable(self, trace_allocations=False):
+        """Start recording the timed calls
+
+        Args:
+            trace_allocations (bool): also record the memory allocated by each call with tracemalloc, which slows down
+                allocation-heavy code, defaults to False
+        """
+        self.trace_allocations = trace_allocations
+        if trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracemalloc = True
+        self.enabled = True
+
+    def disable(self):
+        """Stop recording the timed calls, keeping what was recorded"""
+        self.enabled = False
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+            self.started_tracemalloc = False
+        self.trace_allocations = False
+
+    def record(self, name, start_time, seconds, frames=0, allocated_bytes=None):
+        """Record a call of a stage
+
+        Args:
+            name (str): name of the stage
+            start_time (float): time.perf_counter() at the start of the call
+            seconds (float): duration of the call
+            frames (int): number of frames handled by the call, defaults to 0
+            allocated_bytes (int): change of the traced memory over the call, None if allocations are not traced, defaults to None
+        """
+        thread = threading.current_thread()
+        with self.lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = {'durations': [], 'frames': 0, 'allocated_bytes': []}
+            stage['durations'].append(seconds)
+            stage['frames'] += frames
+            if allocated_bytes is not None:
+                stage['allocated_bytes'].append(allocated_bytes)
+            if len(self.trace_events) < self.max_trace_events:
+                self.thread_names[thread.ident] = thread.name
+                self.trace_events.append((name, start_time, seconds, thread.ident, frames, allocated_bytes))
+
+    @contextmanager
+    def timer(self, name, frames=0):
+        """Time the code of a with block as a call of a stage
+
+        Args:
+            name (str): name of the stage
+            frames (int): number of frames handled by the block, defaults to 0
+
+        Yields:
+            None
+        """
+        if not self.enabled:
+            yield
+            return
+        trace_allocations = self.trace_allocations and tracemalloc.is_tracing()
+        allocated_before = tracemalloc.get_traced_memory()[0] if trace_allocations else None
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start_time
+            allocated_bytes = tracemalloc.get_traced_memory()[0] - allocated_before if trace_allocations else None
+            self.record(name, start_time, seconds, frames, allocated_bytes)
+
+    def timed(self, name=None, count_frames=None):
+        """Decorator timing each call of a function as a call of a stage
+
+        Args:
+            name (str): name of the stage, defaults to the qualified name of the function
+            count_frames: number of frames handled by each call, or function of the return value giving it (e.g. len), defaults to None (0 frames)
+
+        Returns:
+            the decorator
+        """
+        def decorator(function):
+            stage_name = name or function.__qualname__
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                trace_allocations = self.trace_allocations and tracemalloc.is_tracing()
+                allocated_before = tracemalloc.get_traced_memory()[0] if trace_allocations else None
+                start_time = time.perf_counter()
+                output = function(*args, **kwargs)
+                seconds = time.perf_counter() - start_time
+                allocated_bytes = tracemalloc.get_traced_memory()[0] - allocated_before if trace_allocations else None
+                frames = count_frames(output) if callable(count_frames) else count_frames or 0
+                self.record(stage_name, start_time, seconds, frames, allocated_bytes)
+                return output
+            return wrapper
+        return decorator
+
+    def get_stage_report(self, stage):
+        """Summarise the calls of a stage
+
+        Args:
+            stage (dict): recorded calls of the stage
+
+        Returns:
+            dict: number of calls, total and per-call latencies, latency histogram, frames and allocations
+        """
+        durations_ms = np.array(stage['durations']) * 1000
+        total_seconds = float(durations_ms.sum() / 1000)
+        counts = np.bincount(np.searchsorted(HISTOGRAM_BUCKETS_MS, durations_ms), minlength=len(HISTOGRAM_BUCKETS_MS) + 1)
+        report = {
+            'calls': len(durations_ms),
+            'total_seconds': total_seconds,
+            'mean_ms': float(durations_ms.mean()),
+            'min_ms': float(durations_ms.min()),
+            'p50_ms': float(np.percentile(durations_ms, 50)),
+            'p90_ms': float(np.percentile(durations_ms, 90)),
+            'p99_ms': float(np.percentile(durations_ms, 99)),
+            'max_ms': float(durations_ms.max()),
+            'histogram': {
+                'bucket_upper_ms': HISTOGRAM_BUCKETS_MS + [None],
+                'counts': counts.tolist(),
+            },
+            'frames': stage['frames'],
+            'frames_per_second': stage['frames'] / total_seconds if stage['frames'] and total_seconds > 0 else None,
+        }
+        if stage['allocated_bytes']:
+            allocated_mb = np.array(stage['allocated_bytes']) / 1024**2
+            report['allocated_mb_total'] = float(allocated_mb.sum())
+            report['allocated_mb_max'] = float(allocated_mb.max())
+        return report
+
+    def get_report(self):
+        """Summarise the recorded calls of every stage
+
+        Returns:
+            dict: wall time since the registry was reset, and the summary of each stage keyed by name (see get_stage_report())
+        """
+        with self.lock:
+            stages = {name: dict(stage, durations=list(stage['durations'])) for name, stage in self.stages.items()}
+        return {
+            'wall_seconds': time.perf_counter() - self.start_time,
+            'trace_allocations': self.trace_allocations,
+            'stages': {name: self.get_stage_report(stage) for name, stage in stages.items()},
+        }
+
+    def format_report(self):
+        """Format the summary of the stages as a table, slowest stage first
+
+        Returns:
+            str: the table
+        """
+        stages = self.get_report()['stages']
+        lines = [f"{'stage':<56} {'calls':>7} {'total s':>9} {'p50 ms':>9} {'p99 ms':>9} {'frames/sec':>11}"]
+        for name, stage in sorted(stages.items(), key=lambda item: item[1]['total_seconds'], reverse=True):
+            frames_per_second = f"{stage['frames_per_second']:.1f}" if stage['frames_per_second'] else '-'
+            lines.append(f"{name:<56} {stage['calls']:>7} {stage['total_seconds']:>9.3f} {stage['p50_ms']:>9.2f} {stage['p99_ms']:>9.2f} {frames_per_second:>11}")
+        return "\n".join(lines)
+
+    def save_report(self, path):
+        """Save the summary of the stages as JSON
+
+        Args:
+            path (str): path of the JSON file
+        """
+        with open(path, 'w') as f:
+            json.dump(self.get_report(), f, indent=2)
+
+    def save_chrome_trace(self, path):
+        """Save the recorded calls as a Chrome trace, one complete event per call on the thread that made it
+
+        Args:
+            path (str): path of the JSON trace file
+        """
+        pid = os.getpid()
+        with self.lock:
+            trace_events = list(self.trace_events)
+            thread_names = dict(self.thread_names)
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': thread_name}} for tid, thread_name in thread_names.items()]
+        for name, start_time, seconds, tid, frames, allocated_bytes in trace_events:
+            args = {'frames': frames}
+            if allocated_bytes is not None:
+                args['allocated_bytes'] = allocated_bytes
+            events.append({
+                'name': name,
+                'ph': 'X',
+                'ts': (start_time - self.start_time) * 1e6,
+                'dur': seconds * 1e6,
+                'pid': pid,
+                'tid': tid,
+                'args': args,
+            })
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+# registry of the analysis, disabled unless enabled by main() or by the caller
+timer_registry = TimerRegistry()
+timer = timer_registry.timer
+timed = timer_registry.timed
@@ -0,0 +1,80 @@
+from bisect import bisect_right
+import numpy as np
+
+
+class CourtKeypointSegments:
+    """
+    Class to hold the court keypoints of a video as segments: each segment starts at a frame where the keypoints were detected
+    and lasts until the next one. The keypoints of a frame are looked up with a binary search over the segment start frames.
+    """
+    def __init__(self):
+        """Constructor for CourtKeypointSegments class"""
+        self.start_frames = []
+        self.keypoints = []
+
+    @classmethod
+    def from_keypoints(cls, keypoints):
+        """Build segments from keypoints used for the whole video
+
+        Args:
+            keypoints: CourtKeypointSegments, or flat list of the 14 court keypoints [x0, y0, x1, y1, ...]
+
+        Returns:
+            CourtKeypointSegments: the given segments, or one segment starting at frame 0
+        """
+        if isinstance(keypoints, CourtKeypointSegments):
+            return keypoints
+        segments = cls()
+        segments.add_segment(0, keypoints)
+        return segments
+
+    def add_segment(self, start_frame, keypoints):
+        """Add a segment starting at start_frame
+
+        Args:
+            start_frame (int): first frame of the segment, greater than the start frame of the previous segment
+            keypoints: keypoints detected at start_frame
+        """
+        if self.start_frames and start_frame <= self.start_frames[-1]:
+            raise ValueError("Segments must be added in increasing order of start frame")
+        self.start_frames.append(start_frame)
+        self.keypoints.append(keypoints)
+
+    def get_segment_index(self, frame_num):
+        """Get the index of the segment holding a frame
+
+        Args:
+            frame_num (int): frame index
+
+        Returns:
+            int: index of the segment
+        """
+        return max(bisect_right(self.start_frames, frame_num) - 1, 0)
+
+    def get_segment_indices(self, frame_nums):
+        """Get the index of the segment holding each of many frames
+
+        Args:
+            frame_nums: array of frame indices
+
+        Returns:
+            array of the segment index of each frame
+        """
+        return np.maximum(np.searchsorted(self.start_frames, frame_nums, side='right') - 1, 0)
+
+    def get_keypoints(self, frame_num):
+        """Get the keypoints of a frame
+
+        Args:
+            frame_num (int): frame index
+
+        Returns:
+            keypoints of the segment holding the frame
+        """
+        return self.keypoints[self.get_segment_index(frame_num)]
+
+    def __len__(self):
+        return len(self.start_frames)
+
+    def __iter__(self):
+        return iter(zip(self.start_frames, self.keypoints))
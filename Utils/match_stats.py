@@ -0,0 +1,148 @@
+import math
+from bisect import bisect_right
+import constants
+from .bbox_utils import measure_distance
+from .conversions import convert_pixel_distance_to_meters
+
+
+class MatchStatsAccumulator:
+    """
+    Class to accumulate the player statistics of a match shot by shot. Running totals are updated in O(1) per shot, and a
+    snapshot of the statistics is kept per shot, so the statistics at any frame are found with a binary search over the
+    shot frames without building one row per frame.
+    The statistics of a frame are those of the last shot at or before it. The average player speed of a player is the total
+    of their speeds (measured while the opponent's shots travel) over the number of shots of the opponent.
+    """
+    def __init__(self):
+        """Constructor for MatchStatsAccumulator class"""
+        self.totals = {
+            'player_1_number_of_shots': 0,
+            'player_1_total_shot_speed': 0,
+            'player_1_last_shot_speed': 0,
+            'player_1_total_player_speed': 0,
+            'player_1_last_player_speed': 0,
+
+            'player_2_number_of_shots': 0,
+            'player_2_total_shot_speed': 0,
+            'player_2_last_shot_speed': 0,
+            'player_2_total_player_speed': 0,
+            'player_2_last_player_speed': 0,
+        }
+        self.event_frames = [0]
+        self.snapshots = [self.get_snapshot()]
+
+    @staticmethod
+    def get_average(total, count):
+        """Get an average, with the results of a float division by zero (NaN for 0/0)
+
+        Args:
+            total: sum of the values
+            count: number of values
+
+        Returns:
+            float: total / count
+        """
+        if count == 0:
+            return math.nan if total == 0 else math.copysign(math.inf, total)
+        return total / count
+
+    def get_snapshot(self):
+        """Get the current statistics, with the averages
+
+        Returns:
+            dict: running totals, last speeds and averages of both players
+        """
+        snapshot = dict(self.totals)
+        snapshot['player_1_average_shot_speed'] = self.get_average(snapshot['player_1_total_shot_speed'], snapshot['player_1_number_of_shots'])
+        snapshot['player_2_average_shot_speed'] = self.get_average(snapshot['player_2_total_shot_speed'], snapshot['player_2_number_of_shots'])
+        snapshot['player_1_average_player_speed'] = self.get_average(snapshot['player_1_total_player_speed'], snapshot['player_2_number_of_shots'])
+        snapshot['player_2_average_player_speed'] = self.get_average(snapshot['player_2_total_player_speed'], snapshot['player_1_number_of_shots'])
+        return snapshot
+
+    def add_shot(self, frame_num, player_shot_ball, speed_of_ball_shot, opponent_player, speed_of_opponent):
+        """Record a shot
+
+        Args:
+            frame_num (int): frame of the shot, after the frame of the previous shot
+            player_shot_ball (int): ID of the player who shot the ball (1 or 2)
+            speed_of_ball_shot (float): speed of the ball shot in km/h
+            opponent_player (int): ID of the opponent (1 or 2)
+            speed_of_opponent (float): speed of the opponent while the ball travels, in km/h
+        """
+        if frame_num < self.event_frames[-1]:
+            raise ValueError("Shots must be added in increasing order of frame")
+        self.totals[f'player_{player_shot_ball}_number_of_shots'] += 1
+        self.totals[f'player_{player_shot_ball}_total_shot_speed'] += speed_of_ball_shot
+        self.totals[f'player_{player_shot_ball}_last_shot_speed'] = speed_of_ball_shot
+
+        self.totals[f'player_{opponent_player}_total_player_speed'] += speed_of_opponent
+        self.totals[f'player_{opponent_player}_last_player_speed'] = speed_of_opponent
+
+        snapshot = self.get_snapshot()
+        if frame_num == self.event_frames[-1]:
+            self.snapshots[-1] = snapshot
+        else:
+            self.event_frames.append(frame_num)
+            self.snapshots.append(snapshot)
+
+    def add_shot_from_positions(self, start_frame, ball_shot_time_in_second, start_player_positions, start_ball_position,
+                                end_player_positions, end_ball_position, mini_court_width):
+        """Record a shot from the mini court positions at the frame of the shot and at the frame of the next shot.
+        The player closest to the ball shot it, and the speed of the opponent is measured while the ball travels.
+
+        Args:
+            start_frame (int): frame of the shot
+            ball_shot_time_in_second (float): time between the shot and the next shot
+            start_player_positions (dict): mini court positions of the players at the shot, keyed by player ID
+            start_ball_position: mini court position of the ball at the shot
+            end_player_positions (dict): mini court positions of the players at the next shot
+            end_ball_position: mini court position of the ball at the next shot
+            mini_court_width: width of the mini court in pixels
+        """
+        # get distance covered by the ball
+        distance_covered_by_ball_pixels = measure_distance(start_ball_position, end_ball_position)
+        distance_covered_by_ball_meters = convert_pixel_distance_to_meters( distance_covered_by_ball_pixels,
+                                                                           constants.DOUBLE_LINE_WIDTH,
+                                                                           mini_court_width
+                                                                           )
+
+        # speed of the ball shot on km/h
+        speed_of_ball_shot = distance_covered_by_ball_meters/ball_shot_time_in_second * 3.6
+
+        # player who shot the ball
+        player_shot_ball = min(start_player_positions.keys(), key=lambda player_id: measure_distance(start_player_positions[player_id], start_ball_position))
+
+        # opponent player speed
+        opponent_player = 1 if player_shot_ball == 2 else 2
+        distance_covered_by_opponent_player_pixels = measure_distance(start_player_positions[opponent_player], end_player_positions[opponent_player])
+        distance_covered_by_opponent_player_meters = convert_pixel_distance_to_meters( distance_covered_by_opponent_player_pixels,
+                                                                           constants.DOUBLE_LINE_WIDTH,
+                                                                           mini_court_width
+                                                                           )
+        speed_of_opponent = distance_covered_by_opponent_player_meters/ball_shot_time_in_second * 3.6
+
+        self.add_shot(start_frame, player_shot_ball, speed_of_ball_shot, opponent_player, speed_of_opponent)
+
+    def stats_at(self, frame_num):
+        """Get the statistics at a frame
+
+        Args:
+            frame_num (int): frame index
+
+        Returns:
+            dict: statistics after the last shot at or before the frame
+        """
+        return self.snapshots[max(bisect_right(self.event_frames, frame_num) - 1, 0)]
+
+    def values_at(self, frame_num, columns):
+        """Get some of the statistics at a frame
+
+        Args:
+            frame_num (int): frame index
+            columns: names of the statistics
+
+        Returns:
+            list: the statistics in the order of columns
+        """
+        stats = self.stats_at(frame_num)
+        return [stats[column] for column in columns]
@@ -0,0 +1,70 @@
+import threading
+import time
+
+
+class ModelRegistry:
+    """
+    Class to load the models of the analysis on first use and keep them loaded for the life of the process. The trackers and the
+    court line detector get their models from the registry when they first run them, so a stage whose detections are read from a
+    cache never loads its model, and a long-lived process (see ModelWorker) loads each model once for all its jobs.
+    Objects built on the same weights share one model, and so the tracking state of a YOLO model: they must be used one after the other.
+    """
+    def __init__(self):
+        """Constructor for ModelRegistry class"""
+        self.models = {}
+        self.load_seconds = {}
+        self.lock = threading.Lock()
+
+    def get(self, key, load_model):
+        """Get a model, loading it if it is not loaded yet
+
+        Args:
+            key: hashable key of the model, e.g. ('yolo', model_path)
+            load_model: function without arguments returning the loaded model
+
+        Returns:
+            the model
+        """
+        model = self.models.get(key)
+        if model is not None:
+            return model
+        with self.lock:
+            if key not in self.models:
+                start_time = time.perf_counter()
+                self.models[key] = load_model()
+                self.load_seconds[key] = time.perf_counter() - start_time
+            return self.models[key]
+
+    def is_loaded(self, key):
+        """Check if a model is loaded
+
+        Args:
+            key: key of the model
+
+        Returns:
+            bool: True if the model is loaded
+        """
+        return key in self.models
+
+    def clear(self):
+        """Unload all the models"""
+        with self.lock:
+            self.models.clear()
+            self.load_seconds.clear()
+
+
+def load_yolo_model(model_path):
+    """Load a YOLO model, importing ultralytics (and torch) only when a model is needed
+
+    Args:
+        model_path (str): path to the model weights
+
+    Returns:
+        the YOLO model
+    """
+    from ultralytics import YOLO
+    return YOLO(model_path)
+
+
+# models of this process
+model_registry = ModelRegistry()
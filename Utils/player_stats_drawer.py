@@ -1,66 +1,143 @@
+from itertools import count
 import numpy as np
 import cv2
+from .match_stats import MatchStatsAccumulator
 
-def draw_player_stats(output_video_frames,player_stats):
-    """Draw player statistics on the output video frames
-
-    Args:
-        output_video_frames (list): list of frames of the output video
-        player_stats (DataFrame): DataFrame containing the player statistics
+PLAYER_STATS_COLUMNS = [
+    'player_1_last_shot_speed',
+    'player_2_last_shot_speed',
+    'player_1_last_player_speed',
+    'player_2_last_player_speed',
+    'player_1_average_shot_speed',
+    'player_2_average_shot_speed',
+    'player_1_average_player_speed',
+    'player_2_average_player_speed',
+]
 
-    Returns:
-        list: list of frames with player statistics drawn on them
+class PlayerStatsPanel:
     """
+    Class to draw the player statistics panel. The panel is darkened in place inside its own region only, and the text is
+    rendered to a cached alpha mask that is re-rendered only when the displayed values change, which is only on shot frames.
+    """
+    def __init__(self, width=350, height=230):
+        """Constructor for PlayerStatsPanel class
 
-    for index, row in player_stats.iterrows():
-        player_1_shot_speed = row['player_1_last_shot_speed']
-        player_2_shot_speed = row['player_2_last_shot_speed']
-        player_1_speed = row['player_1_last_player_speed']
-        player_2_speed = row['player_2_last_player_speed']
-
-        avg_player_1_shot_speed = row['player_1_average_shot_speed']
-        avg_player_2_shot_speed = row['player_2_average_shot_speed']
-        avg_player_1_speed = row['player_1_average_player_speed']
-        avg_player_2_speed = row['player_2_average_player_speed']
+        Args:
+            width (int): width of the panel, defaults to 350
+            height (int): height of the panel, defaults to 230
+        """
+        self.width = width
+        self.height = height
+        self.frame_shape = None
+        self.texts = None
+        self.text_box = None
+        self.text_alpha = None
 
-        frame = output_video_frames[index]
-        shapes = np.zeros_like(frame, np.uint8)
+    def set_position(self, frame_shape):
+        """Set the position of the panel and of the text region for a frame size
 
-        width=350
-        height=230
+        Args:
+            frame_shape: shape of the frames
+        """
+        self.frame_shape = frame_shape
+        frame_height, frame_width = frame_shape[:2]
+        self.start_x = frame_width-400
+        self.start_y = frame_height-500
+        self.end_x = self.start_x+self.width
+        self.end_y = self.start_y+self.height
+        # the filled rectangle includes its end point, and is clipped to the frame
+        self.panel_slice = (slice(max(self.start_y, 0), max(min(self.end_y+1, frame_height), 0)),
+                            slice(max(self.start_x, 0), max(min(self.end_x+1, frame_width), 0)))
+        # the text can run past the right of the panel, so the text region extends to the bottom right corner of the frame
+        self.text_origin = (max(self.start_x, 0), max(self.start_y, 0))
+        self.text_slice = (slice(self.text_origin[1], frame_height), slice(self.text_origin[0], frame_width))
+        self.texts = None
 
-        start_x = frame.shape[1]-400
-        start_y = frame.shape[0]-500
-        end_x = start_x+width
-        end_y = start_y+height
+    def render_text(self, texts):
+        """Render the text of the panel to the cached alpha mask
 
-        overlay = frame.copy()
-        cv2.rectangle(overlay, (start_x, start_y), (end_x, end_y), (0, 0, 0), -1)
-        alpha = 0.5 
-        cv2.addWeighted(overlay, alpha, frame, 1 - alpha, 0, frame)
-        output_video_frames[index] = frame
+        Args:
+            texts: the four formatted lines of values (shot speed, player speed, average shot speed, average player speed)
+        """
+        frame_height, frame_width = self.frame_shape[:2]
+        text_shape = (frame_height - self.text_origin[1], frame_width - self.text_origin[0])
+        mask = np.zeros(text_shape, dtype=np.uint8)
+        start_x = self.start_x - self.text_origin[0]
+        start_y = self.start_y - self.text_origin[1]
 
         text = "     Player 1     Player 2"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+80, start_y+30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-        
-        text = "Shot Speed"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+10, start_y+80), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
-        text = f"{player_1_shot_speed:.1f} km/h    {player_2_shot_speed:.1f} km/h"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+130, start_y+80), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
-
-        text = "Player Speed"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+10, start_y+120), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
-        text = f"{player_1_speed:.1f} km/h    {player_2_speed:.1f} km/h"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+130, start_y+120), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
-        
-        text = "avg. S. Speed"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+10, start_y+160), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
-        text = f"{avg_player_1_shot_speed:.1f} km/h    {avg_player_2_shot_speed:.1f} km/h"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+130, start_y+160), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
-        
-        text = "avg. P. Speed"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+10, start_y+200), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
-        text = f"{avg_player_1_speed:.1f} km/h    {avg_player_2_speed:.1f} km/h"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+130, start_y+200), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
-    
-    return output_video_frames
\ No newline at end of file
+        cv2.putText(mask, text, (start_x+80, start_y+30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, 255, 2)
+
+        labels = ["Shot Speed", "Player Speed", "avg. S. Speed", "avg. P. Speed"]
+        for row, (label, values_text) in enumerate(zip(labels, texts)):
+            y = start_y+80+40*row
+            cv2.putText(mask, label, (start_x+10, y), cv2.FONT_HERSHEY_SIMPLEX, 0.45, 255, 1)
+            cv2.putText(mask, values_text, (start_x+130, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, 255, 2)
+
+        # the mask is the coverage of the white text, used as its alpha, kept only over the bounding box of the text
+        rows = np.flatnonzero(mask.any(axis=1))
+        columns = np.flatnonzero(mask.any(axis=0))
+        if len(rows) == 0:
+            rows = columns = np.array([0, -1])
+        self.text_box = (slice(rows[0], rows[-1]+1), slice(columns[0], columns[-1]+1))
+        self.text_alpha = mask[self.text_box].astype(np.uint16)[:, :, None]
+        self.texts = texts
+
+    def draw(self, frame, values):
+        """Draw the panel on a frame, in place
+
+        Args:
+            frame: the frame on which the panel is drawn
+            values: the 8 statistics in the order of PLAYER_STATS_COLUMNS
+
+        Returns:
+            frame with the panel drawn
+        """
+        if frame.shape != self.frame_shape:
+            self.set_position(frame.shape)
+        texts = tuple(f"{values[i]:.1f} km/h    {values[i+1]:.1f} km/h" for i in range(0, len(values), 2))
+        if texts != self.texts:
+            self.render_text(texts)
+
+        panel = frame[self.panel_slice]
+        alpha = 0.5
+        cv2.addWeighted(panel, alpha, panel, 0, 0, dst=panel)
+        text_region = frame[self.text_slice][self.text_box]
+        # blend white text: region + (255 - region)*alpha/255, rounded
+        text_region += (((255 - text_region)*self.text_alpha + 127)//255).astype(np.uint8)
+        return frame
+
+def get_player_stats_values(player_stats):
+    """Get the statistics drawn by PlayerStatsPanel as one row of values per frame
+
+    Args:
+        player_stats (DataFrame): DataFrame containing the player statistics, one row per frame
+
+    Returns:
+        list: list of the 8 statistics of each frame in the order of PLAYER_STATS_COLUMNS
+    """
+    return np.stack([player_stats[column].to_numpy(dtype=np.float64) for column in PLAYER_STATS_COLUMNS], axis=1).tolist()
+
+def draw_player_stats(output_video_frames,player_stats,panel=None,start_frame=0):
+    """Draw player statistics on the output video frames
+
+    Args:
+        output_video_frames (list): list or iterable of frames of the output video
+        player_stats: MatchStatsAccumulator queried at each frame, or DataFrame containing the player statistics, one row per frame in output_video_frames
+        panel (PlayerStatsPanel): panel reused across calls so that its cached text carries over, defaults to a new panel
+        start_frame (int): index of the first frame of output_video_frames in the video, used with a MatchStatsAccumulator, defaults to 0
+
+    Returns:
+        list: list of frames with player statistics drawn on them
+    """
+    if panel is None:
+        panel = PlayerStatsPanel()
+    if isinstance(player_stats, MatchStatsAccumulator):
+        stats_values = (player_stats.values_at(frame_num, PLAYER_STATS_COLUMNS) for frame_num in count(start_frame))
+    else:
+        stats_values = get_player_stats_values(player_stats)
+
+    output_frames = []
+    for frame, values in zip(output_video_frames, stats_values):
+        output_frames.append(panel.draw(frame, values))
+    return output_frames
@@ -1,4 +1,5 @@
 import cv2
+from .video_writers import DEFAULT_FPS, get_video_writer
 
 def read_video(video_path):
     """Read a video and return a list of frames
@@ -9,25 +10,103 @@ def read_video(video_path):
     Returns:
         frames: list of frames of the video
     """
+    return list(iter_video_frames(video_path))
+
+def iter_video_frames(video_path, start_frame=0, end_frame=None):
+    """Read a video frame by frame, so that only the frame being processed is held in memory
+
+    Args:
+        video_path: path to the video
+        start_frame: index of the first frame to read, the video is seeked to it, defaults to 0
+        end_frame: index of the frame after the last frame to read, None to read until the end of the video, defaults to None
+
+    Yields:
+        frame: the next decoded frame of the video
+    """
     cap = cv2.VideoCapture(video_path)
-    frames = []
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        frames.append(frame)
-    cap.release()
-    return frames
-
-def save_video(frames, output_path):
-    """Save a list of frames as a video
+    try:
+        if start_frame > 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        frame_num = start_frame
+        while end_frame is None or frame_num < end_frame:
+            frame_num += 1
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield frame
+    finally:
+        cap.release()
+
+def chunk_frames(frames, chunk_size):
+    """Group an iterable of frames into lists of at most chunk_size frames
 
     Args:
-        frames: list of frames to save as a video
-        output_path: path to save the video
+        frames: iterable of frames
+        chunk_size: maximum number of frames in a chunk
+
+    Yields:
+        list: the next chunk of frames
     """
-    fourcc = cv2.VideoWriter_fourcc(*'MJPG')
-    out = cv2.VideoWriter(output_path, fourcc, 24, (frames[0].shape[1], frames[0].shape[0]))
+    chunk = []
     for frame in frames:
-        out.write(frame)
-    out.release()
\ No newline at end of file
+        chunk.append(frame)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def read_video_chunks(video_path, chunk_size):
+    """Read a video in chunks of frames. Peak memory is set by chunk_size instead of the length of the video.
+
+    Args:
+        video_path: path to the video
+        chunk_size: maximum number of frames in a chunk
+
+    Yields:
+        list: the next chunk of frames of the video
+    """
+    yield from chunk_frames(iter_video_frames(video_path), chunk_size)
+
+def get_video_frame_count(video_path):
+    """Get the number of frames of a video, as reported by the container
+
+    Args:
+        video_path: path to the video
+
+    Returns:
+        int: number of frames of the video
+    """
+    cap = cv2.VideoCapture(video_path)
+    try:
+        return int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    finally:
+        cap.release()
+
+def read_first_frame(video_path):
+    """Read only the first frame of a video
+
+    Args:
+        video_path: path to the video
+
+    Returns:
+        frame: first frame of the video, None if the video could not be read
+    """
+    return next(iter_video_frames(video_path), None)
+
+def save_video(frames, output_path, fps=DEFAULT_FPS, backend='cv2', **writer_options):
+    """Save frames as a video. Frames are written as they are produced, so frames can be a generator.
+
+    Args:
+        frames: list or iterable of frames to save as a video
+        output_path: path to save the video
+        fps: frame rate of the video, defaults to 24
+        backend: 'cv2' (MJPG by default) or 'ffmpeg' (x264 by default), see get_video_writer(), defaults to 'cv2'
+        **writer_options: options of the writer, e.g. fourcc for 'cv2', or codec, preset, crf and threads for 'ffmpeg'
+    """
+    out = get_video_writer(output_path, fps, backend, **writer_options)
+    try:
+        for frame in frames:
+            out.write(frame)
+    finally:
+        out.close()
@@ -0,0 +1,157 @@
+import shutil
+import subprocess
+import cv2
+
+DEFAULT_FPS = 24
+
+
+def get_video_fps(video_path, default=DEFAULT_FPS):
+    """Get the frame rate of a video
+
+    Args:
+        video_path: path to the video
+        default: frame rate returned when the container does not report one, defaults to 24
+
+    Returns:
+        float: frames per second of the video
+    """
+    cap = cv2.VideoCapture(video_path)
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS)
+    finally:
+        cap.release()
+    return fps if fps and fps > 0 else default
+
+
+class OpenCVVideoWriter:
+    """
+    Class to encode frames with cv2.VideoWriter. The writer is opened on the first frame, so the size of the video
+    does not need to be known in advance.
+    """
+    def __init__(self, output_path, fps=DEFAULT_FPS, fourcc='MJPG'):
+        """Constructor for OpenCVVideoWriter class
+
+        Args:
+            output_path (str): path to save the video
+            fps (float): frame rate of the video, defaults to 24
+            fourcc (str): four character code of the codec, defaults to 'MJPG'
+        """
+        self.output_path = output_path
+        self.fps = fps
+        self.fourcc = fourcc
+        self.writer = None
+
+    def write(self, frame):
+        """Encode one BGR frame
+
+        Args:
+            frame: frame to encode
+        """
+        if self.writer is None:
+            self.writer = cv2.VideoWriter(self.output_path, cv2.VideoWriter_fourcc(*self.fourcc), self.fps, (frame.shape[1], frame.shape[0]))
+        self.writer.write(frame)
+
+    def close(self):
+        """Finish the video"""
+        if self.writer is not None:
+            self.writer.release()
+            self.writer = None
+
+
+class FFmpegVideoWriter:
+    """
+    Class to encode frames with an ffmpeg subprocess. Raw BGR frames are piped to ffmpeg over stdin, and ffmpeg encodes them
+    with its own threads (x264/x265), so the Python process only pays for copying the frames into the pipe.
+    """
+    def __init__(self, output_path, fps=DEFAULT_FPS, codec='libx264', preset='veryfast', crf=23, threads=0, pix_fmt='yuv420p', ffmpeg_path='ffmpeg'):
+        """Constructor for FFmpegVideoWriter class
+
+        Args:
+            output_path (str): path to save the video, the container is chosen by ffmpeg from its extension
+            fps (float): frame rate of the video, defaults to 24
+            codec (str): ffmpeg video encoder, e.g. 'libx264' or 'libx265', defaults to 'libx264'
+            preset (str): encoder preset trading speed for size, e.g. 'ultrafast', 'veryfast' or 'medium', defaults to 'veryfast'
+            crf (int): constant rate factor, lower is better quality and larger files, defaults to 23
+            threads (int): number of encoder threads, 0 to let ffmpeg choose, defaults to 0
+            pix_fmt (str): pixel format of the encoded video, defaults to 'yuv420p' for player compatibility
+            ffmpeg_path (str): ffmpeg executable, defaults to 'ffmpeg'
+        """
+        self.output_path = output_path
+        self.fps = fps
+        self.codec = codec
+        self.preset = preset
+        self.crf = crf
+        self.threads = threads
+        self.pix_fmt = pix_fmt
+        self.ffmpeg_path = ffmpeg_path
+        self.process = None
+
+    def get_command(self, frame_width, frame_height):
+        """Build the ffmpeg command line
+
+        Args:
+            frame_width (int): width of the frames
+            frame_height (int): height of the frames
+
+        Returns:
+            list: arguments of the ffmpeg subprocess
+        """
+        return [
+            self.ffmpeg_path, '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{frame_width}x{frame_height}', '-r', str(self.fps), '-i', '-',
+            '-an', '-c:v', self.codec, '-preset', self.preset, '-crf', str(self.crf), '-threads', str(self.threads),
+            '-pix_fmt', self.pix_fmt, self.output_path,
+        ]
+
+    def write(self, frame):
+        """Encode one BGR frame
+
+        Args:
+            frame: frame to encode
+        """
+        if self.process is None:
+            if shutil.which(self.ffmpeg_path) is None:
+                raise RuntimeError(f"ffmpeg executable not found: {self.ffmpeg_path}")
+            self.process = subprocess.Popen(self.get_command(frame.shape[1], frame.shape[0]), stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            self.process.stdin.write(memoryview(frame).cast('B') if frame.flags['C_CONTIGUOUS'] else frame.tobytes())
+        except BrokenPipeError:
+            self.close()
+            raise RuntimeError("ffmpeg stopped reading frames")
+
+    def close(self):
+        """Finish the video, raising an error if ffmpeg failed"""
+        if self.process is None:
+            return
+        process, self.process = self.process, None
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        error_output = process.stderr.read()
+        process.stderr.close()
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed with exit code {process.returncode}: {error_output.decode(errors='replace').strip()}")
+
+
+VIDEO_WRITER_BACKENDS = {
+    'cv2': OpenCVVideoWriter,
+    'ffmpeg': FFmpegVideoWriter,
+}
+
+
+def get_video_writer(output_path, fps=DEFAULT_FPS, backend='cv2', **writer_options):
+    """Create a video writer
+
+    Args:
+        output_path (str): path to save the video
+        fps (float): frame rate of the video, defaults to 24
+        backend (str): 'cv2' for OpenCVVideoWriter or 'ffmpeg' for FFmpegVideoWriter, defaults to 'cv2'
+        **writer_options: options of the writer class, e.g. fourcc for 'cv2', or codec, preset, crf and threads for 'ffmpeg'
+
+    Returns:
+        the video writer, with write(frame) and close() methods
+    """
+    if backend not in VIDEO_WRITER_BACKENDS:
+        raise ValueError(f"Unknown video writer backend: {backend}")
+    return VIDEO_WRITER_BACKENDS[backend](output_path, fps, **writer_options)
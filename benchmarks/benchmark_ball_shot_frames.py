@@ -0,0 +1,111 @@
+"""Benchmark of BallTracker.get_ball_shot_frames against the original per-frame pandas loop, on the stub ball track
+tiled to long lengths. The vectorized output is checked against the loop wherever the loop is run.
+
+Run from the root of the repository:
+    python -m benchmarks.benchmark_ball_shot_frames --lengths 10000 100000 1000000
+"""
+import argparse
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+
+from Trackers import BallTracker
+from Utils import DetectionTable
+
+
+def reference_ball_shot_frames(ball_positions):
+    """The original implementation of get_ball_shot_frames, with the chained .iloc assignment replaced by a single .iloc
+    assignment so that it also marks the hits on pandas versions with copy-on-write
+
+    Args:
+        ball_positions: list of dictionaries containing the track IDs as keys and the bounding boxes of the ball as values for each frame
+
+    Returns:
+        list: list of frame numbers in which the ball is hit
+    """
+    ball_positions = [x.get(1,[]) for x in ball_positions]
+    df_ball_positions = pd.DataFrame(ball_positions,columns=['x1','y1','x2','y2'])
+
+    df_ball_positions['ball_hit'] = 0
+
+    df_ball_positions['mid_y'] = (df_ball_positions['y1'] + df_ball_positions['y2'])/2
+    df_ball_positions['mid_y_rolling_mean'] = df_ball_positions['mid_y'].rolling(window=5, min_periods=1, center=False).mean()
+    df_ball_positions['delta_y'] = df_ball_positions['mid_y_rolling_mean'].diff()
+    ball_hit_column = df_ball_positions.columns.get_loc('ball_hit')
+    minimum_change_frames_for_hit = 25
+    for i in range(1,len(df_ball_positions)- int(minimum_change_frames_for_hit*1.2) ):
+        negative_position_change = df_ball_positions['delta_y'].iloc[i] >0 and df_ball_positions['delta_y'].iloc[i+1] <0
+        positive_position_change = df_ball_positions['delta_y'].iloc[i] <0 and df_ball_positions['delta_y'].iloc[i+1] >0
+
+        if negative_position_change or positive_position_change:
+            change_count = 0 
+            for change_frame in range(i+1, i+int(minimum_change_frames_for_hit*1.2)+1):
+                negative_position_change_following_frame = df_ball_positions['delta_y'].iloc[i] >0 and df_ball_positions['delta_y'].iloc[change_frame] <0
+                positive_position_change_following_frame = df_ball_positions['delta_y'].iloc[i] <0 and df_ball_positions['delta_y'].iloc[change_frame] >0
+
+                if negative_position_change and negative_position_change_following_frame:
+                    change_count+=1
+                elif positive_position_change and positive_position_change_following_frame:
+                    change_count+=1
+        
+            if change_count>minimum_change_frames_for_hit-1:
+                df_ball_positions.iloc[i, ball_hit_column] = 1
+
+    return df_ball_positions[df_ball_positions['ball_hit']==1].index.tolist()
+
+
+def tile_ball_positions(ball_positions, length):
+    """Repeat an interpolated ball track until it has length frames
+
+    Args:
+        ball_positions: DetectionTable of the interpolated ball track
+        length (int): number of frames of the tiled track
+
+    Returns:
+        DetectionTable: the tiled ball track
+    """
+    boxes = ball_positions.to_dense(1)
+    repeats = -(-length // len(boxes))
+    return DetectionTable.from_dense(np.tile(boxes, (repeats, 1))[:length])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stub", default="tracker_stubs/ball_detections.pkl")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--reference-max-length", type=int, default=10_000,
+                        help="longest track the original loop is run on, it takes minutes beyond that")
+    args = parser.parse_args()
+
+    with open(args.stub, 'rb') as f:
+        ball_detections = pickle.load(f)
+    # the tracker is only used for its methods, so the model is not loaded
+    ball_tracker = BallTracker.__new__(BallTracker)
+
+    ball_positions = ball_tracker.interpolate_ball_positions(ball_detections)
+    stub_match = ball_tracker.get_ball_shot_frames(ball_positions) == reference_ball_shot_frames(ball_positions)
+    print(f"stub ({len(ball_positions)} frames): identical output = {stub_match}")
+
+    ball_positions = ball_tracker.interpolate_ball_positions(DetectionTable.from_dicts(ball_detections))
+    print(f"{'frames':>9} {'vectorized (s)':>15} {'loop (s)':>10} {'speedup':>9} {'identical':>10}")
+    for length in args.lengths:
+        tiled_positions = tile_ball_positions(ball_positions, length)
+
+        start_time = time.perf_counter()
+        shot_frames = ball_tracker.get_ball_shot_frames(tiled_positions)
+        vectorized_seconds = time.perf_counter() - start_time
+
+        if length <= args.reference_max_length:
+            tiled_dicts = tiled_positions.to_dicts()
+            start_time = time.perf_counter()
+            reference_shot_frames = reference_ball_shot_frames(tiled_dicts)
+            loop_seconds = time.perf_counter() - start_time
+            print(f"{length:>9} {vectorized_seconds:>15.4f} {loop_seconds:>10.2f} {loop_seconds/vectorized_seconds:>8.0f}x {str(shot_frames == reference_shot_frames):>10}")
+        else:
+            print(f"{length:>9} {vectorized_seconds:>15.4f} {'-':>10} {'-':>9} {'-':>10}")
+
+
+if __name__ == "__main__":
+    main()
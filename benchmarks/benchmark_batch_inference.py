@@ -0,0 +1,63 @@
+"""Benchmark of YOLO inference throughput (frames/sec) against batch size for PlayerTracker and BallTracker.
+
+Run from the root of the repository:
+    python -m benchmarks.benchmark_batch_inference --video Media/input_video.mp4 --frames 96 --batch-sizes 1 4 8 16
+"""
+import argparse
+import time
+
+from Trackers import PlayerTracker, BallTracker
+from Utils import iter_video_frames
+
+
+def benchmark_tracker(tracker, frames, batch_size):
+    """Time detect_frames() of a tracker on a list of frames
+
+    Args:
+        tracker: PlayerTracker or BallTracker
+        frames: list of frames to run the detection on
+        batch_size: number of frames sent to the model in one call
+
+    Returns:
+        float: frames per second
+    """
+    start_time = time.perf_counter()
+    tracker.detect_frames(frames, batch_size=batch_size)
+    elapsed = time.perf_counter() - start_time
+    return len(frames) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", default="Media/input_video.mp4")
+    parser.add_argument("--frames", type=int, default=96, help="number of frames of the video to run the detection on")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--player-model", default="Models/yolov8x.pt")
+    parser.add_argument("--ball-model", default="Models/yolov5_best.pt")
+    args = parser.parse_args()
+
+    frames = []
+    for frame in iter_video_frames(args.video):
+        frames.append(frame)
+        if len(frames) == args.frames:
+            break
+
+    trackers = {
+        "player": lambda: PlayerTracker(args.player_model),
+        "ball": lambda: BallTracker(args.ball_model),
+    }
+    print(f"{'tracker':<8} {'batch size':>10} {'frames/sec':>12}")
+    for name, create_tracker in trackers.items():
+        for batch_size in args.batch_sizes:
+            tracker = create_tracker()
+            tracker.detect_frames(frames[:batch_size], batch_size=batch_size)  # warm-up
+            # trackers on the same weights share one model and its track state (see ModelRegistry), so the player tracks of
+            # the previous run are forgotten for the timed run to start with no tracks
+            if isinstance(tracker, PlayerTracker):
+                tracker.reset_tracks()
+            fps = benchmark_tracker(tracker, frames, batch_size)
+            print(f"{name:<8} {batch_size:>10} {fps:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
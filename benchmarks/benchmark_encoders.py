@@ -0,0 +1,85 @@
+"""Benchmark of encode throughput (frames/sec) against output file size for each video writer backend.
+
+Run from the root of the repository:
+    python -m benchmarks.benchmark_encoders --video Media/input_video.mp4 --frames 240
+    python -m benchmarks.benchmark_encoders --video Media/input_video.mp4 --configs cv2:MJPG ffmpeg:libx264:ultrafast ffmpeg:libx264:veryfast ffmpeg:libx265:fast
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from Utils import iter_video_frames, get_video_fps, save_video
+
+
+def parse_config(config):
+    """Parse a writer configuration of the form backend:codec[:preset]
+
+    Args:
+        config (str): e.g. 'cv2:MJPG' or 'ffmpeg:libx264:veryfast'
+
+    Returns:
+        tuple: (backend, writer options, file extension)
+    """
+    backend, codec, *preset = config.split(":")
+    if backend == "cv2":
+        return backend, {"fourcc": codec}, ".avi"
+    options = {"codec": codec}
+    if preset:
+        options["preset"] = preset[0]
+    return backend, options, ".mp4"
+
+
+def benchmark_writer(frames, output_path, fps, backend, writer_options):
+    """Time save_video() with a writer backend
+
+    Args:
+        frames: list of frames to encode
+        output_path: path of the encoded video
+        fps: frame rate of the video
+        backend: video writer backend
+        writer_options: options of the writer
+
+    Returns:
+        tuple: (frames per second, size of the output in bytes)
+    """
+    start_time = time.perf_counter()
+    save_video(frames, output_path, fps, backend, **writer_options)
+    elapsed = time.perf_counter() - start_time
+    return len(frames) / elapsed, os.path.getsize(output_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", default="Media/input_video.mp4")
+    parser.add_argument("--frames", type=int, default=240, help="number of frames of the video to encode")
+    parser.add_argument("--configs", nargs="+", default=["cv2:MJPG", "ffmpeg:libx264:ultrafast", "ffmpeg:libx264:veryfast", "ffmpeg:libx265:fast"],
+                        help="writer configurations as backend:codec[:preset]")
+    args = parser.parse_args()
+
+    # decode up front, so that only encoding is timed
+    frames = []
+    for frame in iter_video_frames(args.video):
+        frames.append(frame)
+        if len(frames) == args.frames:
+            break
+    fps = get_video_fps(args.video)
+
+    print(f"{'backend':<8} {'codec':<10} {'preset':<10} {'frames/sec':>12} {'size (MB)':>10} {'MB/min':>8}")
+    with tempfile.TemporaryDirectory() as output_dir:
+        for config in args.configs:
+            backend, writer_options, extension = parse_config(config)
+            output_path = os.path.join(output_dir, config.replace(":", "_") + extension)
+            try:
+                encode_fps, size = benchmark_writer(frames, output_path, fps, backend, writer_options)
+            except RuntimeError as error:
+                print(f"{config}: {error}")
+                continue
+            size_mb = size / 1e6
+            codec = writer_options.get("fourcc", writer_options.get("codec"))
+            preset = writer_options.get("preset", "-")
+            print(f"{backend:<8} {codec:<10} {preset:<10} {encode_fps:>12.2f} {size_mb:>10.2f} {size_mb / (len(frames) / fps / 60):>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""Benchmark of the detection throughput (frames/sec) of ShardedRunner against the number of worker processes.
+
+Run from the root of the repository:
+    python -m benchmarks.benchmark_sharded_runner --video Media/input_video.mp4 --workers 1 2 4 8
+"""
+import argparse
+import time
+
+from pipeline import ShardedRunner
+from Utils import get_video_frame_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", default="Media/input_video.mp4")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--overlap", type=int, default=32, help="number of frames detected twice at each shard boundary")
+    parser.add_argument("--player-model", default="Models/yolov8x.pt")
+    parser.add_argument("--ball-model", default="Models/yolov5_best.pt")
+    parser.add_argument("--keypoints-model", default=None, help="also detect the court keypoints in the workers")
+    args = parser.parse_args()
+
+    number_of_frames = get_video_frame_count(args.video)
+    print(f"{'workers':>7} {'shards':>7} {'wall s':>8} {'frames/sec':>11} {'speedup':>8} {'max shard s':>12}")
+    baseline_seconds = None
+    for number_of_workers in args.workers:
+        sharded_runner = ShardedRunner(args.video, args.player_model, args.ball_model, args.keypoints_model,
+                                       number_of_workers, overlap=args.overlap)
+        # the wall time includes spawning the workers and loading their models
+        start_time = time.perf_counter()
+        sharded_runner.run()
+        elapsed = time.perf_counter() - start_time
+        baseline_seconds = baseline_seconds or elapsed
+        print(f"{number_of_workers:>7} {len(sharded_runner.shard_seconds):>7} {elapsed:>8.2f} {number_of_frames / elapsed:>11.2f} "
+              f"{baseline_seconds / elapsed:>8.2f} {max(sharded_runner.shard_seconds):>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
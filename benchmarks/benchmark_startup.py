@@ -0,0 +1,99 @@
+"""Benchmark of the start-up cost of short analysis jobs: cold runs of main.py in a new process, with and without the detection
+cache holding the detections, against jobs run in a ModelWorker that keeps the models loaded.
+
+    import        importing main in a new interpreter, and the heavy modules it imported
+    cold          python main.py on the clip in a new process, detecting the players and the ball
+    cold, cached  the same with the detections read from the detection cache, so the YOLO models are not loaded
+    worker start  starting a ModelWorker which imports main and loads the models
+    warm          jobs of the ModelWorker, detecting the players and the ball with the loaded models
+
+Run from the root of the repository:
+    python -m benchmarks.benchmark_startup --video Media/input_video.mp4 --frames 48 --warm-jobs 3
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from Utils import iter_video_frames, get_video_fps, save_video
+from pipeline import ModelWorker
+
+MODEL_PATHS = {
+    'keypoints': "Models/keypoints_model.pth",
+    'player': "Models/yolov8x.pt",
+    'ball': "Models/yolov5_best.pt",
+}
+
+IMPORT_SCRIPT = """
+import sys, time
+start_time = time.perf_counter()
+import main
+print(time.perf_counter() - start_time)
+print(" ".join(module for module in ("torch", "torchvision", "ultralytics", "pandas") if module in sys.modules))
+"""
+
+
+def time_import():
+    """Time the import of main in a new interpreter
+
+    Returns:
+        tuple: (seconds, list of the heavy modules imported)
+    """
+    output = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT], capture_output=True, text=True, check=True).stdout.splitlines()
+    return float(output[0]), output[1].split() if len(output) > 1 else []
+
+
+def time_cold_run(clip_path, output_path, use_detection_cache):
+    """Time python main.py on a clip in a new process, from the start of the interpreter to its exit
+
+    Args:
+        clip_path (str): path to the clip
+        output_path (str): path of the annotated clip
+        use_detection_cache (bool): read the detections from the detection cache when it holds them
+
+    Returns:
+        float: wall time in seconds
+    """
+    command = [sys.executable, "main.py", "--input", clip_path, "--output", output_path]
+    if not use_detection_cache:
+        command.append("--no-detection-cache")
+    start_time = time.perf_counter()
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", default="Media/input_video.mp4")
+    parser.add_argument("--frames", type=int, default=48, help="number of frames of the clip cut from the start of the video")
+    parser.add_argument("--cold-runs", type=int, default=2)
+    parser.add_argument("--warm-jobs", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        clip_path = os.path.join(work_dir, "clip.avi")
+        output_path = os.path.join(work_dir, "output.avi")
+        save_video(iter_video_frames(args.video, 0, args.frames), clip_path, get_video_fps(args.video))
+
+        import_seconds, heavy_modules = time_import()
+        print(f"{'import main':<28} {import_seconds:>8.3f} s   heavy modules imported: {', '.join(heavy_modules) or 'none'}")
+
+        for run in range(args.cold_runs):
+            print(f"{f'cold #{run+1}':<28} {time_cold_run(clip_path, output_path, use_detection_cache=False):>8.3f} s")
+        # the first cached run fills the cache, the next ones read it
+        time_cold_run(clip_path, output_path, use_detection_cache=True)
+        print(f"{'cold, cached detections':<28} {time_cold_run(clip_path, output_path, use_detection_cache=True):>8.3f} s")
+
+        with ModelWorker(preload_model_paths=MODEL_PATHS) as model_worker:
+            print(f"{'worker start (preloaded)':<28} {model_worker.startup_seconds:>8.3f} s   model loads: "
+                  + ", ".join(f"{key} {seconds:.2f} s" for key, seconds in model_worker.model_load_seconds.items()))
+            for job in range(args.warm_jobs):
+                start_time = time.perf_counter()
+                model_worker.run_job(input_video_path=clip_path, output_video_path=output_path, use_detection_cache=False)
+                print(f"{f'warm #{job+1}':<28} {time.perf_counter() - start_time:>8.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Benchmark of the accuracy against speedup trade-off of strided player detection (see StridedDetector), on the stub player detections.
+The stub holds the detections of every frame, which are used as the ground truth: the strided detector looks up the keyframes
+in the stub, and the interpolated boxes are compared with the stub boxes of the same track.
+
+Run from the root of the repository:
+    python -m benchmarks.benchmark_strided_detection --strides 1 2 3 4 6 8 --motion-thresholds 0.1 0.25 1000
+"""
+import argparse
+import pickle
+
+import numpy as np
+
+from Trackers import StridedDetector
+from Utils import get_iou
+
+
+def evaluate(detections, ground_truth):
+    """Compare strided detections with the detections of every frame
+
+    Args:
+        detections: list of per-frame detection dictionaries of the strided detector
+        ground_truth: list of per-frame detection dictionaries of the stub
+
+    Returns:
+        dict: mean IoU (missing boxes count as 0), recall of the boxes and mean/max center error in pixels of the found boxes
+    """
+    ious = []
+    center_errors = []
+    for frame_dict, ground_truth_dict in zip(detections, ground_truth):
+        for track_id, ground_truth_bbox in ground_truth_dict.items():
+            bbox = frame_dict.get(track_id)
+            if bbox is None:
+                ious.append(0.0)
+                continue
+            ious.append(get_iou(bbox, ground_truth_bbox))
+            center_errors.append(np.hypot((bbox[0] + bbox[2] - ground_truth_bbox[0] - ground_truth_bbox[2]) / 2,
+                                          (bbox[1] + bbox[3] - ground_truth_bbox[1] - ground_truth_bbox[3]) / 2))
+    return {
+        'mean_iou': float(np.mean(ious)),
+        'recall': len(center_errors) / len(ious),
+        'mean_center_error': float(np.mean(center_errors)),
+        'max_center_error': float(np.max(center_errors)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stub", default="tracker_stubs/player_detections.pkl")
+    parser.add_argument("--strides", type=int, nargs="+", default=[1, 2, 3, 4, 6, 8])
+    parser.add_argument("--motion-thresholds", type=float, nargs="+", default=[0.1, 0.25, 1000.0],
+                        help="motion thresholds in box heights, a large value never falls back to every-frame detection")
+    args = parser.parse_args()
+
+    with open(args.stub, 'rb') as f:
+        ground_truth = pickle.load(f)
+    number_of_frames = len(ground_truth)
+
+    print(f"{'stride':>6} {'threshold':>10} {'detected':>9} {'speedup':>8} {'mean IoU':>9} {'recall':>7} {'mean err px':>12} {'max err px':>11}")
+    for stride in args.strides:
+        for motion_threshold in args.motion_thresholds:
+            # the frames are the frame indices, and detecting a frame looks it up in the stub
+            strided_detector = StridedDetector(lambda frame_num: ground_truth[frame_num], stride, motion_threshold)
+            detections = strided_detector.detect_frames(range(number_of_frames))
+            metrics = evaluate(detections, ground_truth)
+            speedup = number_of_frames / strided_detector.number_of_detected_frames
+            print(f"{stride:>6} {motion_threshold:>10g} {strided_detector.number_of_detected_frames:>9} {speedup:>8.2f} "
+                  f"{metrics['mean_iou']:>9.3f} {metrics['recall']:>7.3f} {metrics['mean_center_error']:>12.2f} {metrics['max_center_error']:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,450 @@
+"""Benchmark harness of the analysis stages, without model weights. The detections are the stub detections tiled to the
+requested number of frames (or synthetic detections with --synthetic), and the video is a synthetic video of the court with
+the players and the ball drawn at their detections. Each stage of main.py after detection is timed:
+
+    decode            decoding the video frame by frame
+    detect_from_cache reading the detections from a DetectionCache, as a re-run of main.py does, into DetectionTables
+    interpolate       BallTracker.interpolate_ball_positions
+    shot_detection    BallTracker.get_ball_shot_frames
+    projection_*      MiniCourt.convert_bounding_boxes_to_mini_court_coordinates, for each projection method
+    stats             MatchStatsAccumulator over the shots
+    draw              the FrameCompositor layers of main.py, with a breakdown per layer
+    encode            encoding the annotated video
+
+and the throughput (frames/sec) and the peak RSS after the stage are reported. The results are written as JSON, and compared
+with the JSON of a previous run given with --baseline.
+
+Run from the root of the repository:
+    python -m benchmarks.run_benchmarks --frames 5000 --output benchmark_results.json
+    python -m benchmarks.run_benchmarks --frames 5000 --baseline benchmark_results.json --tolerance 0.1
+"""
+import argparse
+import datetime
+import json
+import os
+import pickle
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+import pandas as pd
+
+from Trackers import PlayerTracker, BallTracker
+from Utils import DetectionCache, DetectionTable, MatchStatsAccumulator, PlayerStatsPanel, PLAYER_STATS_COLUMNS, iter_video_frames, get_video_writer
+from mini_court.mini_court import MiniCourt
+from pipeline import FrameCompositor
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# court keypoints of a broadcast view of the court in a 1920x1080 frame, in the order of the keypoints model
+COURT_KEYPOINTS_1080P = [574, 307, 1335, 307, 300, 860, 1600, 860, 669, 307, 462, 860, 1240, 307, 1438, 860,
+                         621, 435, 1286, 435, 510, 732, 1392, 732, 954, 435, 951, 732]
+
+
+def get_peak_rss_mb():
+    """Get the peak resident set size of the process
+
+    Returns:
+        float: peak RSS in MB, None where the resource module is not available
+    """
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    return peak_rss / 1024**2 if sys.platform == 'darwin' else peak_rss / 1024
+
+
+def get_environment():
+    """Get the versions the benchmark ran with, to tell apart changes of the code from changes of the environment
+
+    Returns:
+        dict: python, numpy, pandas and OpenCV versions, platform, number of cores and git commit
+    """
+    try:
+        git_commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        git_commit = None
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'opencv': cv2.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'git_commit': git_commit,
+    }
+
+
+def tile_detections(detections, number_of_frames):
+    """Repeat per-frame detections until there are number_of_frames frames
+
+    Args:
+        detections: list of per-frame detection dictionaries
+        number_of_frames (int): number of frames of the tiled detections
+
+    Returns:
+        list: the tiled per-frame detection dictionaries
+    """
+    return [detections[frame_num % len(detections)] for frame_num in range(number_of_frames)]
+
+
+def scale_detections(detections, scale_x, scale_y):
+    """Scale the bounding boxes of per-frame detections
+
+    Args:
+        detections: list of per-frame detection dictionaries
+        scale_x (float): horizontal scale
+        scale_y (float): vertical scale
+
+    Returns:
+        list: the scaled per-frame detection dictionaries
+    """
+    return [{track_id: [bbox[0]*scale_x, bbox[1]*scale_y, bbox[2]*scale_x, bbox[3]*scale_y] for track_id, bbox in frame_dict.items()}
+            for frame_dict in detections]
+
+
+def generate_detections(number_of_frames, width, height, missing_ball_ratio=0.3, seed=0):
+    """Generate player and ball detections of a rally: the players move along the baselines, and the ball travels between
+    them in about 1.5 seconds per shot, with some frames missing the ball
+
+    Args:
+        number_of_frames (int): number of frames
+        width (int): width of the frames
+        height (int): height of the frames
+        missing_ball_ratio (float): fraction of the frames without a ball detection, defaults to 0.3
+        seed (int): seed of the random generator, defaults to 0
+
+    Returns:
+        tuple: (player detections, ball detections) as lists of per-frame detection dictionaries
+    """
+    rng = np.random.default_rng(seed)
+    frame_nums = np.arange(number_of_frames)
+    player_1_x = width * (0.45 + 0.12*np.sin(frame_nums / 37)) + rng.normal(0, 2, number_of_frames)
+    player_2_x = width * (0.5 + 0.08*np.sin(frame_nums / 29 + 1)) + rng.normal(0, 2, number_of_frames)
+    player_1_y = height * (0.8 + 0.02*np.sin(frame_nums / 23))
+    player_2_y = height * (0.27 + 0.01*np.sin(frame_nums / 19))
+
+    shot_frames = 36
+    # the ball goes down to player 1 then up to player 2
+    phase = (frame_nums % (2*shot_frames)) / shot_frames
+    progress = np.where(phase < 1, phase, 2 - phase)
+    ball_x = player_2_x + (player_1_x - player_2_x) * progress
+    ball_y = player_2_y - height*0.05 + (player_1_y - player_2_y) * progress - height*0.15*np.sin(np.pi*progress)
+    ball_detected = rng.random(number_of_frames) >= missing_ball_ratio
+
+    player_detections = []
+    ball_detections = []
+    ball_size = height * 0.012
+    for frame_num in range(number_of_frames):
+        player_detections.append({
+            1: [player_1_x[frame_num] - width*0.04, player_1_y[frame_num] - height*0.17, player_1_x[frame_num] + width*0.04, player_1_y[frame_num]],
+            2: [player_2_x[frame_num] - width*0.02, player_2_y[frame_num] - height*0.1, player_2_x[frame_num] + width*0.02, player_2_y[frame_num]],
+        })
+        if ball_detected[frame_num]:
+            ball_detections.append({1: [ball_x[frame_num] - ball_size, ball_y[frame_num] - ball_size, ball_x[frame_num] + ball_size, ball_y[frame_num] + ball_size]})
+        else:
+            ball_detections.append({})
+    return player_detections, ball_detections
+
+
+def write_synthetic_video(video_path, player_detections, ball_detections, court_keypoints, width, height, fps):
+    """Write a video of a court with the players and the ball drawn at their detections, so that the frames change
+    as the frames of a match do
+
+    Args:
+        video_path (str): path of the video
+        player_detections: list of per-frame player detection dictionaries
+        ball_detections: list of per-frame ball detection dictionaries
+        court_keypoints: court keypoints, as a flat list of x, y
+        width (int): width of the frames
+        height (int): height of the frames
+        fps (float): frame rate of the video
+    """
+    background = np.full((height, width, 3), (60, 120, 70), dtype=np.uint8)
+    keypoints = np.asarray(court_keypoints).reshape(-1, 2).astype(np.int32)
+    court_lines = [(0, 1), (2, 3), (0, 2), (1, 3), (4, 5), (6, 7), (8, 9), (10, 11), (12, 13)]
+    cv2.fillConvexPoly(background, keypoints[[0, 1, 3, 2]], (150, 90, 60))
+    for start, end in court_lines:
+        cv2.line(background, tuple(keypoints[start].tolist()), tuple(keypoints[end].tolist()), (255, 255, 255), 3)
+    rng = np.random.default_rng(0)
+    noise = rng.integers(0, 12, size=(height, width, 3), dtype=np.uint8)
+
+    writer = get_video_writer(video_path, fps)
+    for frame_num, (player_dict, ball_dict) in enumerate(zip(player_detections, ball_detections)):
+        frame = background.copy()
+        # some sensor noise shifting every frame, which the encoders have to code
+        frame += np.roll(noise, frame_num % 7, axis=1)
+        for bbox in player_dict.values():
+            cv2.rectangle(frame, (int(bbox[0]), int(bbox[1])), (int(bbox[2]), int(bbox[3])), (40, 40, 200), -1)
+        for bbox in ball_dict.values():
+            cv2.circle(frame, (int((bbox[0]+bbox[2])/2), int((bbox[1]+bbox[3])/2)), max(int((bbox[2]-bbox[0])/2), 2), (80, 240, 240), -1)
+        writer.write(frame)
+    writer.close()
+
+
+def write_detection_cache(cache_dir, video_path, name, detections):
+    """Save detections to a DetectionCache, as a first run of main.py does
+
+    Args:
+        cache_dir (str): directory of the caches
+        video_path (str): path of the video the detections belong to
+        name (str): name of the detections, e.g. "players", in the cache key
+        detections: list of per-frame detection dictionaries
+
+    Returns:
+        DetectionCache: the complete cache
+    """
+    # there are no model weights to key the cache with, so the video stands for the model file
+    cache = DetectionCache(cache_dir, video_path, video_path, {'detections': name})
+    for chunk_index, chunk_start in enumerate(range(0, len(detections), cache.chunk_size)):
+        cache.save_chunk(chunk_index, detections[chunk_start:chunk_start + cache.chunk_size])
+    cache.mark_complete(len(detections))
+    return cache
+
+
+class StageTimer:
+    """
+    Class to time the stages of the benchmark. A stage is run repeats times and its fastest run is kept, and the peak RSS
+    of the process is sampled after it.
+    """
+    def __init__(self, number_of_frames, repeats=1):
+        """Constructor for StageTimer class
+
+        Args:
+            number_of_frames (int): number of frames processed by each stage
+            repeats (int): number of runs of the stages timed with run(), defaults to 1
+        """
+        self.number_of_frames = number_of_frames
+        self.repeats = repeats
+        self.stages = {}
+
+    def run(self, name, function, *args, **kwargs):
+        """Time a stage
+
+        Args:
+            name (str): name of the stage
+            function: function running the stage
+            *args, **kwargs: arguments of the function
+
+        Returns:
+            the output of the last run of the function
+        """
+        seconds = []
+        for _ in range(self.repeats):
+            start_time = time.perf_counter()
+            output = function(*args, **kwargs)
+            seconds.append(time.perf_counter() - start_time)
+        self.add(name, min(seconds))
+        return output
+
+    def add(self, name, seconds, **extra):
+        """Record the time of a stage timed by the caller
+
+        Args:
+            name (str): name of the stage
+            seconds (float): time spent in the stage
+            **extra: other results of the stage
+        """
+        self.stages[name] = {
+            'seconds': seconds,
+            'fps': self.number_of_frames / seconds if seconds > 0 else None,
+            'peak_rss_mb': get_peak_rss_mb(),
+            **extra,
+        }
+
+
+def run_benchmarks(args, work_dir):
+    """Run all the stages
+
+    Args:
+        args: parsed command line arguments
+        work_dir (str): directory of the synthetic video, the detection caches and the output video
+
+    Returns:
+        dict: results of the stages, keyed by stage name
+    """
+    width, height = args.width, args.height
+    scale_x, scale_y = width / 1920, height / 1080
+    court_keypoints = [value * (scale_x if index % 2 == 0 else scale_y) for index, value in enumerate(COURT_KEYPOINTS_1080P)]
+    if args.synthetic:
+        player_detections, ball_detections = generate_detections(args.frames, width, height)
+    else:
+        with open(args.player_stub, 'rb') as f:
+            player_detections = scale_detections(tile_detections(pickle.load(f), args.frames), scale_x, scale_y)
+        with open(args.ball_stub, 'rb') as f:
+            ball_detections = scale_detections(tile_detections(pickle.load(f), args.frames), scale_x, scale_y)
+
+    video_path = os.path.join(work_dir, "input_video.avi")
+    write_synthetic_video(video_path, player_detections, ball_detections, court_keypoints, width, height, args.fps)
+    cache_dir = os.path.join(work_dir, "cache")
+    player_cache = write_detection_cache(cache_dir, video_path, "players", player_detections)
+    ball_cache = write_detection_cache(cache_dir, video_path, "ball", ball_detections)
+    del player_detections, ball_detections
+
+    timer = StageTimer(args.frames, args.repeats)
+    # the trackers are only used for their methods, so the models are not loaded
+    player_tracker = PlayerTracker.__new__(PlayerTracker)
+    ball_tracker = BallTracker.__new__(BallTracker)
+
+    def load_detections():
+        return DetectionTable.from_dicts(player_cache.load_all()), DetectionTable.from_dicts(ball_cache.load_all())
+    player_detections, ball_detections = timer.run('detect_from_cache', load_detections)
+    # the players of the stubs are tracks 1 and 2, as chosen by main.py
+    player_detections = player_detections.filter_tracks([1, 2])
+
+    ball_detections = timer.run('interpolate', ball_tracker.interpolate_ball_positions, ball_detections)
+    ball_shot_frames = timer.run('shot_detection', ball_tracker.get_ball_shot_frames, ball_detections)
+
+    first_frame = next(iter_video_frames(video_path))
+    mini_court = MiniCourt(first_frame)
+    for projection_method in args.projection_methods:
+        mini_court_detections = timer.run(f'projection_{projection_method}', mini_court.convert_bounding_boxes_to_mini_court_coordinates,
+                                          player_detections, ball_detections, court_keypoints, projection_method)
+        if projection_method == args.projection_methods[0]:
+            player_mini_court_detections, ball_mini_court_detections = mini_court_detections
+
+    def accumulate_stats():
+        match_stats = MatchStatsAccumulator()
+        for start_frame, end_frame in zip(ball_shot_frames, ball_shot_frames[1:]):
+            # shots missing a player or the ball are skipped, which the stub tracks do not have
+            if end_frame >= len(ball_mini_court_detections) or not {1, 2} <= set(player_mini_court_detections[start_frame]).intersection(player_mini_court_detections[end_frame]):
+                continue
+            match_stats.add_shot_from_positions(start_frame, (end_frame - start_frame) / args.fps,
+                                                player_mini_court_detections[start_frame], ball_mini_court_detections[start_frame][1],
+                                                player_mini_court_detections[end_frame], ball_mini_court_detections[end_frame][1],
+                                                mini_court.get_width_of_mini_court())
+        return match_stats
+    match_stats = timer.run('stats', accumulate_stats)
+
+    # the layers of main.py, the court keypoints layer needing the keypoints model module and its dependencies
+    player_stats_panel = PlayerStatsPanel()
+    layers = [
+        ('player_bboxes', lambda frame, frame_num: player_tracker.draw_frame_bboxes(frame, player_detections[frame_num])),
+        ('ball_bboxes', lambda frame, frame_num: ball_tracker.draw_frame_bboxes(frame, ball_detections[frame_num])),
+    ]
+    try:
+        from court_line_detector import CourtLineDetector
+        court_line_detector = CourtLineDetector.__new__(CourtLineDetector)
+        layers.append(('court_keypoints', lambda frame, frame_num: court_line_detector.draw_keypoints(frame, court_keypoints)))
+    except ImportError:
+        print("court_line_detector could not be imported, the court keypoints layer is not drawn")
+    layers += [
+        ('mini_court', lambda frame, frame_num: mini_court.draw_overlay(frame)),
+        ('mini_court_players', lambda frame, frame_num: mini_court.draw_frame_points(frame, player_mini_court_detections[frame_num], (0, 255, 0))),
+        ('mini_court_ball', lambda frame, frame_num: mini_court.draw_frame_points(frame, ball_mini_court_detections[frame_num] if frame_num < len(ball_mini_court_detections) else {}, (0, 255, 255))),
+        ('player_stats', lambda frame, frame_num: player_stats_panel.draw(frame, match_stats.values_at(frame_num, PLAYER_STATS_COLUMNS))),
+        ('frame_number', lambda frame, frame_num: cv2.putText(frame, f"Frame: {frame_num+1}", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2, cv2.LINE_AA)),
+    ]
+    compositor = FrameCompositor(layers)
+
+    # decoding, drawing and encoding run frame by frame, as in main.py, and are timed separately
+    writer = get_video_writer(os.path.join(work_dir, f"output_video.{args.output_extension}"), args.fps, args.writer_backend)
+    decode_seconds = draw_seconds = encode_seconds = 0.0
+    frames = iter_video_frames(video_path)
+    frame_num = 0
+    while True:
+        start_time = time.perf_counter()
+        frame = next(frames, None)
+        decode_seconds += time.perf_counter() - start_time
+        if frame is None:
+            break
+        start_time = time.perf_counter()
+        compositor.compose_frame(frame, frame_num, timed=True)
+        draw_seconds += time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        writer.write(frame)
+        encode_seconds += time.perf_counter() - start_time
+        frame_num += 1
+    start_time = time.perf_counter()
+    writer.close()
+    encode_seconds += time.perf_counter() - start_time
+
+    timer.add('decode', decode_seconds)
+    timer.add('draw', draw_seconds, layers={name: seconds for name, seconds in compositor.layer_seconds.items()})
+    timer.add('encode', encode_seconds, backend=args.writer_backend)
+    return timer.stages
+
+
+def compare_with_baseline(stages, baseline_stages, tolerance):
+    """Compare the stage times with a previous run
+
+    Args:
+        stages: results of the stages of this run
+        baseline_stages: results of the stages of the previous run
+        tolerance (float): relative slowdown above which a stage is reported as a regression
+
+    Returns:
+        list: names of the stages slower than the baseline by more than tolerance
+    """
+    regressions = []
+    print(f"\n{'stage':<24} {'baseline s':>11} {'s':>11} {'speedup':>8}")
+    for name, stage in stages.items():
+        if name not in baseline_stages:
+            continue
+        baseline_seconds = baseline_stages[name]['seconds']
+        speedup = baseline_seconds / stage['seconds'] if stage['seconds'] > 0 else float('inf')
+        regression = stage['seconds'] > baseline_seconds * (1 + tolerance)
+        if regression:
+            regressions.append(name)
+        print(f"{name:<24} {baseline_seconds:>11.4f} {stage['seconds']:>11.4f} {speedup:>7.2f}x{'  REGRESSION' if regression else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=2000, help="number of frames of the benchmark video")
+    parser.add_argument("--synthetic", action="store_true", help="generate the detections instead of tiling the stubs")
+    parser.add_argument("--player-stub", default="tracker_stubs/player_detections.pkl")
+    parser.add_argument("--ball-stub", default="tracker_stubs/ball_detections.pkl")
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--fps", type=float, default=24)
+    parser.add_argument("--projection-methods", nargs="+", default=["homography", "height"], choices=["homography", "height"],
+                        help="projection methods to time, the first one is drawn")
+    parser.add_argument("--writer-backend", default="cv2", choices=["cv2", "ffmpeg"])
+    parser.add_argument("--output-extension", default="avi", help="extension of the encoded video, e.g. mp4 for ffmpeg")
+    parser.add_argument("--repeats", type=int, default=3, help="runs of the stages between decoding and drawing, the fastest is kept")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file of the results")
+    parser.add_argument("--baseline", default=None, help="JSON file of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative slowdown reported as a regression")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        stages = run_benchmarks(args, work_dir)
+
+    print(f"{'stage':<24} {'seconds':>9} {'frames/sec':>11} {'peak RSS MB':>12}")
+    for name, stage in stages.items():
+        fps = f"{stage['fps']:.1f}" if stage['fps'] is not None else '-'
+        peak_rss = f"{stage['peak_rss_mb']:.0f}" if stage['peak_rss_mb'] is not None else '-'
+        print(f"{name:<24} {stage['seconds']:>9.4f} {fps:>11} {peak_rss:>12}")
+    for name, seconds in stages['draw']['layers'].items():
+        print(f"{'  draw/' + name:<24} {seconds:>9.4f}")
+
+    results = {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'config': vars(args),
+        'environment': get_environment(),
+        'peak_rss_mb': get_peak_rss_mb(),
+        'stages': stages,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nresults written to {args.output}")
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(stages, baseline['stages'], args.tolerance)
+        if regressions:
+            sys.exit(f"regressions: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
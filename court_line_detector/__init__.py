@@ -1 +1,2 @@
-from .court_line_detector import CourtLineDetector
\ No newline at end of file
+from .court_line_detector import CourtLineDetector
+from .keypoint_scheduler import KeypointScheduler
\ No newline at end of file
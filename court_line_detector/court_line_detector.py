@@ -1,28 +1,60 @@
-import torch
-import torchvision.transforms as transforms
 import cv2
-import torchvision.models as models
+import numpy as np
+from Utils.keypoint_segments import CourtKeypointSegments
+from Utils.instrumentation import timed
+from Utils.model_registry import model_registry
 
 class CourtLineDetector:
     """
     Class to detect keypoints on the court line. The model is a ResNet50 model with the last layer replaced with a linear layer with 28 output features (14 keypoints with x and y coordinates each).
+    torch and torchvision are imported and the model is built when the detector first runs it (see ModelRegistry).
     """
-    def __init__(self, model_path):
-        """Initializes the model and the transformation to be applied to the image before passing it through the model.
+    def __init__(self, model_path, channels_last=False, num_threads=None):
+        """Initializes the transformation to be applied to the image before passing it through the model.
 
         Args:
             model_path (str): Path to the model file
+            channels_last (bool): Run the model in channels-last memory format, which is faster on most CPUs. Defaults to False
+            num_threads (int): Number of threads used by torch on CPU, None to keep the torch default. Defaults to None
         """
-        self.model = models.resnet50(pretrained=False)
-        self.model.fc = torch.nn.Linear(in_features=self.model.fc.in_features, out_features=14*2)
-        self.model.load_state_dict(torch.load(model_path, map_location='cpu'))
-        self.transform = transforms.Compose([
-            transforms.ToPILImage(),
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-        ])
-    
+        if num_threads is not None:
+            import torch
+            torch.set_num_threads(num_threads)
+        self.model_path = model_path
+        self.channels_last = channels_last
+        self.transform = None
+
+        # per channel scale and offset of predict_batch() for RGB pixels, so that pixel*scale - offset = (pixel/255 - mean)/std
+        mean = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+        std = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+        self.input_scale = 1.0/(255.0*std)
+        self.input_offset = mean/std
+        self.input_buffer = None
+        self.resize_buffer = np.empty((224, 224, 3), dtype=np.uint8)
+
+    @property
+    def model(self):
+        """ResNet50 keypoints model, loaded on first use and shared with the other detectors of the same weights (see ModelRegistry)"""
+        return model_registry.get(('keypoints', self.model_path, self.channels_last), self.load_model)
+
+    def load_model(self):
+        """Build the ResNet50 keypoints model and load its weights
+
+        Returns:
+            the model in evaluation mode
+        """
+        import torch
+        import torchvision.models as models
+        model = models.resnet50(pretrained=False)
+        model.fc = torch.nn.Linear(in_features=model.fc.in_features, out_features=14*2)
+        model.load_state_dict(torch.load(self.model_path, map_location='cpu'))
+        # batch norm must use the running statistics, otherwise the keypoints of an image depend on the other images of its batch
+        model.eval()
+        if self.channels_last:
+            model = model.to(memory_format=torch.channels_last)
+        return model
+
+    @timed(count_frames=1)
     def predict(self,image):
         """Predict keypoints on the image. The image is first converted to RGB, transformed and then passed through the model. The keypoints are then converted to original image size.
 
@@ -32,6 +64,15 @@ class CourtLineDetector:
         Returns:
             keypoints: List of keypoints
         """
+        import torch
+        if self.transform is None:
+            import torchvision.transforms as transforms
+            self.transform = transforms.Compose([
+                transforms.ToPILImage(),
+                transforms.Resize((224, 224)),
+                transforms.ToTensor(),
+                transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+            ])
         img_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
         img_tensor = self.transform(img_rgb).unsqueeze(0)   # will convert the image to list of images with only 1 image
 
@@ -46,6 +87,65 @@ class CourtLineDetector:
 
         return keypoints
 
+    def get_input_buffer(self, batch_size):
+        """Get the preallocated input buffer of predict_batch(), growing it if the batch is larger than any previous batch
+
+        Args:
+            batch_size (int): number of images in the batch
+
+        Returns:
+            tensor of shape (batch_size, 224, 224, 3) of float32
+        """
+        import torch
+        if self.input_buffer is None or self.input_buffer.shape[0] < batch_size:
+            self.input_buffer = torch.empty((batch_size, 224, 224, 3), dtype=torch.float32)
+        return self.input_buffer[:batch_size]
+
+    @timed(count_frames=len)
+    def predict_batch(self, images, batch_size=16):
+        """Predict keypoints on many images. Each image is resized with cv2 and normalized with NumPy straight into a preallocated
+        buffer, with no PIL image or intermediate tensors, and the model runs on batches of images under torch.inference_mode.
+        The resize uses cv2.INTER_AREA, whereas predict() uses the bilinear Resize of torchvision on a PIL image, which antialiases
+        when downscaling: INTER_AREA is the closest cv2 filter, but the inputs differ slightly and so may the keypoints.
+        The resize and input buffers are shared by all the calls, so a CourtLineDetector must not run predict_batch from more than
+        one thread at a time.
+
+        Args:
+            images: List of images (BGR) on which to predict keypoints
+            batch_size (int): Number of images passed through the model at a time. Defaults to 16
+
+        Returns:
+            keypoints: List of keypoints, one array per image
+        """
+        import torch
+        keypoints = []
+        for batch_start in range(0, len(images), batch_size):
+            batch_images = images[batch_start:batch_start+batch_size]
+            input_buffer = self.get_input_buffer(len(batch_images))
+            input_array = input_buffer.numpy()
+            for i, image in enumerate(batch_images):
+                cv2.resize(image, (224, 224), dst=self.resize_buffer, interpolation=cv2.INTER_AREA)
+                # reversing the channels converts BGR to RGB
+                np.multiply(self.resize_buffer[:, :, ::-1], self.input_scale, out=input_array[i])
+                np.subtract(input_array[i], self.input_offset, out=input_array[i])
+
+            # (N, H, W, C) memory is the channels-last layout of an (N, C, H, W) tensor
+            img_tensor = input_buffer.permute(0, 3, 1, 2)
+            if not self.channels_last:
+                img_tensor = img_tensor.contiguous()
+
+            with torch.inference_mode():
+                outputs = self.model(img_tensor)
+
+            batch_keypoints = outputs.cpu().numpy()
+            for image, image_keypoints in zip(batch_images, batch_keypoints):
+                original_h, original_w = image.shape[:2]
+                image_keypoints[::2] *= original_w/224.0
+                image_keypoints[1::2] *= original_h/224.0
+                keypoints.append(image_keypoints)
+
+        return keypoints
+
     def draw_keypoints(self, image, keypoints):
         """Draw keypoints on the image
 
@@ -63,18 +163,20 @@ class CourtLineDetector:
             cv2.circle(image, (x, y), 6, (0, 255, 0), -1)
         return image
     
-    def draw_keypoints_on_video(self, video_frames, keypoints):
+    def draw_keypoints_on_video(self, video_frames, keypoints, start_frame=0):
         """Draw keypoints on the video frames. Calls draw_keypoints on each frame.
 
         Args:
-            video_frames: List of video frames
-            keypoints: List of keypoints
+            video_frames: List or iterable of video frames
+            keypoints: List of keypoints, or CourtKeypointSegments to look them up by frame
+            start_frame: index of the first frame of video_frames in the video, defaults to 0
 
         Returns:
             output_frames: List of video frames with keypoints drawn on them
         """
         output_frames = []
-        for frame in video_frames:
-            frame = self.draw_keypoints(frame, keypoints)
+        for frame_num, frame in enumerate(video_frames, start_frame):
+            frame_keypoints = keypoints.get_keypoints(frame_num) if isinstance(keypoints, CourtKeypointSegments) else keypoints
+            frame = self.draw_keypoints(frame, frame_keypoints)
             output_frames.append(frame)
         return output_frames
\ No newline at end of file
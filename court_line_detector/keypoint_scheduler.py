@@ -0,0 +1,143 @@
+import cv2
+import numpy as np
+from Utils.keypoint_segments import CourtKeypointSegments
+from Utils.instrumentation import timed
+
+
+class KeypointScheduler:
+    """
+    Class to decide on which frames to run CourtLineDetector. Running the keypoint model on every frame is too costly,
+    so keypoints are re-detected only when a cheap scene-change signal fires (the mean absolute difference between small
+    grayscale thumbnails of the frame and of the frame the current keypoints were detected on), or every redetect_interval frames.
+    """
+    def __init__(self, court_line_detector, difference_threshold=25.0, redetect_interval=None, thumbnail_size=(64, 36), batch_size=8):
+        """Constructor for KeypointScheduler class
+
+        Args:
+            court_line_detector (CourtLineDetector): detector used on the scheduled frames
+            difference_threshold (float): mean absolute difference in gray levels (0-255) above which the scene is considered changed, defaults to 25
+            redetect_interval (int): maximum number of frames between two detections, None to only re-detect on scene changes, defaults to None
+            thumbnail_size (tuple): (width, height) of the thumbnails compared, defaults to (64, 36)
+            batch_size (int): number of scheduled frames passed to CourtLineDetector.predict_batch() at a time, defaults to 8
+        """
+        self.court_line_detector = court_line_detector
+        self.difference_threshold = difference_threshold
+        self.redetect_interval = redetect_interval
+        self.thumbnail_size = thumbnail_size
+        self.batch_size = batch_size
+        # state of update(), for frames arriving one at a time
+        self.last_detection_frame = None
+        self.reference_thumbnail = None
+        self.keypoints = None
+
+    def get_thumbnail(self, frame):
+        """Get the small grayscale thumbnail of a frame used for the scene-change signal
+
+        Args:
+            frame: BGR frame
+
+        Returns:
+            array of shape (height, width) of float32 gray levels
+        """
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(gray, self.thumbnail_size, interpolation=cv2.INTER_AREA).astype(np.float32)
+
+    def get_scene_difference(self, thumbnail, reference_thumbnail):
+        """Get the scene-change signal between two thumbnails
+
+        Args:
+            thumbnail: thumbnail of the current frame
+            reference_thumbnail: thumbnail of the frame the current keypoints were detected on
+
+        Returns:
+            float: mean absolute difference in gray levels
+        """
+        return float(np.mean(np.abs(thumbnail - reference_thumbnail)))
+
+    def should_redetect(self, frame_num, thumbnail, last_detection_frame, reference_thumbnail):
+        """Check if the keypoints should be re-detected on a frame
+
+        Args:
+            frame_num (int): index of the frame
+            thumbnail: thumbnail of the frame
+            last_detection_frame (int): index of the frame the current keypoints were detected on, None if there is none yet
+            reference_thumbnail: thumbnail of that frame
+
+        Returns:
+            bool: True if the keypoints should be re-detected
+        """
+        if last_detection_frame is None:
+            return True
+        if self.redetect_interval is not None and frame_num - last_detection_frame >= self.redetect_interval:
+            return True
+        return self.get_scene_difference(thumbnail, reference_thumbnail) > self.difference_threshold
+
+    @timed()
+    def detect_keypoints(self, frames):
+        """Detect the court keypoints of a video, re-running the detector only on the scheduled frames.
+        The schedule only depends on the thumbnails, so the scheduled frames are collected and passed to the detector in batches.
+
+        Args:
+            frames: list or iterable of frames of the video
+
+        Returns:
+            CourtKeypointSegments: keypoints of each segment of the video, looked up by frame index
+        """
+        segments = CourtKeypointSegments()
+        scheduled_frame_nums = []
+        scheduled_frames = []
+
+        def detect_scheduled_frames():
+            keypoints = self.court_line_detector.predict_batch(scheduled_frames, batch_size=self.batch_size)
+            for frame_num, frame_keypoints in zip(scheduled_frame_nums, keypoints):
+                segments.add_segment(frame_num, frame_keypoints)
+            scheduled_frame_nums.clear()
+            scheduled_frames.clear()
+
+        last_detection_frame = None
+        reference_thumbnail = None
+        for frame_num, frame in enumerate(frames):
+            thumbnail = self.get_thumbnail(frame)
+            if self.should_redetect(frame_num, thumbnail, last_detection_frame, reference_thumbnail):
+                scheduled_frame_nums.append(frame_num)
+                scheduled_frames.append(frame)
+                last_detection_frame = frame_num
+                reference_thumbnail = thumbnail
+                if len(scheduled_frames) == self.batch_size:
+                    detect_scheduled_frames()
+        if scheduled_frames:
+            detect_scheduled_frames()
+        return segments
+
+    def schedule(self, frame_num, frame):
+        """Check if the next frame of a video is scheduled for a keypoint detection, the schedule then assuming it is detected.
+        Used to collect the scheduled frames of several videos into shared batches of the detector (see BatchRunner).
+
+        Args:
+            frame_num (int): index of the frame, frames being passed in order
+            frame: the frame
+
+        Returns:
+            bool: True if the keypoints should be detected on the frame
+        """
+        thumbnail = self.get_thumbnail(frame)
+        if not self.should_redetect(frame_num, thumbnail, self.last_detection_frame, self.reference_thumbnail):
+            return False
+        self.last_detection_frame = frame_num
+        self.reference_thumbnail = thumbnail
+        return True
+
+    @timed(count_frames=1)
+    def update(self, frame_num, frame):
+        """Get the keypoints of the next frame of a live video, running the detector right away when the frame is scheduled
+
+        Args:
+            frame_num (int): index of the frame, frames being passed in order
+            frame: the frame
+
+        Returns:
+            keypoints of the frame
+        """
+        if self.schedule(frame_num, frame):
+            self.keypoints = self.court_line_detector.predict_batch([frame], batch_size=1)[0]
+        return self.keypoints
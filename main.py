@@ -1,125 +1,304 @@
 # we will run the video frame by frame, detect and save it frame by frame
 # the code for this is under utils/video_utils.py
-from Utils import read_video, save_video, measure_distance, draw_player_stats, convert_meters_to_pixel_distance, convert_pixel_distance_to_meters
-from Trackers import PlayerTracker, BallTracker
-from court_line_detector import CourtLineDetector
+from Utils import timer, timer_registry, PLAYER_STATS_COLUMNS, read_first_frame, get_video_fps, InferenceRegion, to_detection_table, MatchStatsAccumulator, PlayerStatsPanel
+from Trackers import PlayerTracker, BallTracker, BallKalmanFilter, WindowedBallDetector
+from court_line_detector import CourtLineDetector, KeypointScheduler
+import argparse
+import os
 import cv2
 from mini_court.mini_court import MiniCourt
-from copy import deepcopy
-import pandas as pd
-import constants
+from pipeline import ThreadedPipeline, ThreadedVideoReader, FrameCompositor, ShardedRunner, LivePipeline, BatchRunner, get_batch_clips
 
 
-def main():
-    
-    # read video
-    input_video_path = "Media/input_video.mp4"
-    video_frames = read_video(input_video_path)
-    
-    # detect players and ball
-    player_tracker = PlayerTracker("Models/yolov8x.pt")
-    ball_tracker = BallTracker("Models/yolov5_best.pt")
-    player_detections = player_tracker.detect_frames(video_frames, read_from_stub=True, stub_path="tracker_stubs/player_detections.pkl")
-    ball_detections = ball_tracker.detect_frames(video_frames, read_from_stub=True, stub_path="tracker_stubs/ball_detections.pkl")
-    ball_detections = ball_tracker.interpolate_ball_positions(ball_detections)
+def annotate_video(input_video_path, output_video_path, court_line_detector_obj, player_tracker, ball_tracker, court_keypoints, player_detections,
+                   ball_detections, first_frame, fps, chunk_size=64, queue_size=4, projection_method="homography", writer_backend="cv2", writer_options=None):
+    """Run the analysis of a video from its detections: interpolate the ball, choose the players, detect the shots, convert the positions
+    to the mini court, accumulate the stats, and draw and save the annotated video chunk by chunk.
 
-    # detecting courtline keypoints
-    keypoints_model_path = "Models/keypoints_model.pth"
-    court_line_detector_obj = CourtLineDetector(keypoints_model_path)
-    court_keypoints = court_line_detector_obj.predict(video_frames[0])
+    Args:
+        input_video_path: path to the input video
+        output_video_path: path to save the annotated video
+        court_line_detector_obj: CourtLineDetector drawing the court keypoints
+        player_tracker: PlayerTracker choosing and drawing the players
+        ball_tracker: BallTracker interpolating and drawing the ball
+        court_keypoints: CourtKeypointSegments of the video
+        player_detections: player detections of each frame, as dictionaries or a DetectionTable
+        ball_detections: ball detections of each frame, as dictionaries or a DetectionTable
+        first_frame: first frame of the video, used for the mini court layout
+        fps: frame rate of the video, used for the speeds and the output video
+        chunk_size: number of frames held in memory at a time
+        queue_size: number of chunks that can wait between the decoding, processing and encoding stages
+        projection_method: "homography" or "height", how positions are converted to mini court coordinates
+        writer_backend: "cv2" or "ffmpeg", see main()
+        writer_options: options of the video writer, see main()
+    """
+    # the mini court conversion needs the chosen players and the interpolated ball of the whole video, so it runs after stitching
+    player_detections = to_detection_table(player_detections)
+    ball_detections = to_detection_table(ball_detections)
+    ball_detections = ball_tracker.interpolate_ball_positions(ball_detections)
 
     # filter only player trackers
-    player_detections = player_tracker.choose_and_filter_players(court_keypoints, player_detections)
+    player_detections = player_tracker.choose_and_filter_players(court_keypoints.get_keypoints(0), player_detections)
 
     # Initialize MiniCourt
-    mini_court = MiniCourt(video_frames[0])
+    mini_court = MiniCourt(first_frame)
 
     # detect ball shots
     ball_shot_frames = ball_tracker.get_ball_shot_frames(ball_detections)
 
     # convert positions to mini court positions
-    player_mini_court_detections, ball_mini_court_detections = mini_court.convert_bounding_boxes_to_mini_court_coordinates(player_detections, ball_detections, court_keypoints)
+    player_mini_court_detections, ball_mini_court_detections = mini_court.convert_bounding_boxes_to_mini_court_coordinates(player_detections, ball_detections, court_keypoints, projection_method)
     
-    # tracking stats
-    player_stats_data = [{
-        'frame_num':0,
-        'player_1_number_of_shots':0,
-        'player_1_total_shot_speed':0,
-        'player_1_last_shot_speed':0,
-        'player_1_total_player_speed':0,
-        'player_1_last_player_speed':0,
-
-        'player_2_number_of_shots':0,
-        'player_2_total_shot_speed':0,
-        'player_2_last_shot_speed':0,
-        'player_2_total_player_speed':0,
-        'player_2_last_player_speed':0,
-    } ]
-
-    for ball_shot_ind in range(len(ball_shot_frames)-1):
-        start_frame = ball_shot_frames[ball_shot_ind]
-        end_frame = ball_shot_frames[ball_shot_ind+1]
-        ball_shot_time_in_second = (end_frame-start_frame)/24 # 24 fps
-
-        # get distance covered by the ball
-        distance_covered_by_ball_pixels = measure_distance(ball_mini_court_detections[start_frame][1], ball_mini_court_detections[end_frame][1])
-        distance_covered_by_ball_meters = convert_pixel_distance_to_meters( distance_covered_by_ball_pixels,
-                                                                           constants.DOUBLE_LINE_WIDTH,
-                                                                           mini_court.get_width_of_mini_court()
-                                                                           ) 
-
-        # speed of the ball shot on km/h    
-        speed_of_ball_shot = distance_covered_by_ball_meters/ball_shot_time_in_second * 3.6
-
-        # player who shot the ball
-        player_positions = player_mini_court_detections[start_frame]
-        player_shot_ball = min(player_positions.keys(), key=lambda player_id: measure_distance(player_positions[player_id], ball_mini_court_detections[start_frame][1]))
-
-        # opponent player speed
-        opponent_player = 1 if player_shot_ball == 2 else 2
-        distance_covered_by_opponent_player_pixels = measure_distance(player_mini_court_detections[start_frame][opponent_player], player_mini_court_detections[end_frame][opponent_player])
-        distance_covered_by_opponent_player_meters = convert_pixel_distance_to_meters( distance_covered_by_opponent_player_pixels,
-                                                                           constants.DOUBLE_LINE_WIDTH,
-                                                                           mini_court.get_width_of_mini_court()
-                                                                           )
-        speed_of_opponent = distance_covered_by_opponent_player_meters/ball_shot_time_in_second * 3.6
-
-        current_player_stats = deepcopy(player_stats_data[-1])
-        current_player_stats['frame_num'] = start_frame
-        current_player_stats[f'player_{player_shot_ball}_number_of_shots'] += 1
-        current_player_stats[f'player_{player_shot_ball}_total_shot_speed'] += speed_of_ball_shot
-        current_player_stats[f'player_{player_shot_ball}_last_shot_speed'] = speed_of_ball_shot
-
-        current_player_stats[f'player_{opponent_player}_total_player_speed'] += speed_of_opponent
-        current_player_stats[f'player_{opponent_player}_last_player_speed'] = speed_of_opponent
-
-        player_stats_data.append(current_player_stats)
-
-    player_stats_data_df = pd.DataFrame(player_stats_data)
-    frames_df = pd.DataFrame({'frame_num': list(range(len(video_frames)))})
-    player_stats_data_df = pd.merge(frames_df, player_stats_data_df, on='frame_num', how='left')
-    player_stats_data_df = player_stats_data_df.ffill()
-
-    player_stats_data_df['player_1_average_shot_speed'] = player_stats_data_df['player_1_total_shot_speed']/player_stats_data_df['player_1_number_of_shots']
-    player_stats_data_df['player_2_average_shot_speed'] = player_stats_data_df['player_2_total_shot_speed']/player_stats_data_df['player_2_number_of_shots']
-    player_stats_data_df['player_1_average_player_speed'] = player_stats_data_df['player_1_total_player_speed']/player_stats_data_df['player_2_number_of_shots']
-    player_stats_data_df['player_2_average_player_speed'] = player_stats_data_df['player_2_total_player_speed']/player_stats_data_df['player_1_number_of_shots']
-
-
-    # draw bounding boxes
-    output_frames = player_tracker.draw_bboxes(video_frames, player_detections)
-    output_frames = ball_tracker.draw_bboxes(output_frames, ball_detections)
-    output_frames = court_line_detector_obj.draw_keypoints_on_video(output_frames, court_keypoints)
-    output_frames = mini_court.draw_mini_court(output_frames)
-    output_frames = mini_court.draw_points_on_mini_court(output_frames, player_mini_court_detections)
-    output_frames = mini_court.draw_points_on_mini_court(output_frames, ball_mini_court_detections, color=(0, 255, 255))
-    output_frames = draw_player_stats(output_frames,player_stats_data_df)
-
-    # write frame number on top left of the video
-    for i, frame in enumerate(output_frames):
-        cv2.putText(frame, f"Frame: {i+1}", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2, cv2.LINE_AA)
-
-    save_video(output_frames, "Media/outputs/output_video.avi")
+    # tracking stats, updated shot by shot and looked up by frame
+    match_stats = MatchStatsAccumulator()
+
+    with timer("main.stats"):
+        for ball_shot_ind in range(len(ball_shot_frames)-1):
+            start_frame = ball_shot_frames[ball_shot_ind]
+            end_frame = ball_shot_frames[ball_shot_ind+1]
+            ball_shot_time_in_second = (end_frame-start_frame)/fps
+
+            match_stats.add_shot_from_positions(start_frame, ball_shot_time_in_second,
+                                                player_mini_court_detections[start_frame], ball_mini_court_detections[start_frame][1],
+                                                player_mini_court_detections[end_frame], ball_mini_court_detections[end_frame][1],
+                                                mini_court.get_width_of_mini_court())
+
+    # draw and save the video chunk by chunk, all the layers of a frame being drawn in one visit.
+    # one stats panel is used so that its rendered text is reused across chunks
+    player_stats_panel = PlayerStatsPanel()
+
+    # the detections can be shorter than the decoded video, whose last frames are then drawn without them
+    def draw_frame_bboxes(tracker, detections):
+        def draw_bboxes(frame, frame_num):
+            if frame_num < len(detections):
+                tracker.draw_frame_bboxes(frame, detections[frame_num])
+        return draw_bboxes
+
+    def draw_mini_court_points(positions, color):
+        def draw_points(frame, frame_num):
+            if frame_num < len(positions):
+                mini_court.draw_frame_points(frame, positions[frame_num], color)
+        return draw_points
+
+    def draw_frame_number(frame, frame_num):
+        # write frame number on top left of the video
+        cv2.putText(frame, f"Frame: {frame_num+1}", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2, cv2.LINE_AA)
+
+    compositor = FrameCompositor([
+        ('player_bboxes', draw_frame_bboxes(player_tracker, player_detections)),
+        ('ball_bboxes', draw_frame_bboxes(ball_tracker, ball_detections)),
+        ('court_keypoints', lambda frame, frame_num: court_line_detector_obj.draw_keypoints(frame, court_keypoints.get_keypoints(frame_num))),
+        ('mini_court', lambda frame, frame_num: mini_court.draw_overlay(frame)),
+        ('mini_court_players', draw_mini_court_points(player_mini_court_detections, (0, 255, 0))),
+        ('mini_court_ball', draw_mini_court_points(ball_mini_court_detections, (0, 255, 255))),
+        ('player_stats', lambda frame, frame_num: player_stats_panel.draw(frame, match_stats.values_at(frame_num, PLAYER_STATS_COLUMNS))),
+        ('frame_number', draw_frame_number),
+    ])
+    annotation_pipeline = ThreadedPipeline(input_video_path, compositor.compose, output_video_path, chunk_size, queue_size,
+                                           fps, writer_backend, writer_options)
+    with timer("main.annotate", frames=len(player_detections)):
+        annotation_pipeline.run()
+    print(annotation_pipeline.format_stats())
+
+def main(input_video_path="Media/input_video.mp4", output_video_path="Media/outputs/output_video.avi", chunk_size=64, batch_size=1, queue_size=4, projection_method="homography", keypoints_redetect_interval=None, writer_backend="cv2", writer_options=None, player_detection_stride=1, inference_region_padding=None, inference_region_max_size=None, ball_search_window_size=None, number_of_workers=1, instrumentation_report_path=None, chrome_trace_path=None, trace_allocations=False, use_detection_cache=True):
+    """Run the full analysis on a video. Frames are decoded, annotated and encoded in chunks of chunk_size frames,
+    so peak memory is set by chunk_size and queue_size and not by the length of the video. Decoding and encoding
+    run on their own threads.
+
+    Args:
+        input_video_path: path to the input video
+        output_video_path: path to save the annotated video
+        chunk_size: number of frames held in memory at a time
+        batch_size: number of frames sent to the detection models in one call
+        queue_size: number of chunks that can wait between the decoding, processing and encoding stages
+        projection_method: "homography" or "height", how positions are converted to mini court coordinates
+        keypoints_redetect_interval: maximum number of frames between two court keypoint detections, None to re-detect only on scene changes
+        writer_backend: "cv2" to encode MJPG with OpenCV, or "ffmpeg" to encode x264/x265 with an ffmpeg subprocess
+        writer_options: options of the video writer, e.g. {"preset": "veryfast", "crf": 23, "threads": 0} for "ffmpeg"
+        player_detection_stride: run the player model on every n-th frame and interpolate the players in between, 1 for every frame
+        inference_region_padding: run the player and ball models only on the bounding box of the court keypoints of the first frame,
+            padded by this fraction of its size on every side (e.g. 0.2), None to run them on the full frame
+        inference_region_max_size: largest side of the inference region after downscaling, None to keep its full resolution
+        ball_search_window_size: search the ball in a window of this size around its Kalman-predicted position (e.g. 320), None to search the whole frame
+        number_of_workers: number of processes detecting the court keypoints, players and ball on shards of the video, 1 to detect in this process
+        instrumentation_report_path: save the latency histograms, frame counts and allocations of the stages to this JSON file (see TimerRegistry), None to not time them
+        chrome_trace_path: save the timed calls of the stages to this Chrome trace file, None to not save it
+        trace_allocations: also record the memory allocated by each stage with tracemalloc, when the stages are timed
+        use_detection_cache: read the player and ball detections from the detection cache when it holds them, in which case their models are not loaded
+    """
+    instrumented = instrumentation_report_path is not None or chrome_trace_path is not None
+    if instrumented:
+        timer_registry.reset()
+        timer_registry.enable(trace_allocations)
+    
+    # read the first frame, used for the court keypoints and the mini court layout, and the frame rate used for the speeds and the output video
+    first_frame = read_first_frame(input_video_path)
+    fps = get_video_fps(input_video_path)
+    
+    keypoints_model_path = "Models/keypoints_model.pth"
+    player_model_path = "Models/yolov8x.pt"
+    ball_model_path = "Models/yolov5_best.pt"
+    with timer("main.load_keypoints_model"):
+        court_line_detector_obj = CourtLineDetector(keypoints_model_path)
+    keypoint_scheduler_options = {'redetect_interval': keypoints_redetect_interval, 'batch_size': batch_size}
+    player_tracker_options = {'stride': player_detection_stride}
+    ball_tracker_options = {'search_window_size': ball_search_window_size}
+
+    if number_of_workers > 1:
+        # detect the court keypoints, players and ball of shards of the video in worker processes, and stitch them
+        if inference_region_padding is not None:
+            player_tracker_options['inference_region'] = ball_tracker_options['inference_region'] = InferenceRegion.from_keypoints(
+                court_line_detector_obj.predict(first_frame), first_frame.shape, inference_region_padding, inference_region_max_size)
+        sharded_runner = ShardedRunner(input_video_path, player_model_path, ball_model_path, keypoints_model_path, number_of_workers,
+                                       tracker_options={'player': player_tracker_options, 'ball': ball_tracker_options},
+                                       keypoint_scheduler_options=keypoint_scheduler_options)
+        with timer("main.sharded_detection"):
+            sharded_results = sharded_runner.run()
+        court_keypoints = sharded_results['court_keypoints']
+        player_detections = sharded_results['player_detections']
+        ball_detections = sharded_results['ball_detections']
+        with timer("main.load_tracker_models"):
+            player_tracker = PlayerTracker(player_model_path, **player_tracker_options)
+            ball_tracker = BallTracker(ball_model_path, **ball_tracker_options)
+    else:
+        # detecting courtline keypoints, before the players and the ball so that their models can be restricted to the court
+        keypoint_scheduler = KeypointScheduler(court_line_detector_obj, **keypoint_scheduler_options)
+        keypoint_frames = ThreadedVideoReader(input_video_path, chunk_size, queue_size).iter_frames()
+        court_keypoints = keypoint_scheduler.detect_keypoints(keypoint_frames)
+
+        if inference_region_padding is not None:
+            player_tracker_options['inference_region'] = ball_tracker_options['inference_region'] = InferenceRegion.from_keypoints(
+                court_keypoints.get_keypoints(0), first_frame.shape, inference_region_padding, inference_region_max_size)
+
+        # detect players and ball, decoding the video frame by frame
+        with timer("main.load_tracker_models"):
+            player_tracker = PlayerTracker(player_model_path, **player_tracker_options)
+            ball_tracker = BallTracker(ball_model_path, **ball_tracker_options)
+        # the models are loaded by the first frame they run on, and may be kept loaded from a previous video (see ModelWorker)
+        player_tracker.reset_tracks()
+        player_frames = ThreadedVideoReader(input_video_path, chunk_size, queue_size).iter_frames()
+        player_cache = player_tracker.get_detection_cache(input_video_path) if use_detection_cache else None
+        player_detections = player_tracker.detect_frames(player_frames, batch_size=batch_size, cache=player_cache)
+        ball_frames = ThreadedVideoReader(input_video_path, chunk_size, queue_size).iter_frames()
+        ball_cache = ball_tracker.get_detection_cache(input_video_path) if use_detection_cache else None
+        ball_detections = ball_tracker.detect_frames(ball_frames, batch_size=batch_size, cache=ball_cache)
+
+    annotate_video(input_video_path, output_video_path, court_line_detector_obj, player_tracker, ball_tracker, court_keypoints,
+                   player_detections, ball_detections, first_frame, fps, chunk_size, queue_size, projection_method, writer_backend, writer_options)
+
+    if instrumented:
+        timer_registry.disable()
+        print(timer_registry.format_report())
+        if instrumentation_report_path is not None:
+            timer_registry.save_report(instrumentation_report_path)
+        if chrome_trace_path is not None:
+            timer_registry.save_chrome_trace(chrome_trace_path)
+
+def run_live(source=0, output_video_path=None, realtime=False, projection_method="homography", keypoints_redetect_interval=None,
+             writer_backend="cv2", writer_options=None, ball_search_window_size=None, interpolation_lag=5, height_window_after=10, display=False):
+    """Run the analysis on a live source (a camera, a stream or a video file replayed at its frame rate) frame by frame,
+    with causal fixed-lag interpolation, projection and shot detection (see LivePipeline), and print the end-to-end latency.
+
+    Args:
+        source: camera index, stream URL or path to a video file
+        output_video_path: path to save the annotated video, None to not save it
+        realtime: replay a video file at its frame rate, as a camera would deliver it
+        projection_method: "homography" or "height", how positions are converted to mini court coordinates
+        keypoints_redetect_interval: maximum number of frames between two court keypoint detections, None to re-detect only on scene changes
+        writer_backend: "cv2" or "ffmpeg", see main()
+        writer_options: options of the video writer, see main()
+        ball_search_window_size: search the ball in a window of this size around its Kalman-predicted position, None to search the whole frame
+        interpolation_lag: maximum number of frames a frame waits for the next ball detection
+        height_window_after: number of frames after a frame in the player height window of the "height" projection
+        display: show the annotated frames in a window
+    """
+    court_line_detector_obj = CourtLineDetector("Models/keypoints_model.pth")
+    keypoint_scheduler = KeypointScheduler(court_line_detector_obj, redetect_interval=keypoints_redetect_interval)
+    player_tracker = PlayerTracker("Models/yolov8x.pt")
+    ball_tracker = BallTracker("Models/yolov5_best.pt")
+    ball_detector = None
+    if ball_search_window_size is not None:
+        ball_detector = WindowedBallDetector(ball_tracker.detect_boxes, ball_search_window_size, kalman_filter=BallKalmanFilter())
+
+    live_pipeline = LivePipeline(player_tracker, ball_tracker, keypoint_scheduler, output_video_path, ball_detector,
+                                 projection_method, interpolation_lag, height_window_after, writer_backend, writer_options, display)
+    live_pipeline.run(source, realtime)
+    print(live_pipeline.format_stats())
+
+def run_batch(clips_path, output_dir="Media/outputs", max_active_clips=4, frames_per_round=8, batch_size=16, keypoint_batch_size=16, chunk_size=64, queue_size=4,
+              projection_method="homography", keypoints_redetect_interval=None, writer_backend="cv2", writer_options=None, use_detection_cache=True):
+    """Run the full analysis on a batch of clips, e.g. to reprocess an archive. The clips are detected together (see BatchRunner), the frames
+    of several clips sharing the batches of the ball and court keypoint models, and each clip is annotated as soon as it is detected.
+
+    Args:
+        clips_path: directory of clips, or manifest file listing the clips and optionally their output paths (see get_batch_clips())
+        output_dir: directory of the annotated clips without an output path in the manifest
+        max_active_clips: number of clips decoded and detected at a time
+        frames_per_round: number of frames of each active clip detected per round, which is also the batch of the player model
+        batch_size: number of frames, from all the active clips, sent to the ball model in one call
+        keypoint_batch_size: number of scheduled frames, from all the active clips, sent to the court keypoints model in one call
+        chunk_size: number of frames held in memory at a time while annotating a clip
+        queue_size: number of chunks that can wait between the decoding, processing and encoding stages while annotating a clip
+        projection_method: "homography" or "height", how positions are converted to mini court coordinates
+        keypoints_redetect_interval: maximum number of frames between two court keypoint detections, None to re-detect only on scene changes
+        writer_backend: "cv2" or "ffmpeg", see main()
+        writer_options: options of the video writer, see main()
+        use_detection_cache: read the player and ball detections of a clip from the detection cache when it holds them, and save them to it otherwise
+    """
+    clips = get_batch_clips(clips_path, output_dir)
+    court_line_detector_obj = CourtLineDetector("Models/keypoints_model.pth")
+    player_tracker = PlayerTracker("Models/yolov8x.pt")
+    ball_tracker = BallTracker("Models/yolov5_best.pt")
+    batch_runner = BatchRunner(player_tracker, ball_tracker, court_line_detector_obj, max_active_clips, frames_per_round, batch_size, keypoint_batch_size,
+                               {'redetect_interval': keypoints_redetect_interval}, use_detection_cache)
+
+    for clip_index, results in batch_runner.run([input_video_path for input_video_path, _ in clips]):
+        input_video_path, output_video_path = clips[clip_index]
+        print(f"{input_video_path}: {results['number_of_frames']} frames detected in {results['seconds']:.2f} s")
+        os.makedirs(os.path.dirname(output_video_path) or ".", exist_ok=True)
+        annotate_video(input_video_path, output_video_path, court_line_detector_obj, player_tracker, ball_tracker, results['court_keypoints'],
+                       results['player_detections'], results['ball_detections'], read_first_frame(input_video_path), get_video_fps(input_video_path),
+                       chunk_size, queue_size, projection_method, writer_backend, writer_options)
+    print(batch_runner.format_stats())
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Tennis analysis of a video, or of a live source with --live")
+    parser.add_argument("--input", default="Media/input_video.mp4", help="input video, the source of --live (a camera index, stream URL or video file), or the directory or manifest of clips of --batch")
+    parser.add_argument("--output", default=None, help="annotated video, defaults to Media/outputs/output_video.avi offline and to no video live, or directory of the annotated clips of --batch, defaults to Media/outputs")
+    parser.add_argument("--live", action="store_true", help="analyse the input frame by frame with a bounded latency")
+    parser.add_argument("--batch", action="store_true", help="analyse the clips of the input directory or manifest together, saving them to the --output directory")
+    parser.add_argument("--realtime", action="store_true", help="with --live, replay a video file at its frame rate")
+    parser.add_argument("--display", action="store_true", help="with --live, show the annotated frames")
+    parser.add_argument("--projection-method", default="homography", choices=["homography", "height"])
+    parser.add_argument("--keypoints-redetect-interval", type=int, default=None)
+    parser.add_argument("--writer-backend", default="cv2", choices=["cv2", "ffmpeg"])
+    parser.add_argument("--ball-search-window-size", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=None, help="frames per model call, defaults to 1, and to 16 with --batch")
+    parser.add_argument("--player-detection-stride", type=int, default=1)
+    parser.add_argument("--inference-region-padding", type=float, default=None, help="run the models only on the court, padded by this fraction of its size (e.g. 0.2)")
+    parser.add_argument("--inference-region-max-size", type=int, default=None, help="with --inference-region-padding, largest side of the downscaled region")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--max-active-clips", type=int, default=4, help="with --batch, number of clips detected at a time")
+    parser.add_argument("--instrumentation-report", default=None, help="JSON file of the per-stage latency histograms")
+    parser.add_argument("--chrome-trace", default=None, help="Chrome trace file of the timed stages")
+    parser.add_argument("--trace-allocations", action="store_true", help="also record the allocations of each stage with tracemalloc")
+    parser.add_argument("--no-detection-cache", action="store_true", help="detect the players and the ball even if the detection cache holds them")
+    args = parser.parse_args()
+
+    if args.live:
+        source = int(args.input) if args.input.isdigit() else args.input
+        run_live(source, args.output, args.realtime, args.projection_method, args.keypoints_redetect_interval,
+                 args.writer_backend, ball_search_window_size=args.ball_search_window_size, display=args.display)
+    elif args.batch:
+        run_batch(args.input, args.output or "Media/outputs", max_active_clips=args.max_active_clips, batch_size=args.batch_size or 16,
+                  chunk_size=args.chunk_size, projection_method=args.projection_method, keypoints_redetect_interval=args.keypoints_redetect_interval,
+                  writer_backend=args.writer_backend, use_detection_cache=not args.no_detection_cache)
+    else:
+        main(args.input, args.output or "Media/outputs/output_video.avi", chunk_size=args.chunk_size, batch_size=args.batch_size or 1,
+             projection_method=args.projection_method, keypoints_redetect_interval=args.keypoints_redetect_interval,
+             writer_backend=args.writer_backend, player_detection_stride=args.player_detection_stride,
+             inference_region_padding=args.inference_region_padding, inference_region_max_size=args.inference_region_max_size,
+             ball_search_window_size=args.ball_search_window_size, number_of_workers=args.workers,
+             instrumentation_report_path=args.instrumentation_report, chrome_trace_path=args.chrome_trace, trace_allocations=args.trace_allocations,
+             use_detection_cache=not args.no_detection_cache)
\ No newline at end of file
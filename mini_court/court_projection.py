@@ -0,0 +1,61 @@
+import cv2
+import numpy as np
+
+
+class CourtProjector:
+    """
+    Class to project points from the video frame to the mini court with a homography between the 14 court keypoints
+    detected by CourtLineDetector and the same keypoints of the mini court drawing. The homography is fitted once per set
+    of court keypoints and cached, so projecting a chunk of points is a single cv2.perspectiveTransform call.
+    """
+    def __init__(self, drawing_keypoints, max_cached_homographies=16):
+        """Constructor for CourtProjector class
+
+        Args:
+            drawing_keypoints: flat list of the 14 keypoints of the mini court [x0, y0, x1, y1, ...]
+            max_cached_homographies (int): number of fitted homographies kept in the cache, defaults to 16
+        """
+        self.drawing_keypoints = np.asarray(drawing_keypoints, dtype=np.float64).reshape(-1, 2)
+        self.max_cached_homographies = max_cached_homographies
+        self.homographies = {}
+
+    def fit(self, court_keypoints):
+        """Fit the homography from the court keypoints to the mini court keypoints, or get it from the cache
+
+        Args:
+            court_keypoints: flat list or array of the 14 court keypoints detected in the frame [x0, y0, x1, y1, ...]
+
+        Returns:
+            array of shape (3, 3): the homography
+        """
+        court_keypoints = np.asarray(court_keypoints, dtype=np.float64).reshape(-1, 2)
+        cache_key = court_keypoints.tobytes()
+        homography = self.homographies.get(cache_key)
+        if homography is not None:
+            return homography
+
+        # least squares over all 14 keypoints, so that the error of the detected keypoints is averaged out
+        homography, _ = cv2.findHomography(court_keypoints, self.drawing_keypoints, 0)
+        if homography is None:
+            raise ValueError("Could not fit a homography to the court keypoints")
+
+        if len(self.homographies) >= self.max_cached_homographies:
+            self.homographies.pop(next(iter(self.homographies)))
+        self.homographies[cache_key] = homography
+        return homography
+
+    def project(self, points, court_keypoints):
+        """Project points from the video frame to the mini court
+
+        Args:
+            points: array of shape (N, 2) with the points in the video frame
+            court_keypoints: flat list or array of the 14 court keypoints detected in the frame
+
+        Returns:
+            array of shape (N, 2) with the points on the mini court
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 1, 2)
+        if len(points) == 0:
+            return np.empty((0, 2))
+        homography = self.fit(court_keypoints)
+        return cv2.perspectiveTransform(points, homography).reshape(-1, 2)
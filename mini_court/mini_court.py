@@ -1,7 +1,11 @@
 import cv2
 import constants
-from Utils import convert_meters_to_pixel_distance, convert_pixel_distance_to_meters, get_foot_position, get_closest_keypoint_index, get_height_of_bbox, measure_xy_distance, get_center_of_bbox, measure_distance
+from Utils import convert_meters_to_pixel_distance, convert_pixel_distance_to_meters, measure_xy_distance
 import numpy as np
+from Utils.detection_table import to_detection_table
+from Utils.keypoint_segments import CourtKeypointSegments
+from mini_court.court_projection import CourtProjector
+from Utils.instrumentation import timed
 
 class MiniCourt:
     def __init__(self, frame):
@@ -14,6 +18,8 @@ class MiniCourt:
         self.set_mini_court_position()
         self.set_court_drawing_keypoints()
         self.set_court_lines()
+        self.court_projector = CourtProjector(self.drawing_keypoints)
+        self.set_overlay(frame)
 
     def set_canvas_bg_box_position(self, frame):
         """Set the position of the canvas background box (rectangle on which the mini court will be drawn)
@@ -129,46 +135,86 @@ class MiniCourt:
         out[mask] = cv2.addWeighted(frame, alpha, shapes, 1 - alpha, 0)[mask]
         return out
     
-    def draw_court(self,frame):
+    def draw_court(self,frame, origin=(0,0), color=None):
         """Draw the mini court on the video frame including the lines, net and the key points
 
         Args:
             frame: the frame on which the mini court will be drawn
+            origin: position in the video frame of the top left corner of frame, when frame is a region of the video frame. Defaults to (0,0)
+            color: color used for every shape instead of their own colors, e.g. 255 to draw a mask. Defaults to None
 
         Returns:
             frame with the mini court drawn
         """
+        origin_x, origin_y = origin
         for i in range(0, len(self.drawing_keypoints),2):
-            x = int(self.drawing_keypoints[i])
-            y = int(self.drawing_keypoints[i+1])
-            cv2.circle(frame, (x,y),5, (0,0,255),-1)
+            x = int(self.drawing_keypoints[i]) - origin_x
+            y = int(self.drawing_keypoints[i+1]) - origin_y
+            cv2.circle(frame, (x,y),5, (0,0,255) if color is None else color,-1)
 
         # draw Lines
         for line in self.lines:
-            start_point = (int(self.drawing_keypoints[line[0]*2]), int(self.drawing_keypoints[line[0]*2+1]))
-            end_point = (int(self.drawing_keypoints[line[1]*2]), int(self.drawing_keypoints[line[1]*2+1]))
-            cv2.line(frame, start_point, end_point, (0, 0, 0), 2)
+            start_point = (int(self.drawing_keypoints[line[0]*2]) - origin_x, int(self.drawing_keypoints[line[0]*2+1]) - origin_y)
+            end_point = (int(self.drawing_keypoints[line[1]*2]) - origin_x, int(self.drawing_keypoints[line[1]*2+1]) - origin_y)
+            cv2.line(frame, start_point, end_point, (0, 0, 0) if color is None else color, 2)
 
         # Draw net
-        net_start_point = (self.drawing_keypoints[0], int((self.drawing_keypoints[1] + self.drawing_keypoints[5])/2))
-        net_end_point = (self.drawing_keypoints[2], int((self.drawing_keypoints[1] + self.drawing_keypoints[5])/2))
-        cv2.line(frame, net_start_point, net_end_point, (255, 0, 0), 2)
+        net_start_point = (self.drawing_keypoints[0] - origin_x, int((self.drawing_keypoints[1] + self.drawing_keypoints[5])/2) - origin_y)
+        net_end_point = (self.drawing_keypoints[2] - origin_x, int((self.drawing_keypoints[1] + self.drawing_keypoints[5])/2) - origin_y)
+        cv2.line(frame, net_start_point, net_end_point, (255, 0, 0) if color is None else color, 2)
 
         return frame
 
+    def set_overlay(self, frame):
+        """Pre-render the mini court as an overlay the size of the background box: a BGR sprite of the white background with the
+        court drawn on it, and a mask of the court pixels. The background blends with the video at alpha 0.5 and the court pixels are opaque.
+
+        Args:
+            frame: the frame for reference size of the video
+        """
+        frame_height, frame_width = frame.shape[:2]
+        # the filled rectangle of draw_background_rectangle() includes its end point, and is clipped to the frame
+        self.overlay_start_x = max(self.start_x, 0)
+        self.overlay_start_y = max(self.start_y, 0)
+        self.overlay_end_x = min(self.end_x + 1, frame_width)
+        self.overlay_end_y = min(self.end_y + 1, frame_height)
+        overlay_shape = (max(self.overlay_end_y - self.overlay_start_y, 0), max(self.overlay_end_x - self.overlay_start_x, 0))
+
+        origin = (self.overlay_start_x, self.overlay_start_y)
+        self.overlay_sprite = np.full(overlay_shape + (3,), 255, dtype=np.uint8)
+        self.draw_court(self.overlay_sprite, origin)
+        court_mask = np.zeros(overlay_shape, dtype=np.uint8)
+        self.draw_court(court_mask, origin, color=255)
+        self.overlay_mask = court_mask.astype(bool)[:, :, None]
+
+    def draw_overlay(self, frame):
+        """Blend the pre-rendered mini court into the background box region of the frame, in place
+
+        Args:
+            frame: the frame on which the mini court will be drawn
+
+        Returns:
+            frame with the mini court drawn
+        """
+        roi = frame[self.overlay_start_y:self.overlay_end_y, self.overlay_start_x:self.overlay_end_x]
+        alpha=0.5
+        cv2.addWeighted(roi, alpha, self.overlay_sprite, 1 - alpha, 0, dst=roi)
+        np.copyto(roi, self.overlay_sprite, where=self.overlay_mask)
+        return frame
+
     def draw_mini_court(self,frames):
-        """Draw the mini court on the video frames
+        """Draw the mini court on the video frames. Only the background box region of each frame is touched, so the cost per frame
+        does not depend on the resolution of the video.
 
         Args:
-            frames: list of frames on which the mini court will be drawn
+            frames: list or iterable of frames on which the mini court will be drawn
 
         Returns:
             list of frames with the mini court drawn
         """
         output_frames = []
         for frame in frames:
-            frame = self.draw_background_rectangle(frame)
-            frame = self.draw_court(frame)
+            frame = self.draw_overlay(frame)
             output_frames.append(frame)
         return output_frames
     
@@ -237,68 +283,183 @@ class MiniCourt:
 
         return  mini_court_player_position
     
-    def convert_bounding_boxes_to_mini_court_coordinates(self,player_boxes, ball_boxes, original_court_key_points ):
+    def get_mini_court_coordinates_batch(self,
+                                         object_positions,
+                                         closest_key_points,
+                                         closest_key_point_indices,
+                                         player_heights_in_pixels,
+                                         player_heights_in_meters
+                                         ):
+        """Get the mini court coordinates of many objects at once, with the same math as get_mini_court_coordinates()
+
+        Args:
+            object_positions: array of shape (N, 2) with the positions of the objects
+            closest_key_points: array of shape (N, 2) with the closest key point to each object
+            closest_key_point_indices: array of shape (N,) with the index of the closest key point to each object
+            player_heights_in_pixels: array of shape (N,) with the height of the reference player in pixels
+            player_heights_in_meters: array of shape (N,) with the height of the reference player in meters
+
+        Returns:
+            array of shape (N, 2) with the mini court coordinates of the objects
+        """
+        dtype = closest_key_points.dtype
+        distance_from_keypoint_pixels = np.abs(object_positions.astype(dtype) - closest_key_points)
+
+        # Conver pixel distance to meters
+        distance_from_keypoint_meters = convert_pixel_distance_to_meters(distance_from_keypoint_pixels,
+                                                                         player_heights_in_meters.astype(dtype)[:, None],
+                                                                         player_heights_in_pixels.astype(dtype)[:, None])
+
+        # Convert to mini court coordinates
+        mini_court_distance_pixels = self.convert_meters_to_pixels(distance_from_keypoint_meters)
+        drawing_keypoints = np.asarray(self.drawing_keypoints, dtype=np.float64).astype(dtype).reshape(-1, 2)
+
+        return drawing_keypoints[closest_key_point_indices] + mini_court_distance_pixels
+
+    def convert_bounding_boxes_to_mini_court_coordinates(self,player_boxes, ball_boxes, original_court_key_points, projection_method="homography"):
         """Convert the bounding boxes of the players and the ball to mini court coordinates
 
         Args:
-            player_boxes: the bounding boxes of the players
-            ball_boxes: the bounding boxes of the ball
-            original_court_key_points: the key points of the court
+            player_boxes: the bounding boxes of the players, DetectionTable or list of per-frame dictionaries
+            ball_boxes: the bounding boxes of the ball, DetectionTable or list of per-frame dictionaries
+            original_court_key_points: the key points of the court, or CourtKeypointSegments to look them up by frame
+            projection_method: "homography" to project with a homography fitted on the court key points (see convert_with_homography()),
+                or "height" to scale offsets from the closest key point by the player height (see convert_with_player_heights()),
+                defaults to "homography"
 
         Returns:
             the bounding boxes of the players and the ball in mini court coordinates
         """
+        if projection_method == "homography":
+            return self.convert_with_homography(player_boxes, ball_boxes, original_court_key_points)
+        if projection_method == "height":
+            return self.convert_with_player_heights(player_boxes, ball_boxes, original_court_key_points)
+        raise ValueError(f"Unknown projection method: {projection_method}")
+
+    @timed(count_frames=lambda positions: len(positions[0]))
+    def convert_with_homography(self, player_boxes, ball_boxes, original_court_key_points):
+        """Convert the foot positions of the players and the centers of the ball to mini court coordinates with the homography
+        between the court key points and the mini court key points. All points are projected in one call.
+
+        Args:
+            player_boxes: the bounding boxes of the players, DetectionTable or list of per-frame dictionaries
+            ball_boxes: the bounding boxes of the ball, DetectionTable or list of per-frame dictionaries
+            original_court_key_points: the key points of the court, or CourtKeypointSegments to look them up by frame
+
+        Returns:
+            the positions of the players and the ball in mini court coordinates, one dictionary per frame each
+        """
+        player_table = to_detection_table(player_boxes)
+        ball_table = to_detection_table(ball_boxes)
+        number_of_frames = len(player_table)
+
+        player_bboxes = player_table.boxes()
+        foot_positions = np.stack([(player_bboxes[:, 0] + player_bboxes[:, 2]) / 2, player_bboxes[:, 3]], axis=1)
+        ball_bboxes = ball_table.boxes()
+        ball_positions = (ball_bboxes[:, 0:2] + ball_bboxes[:, 2:4]) / 2
+
+        # one projection per segment of frames sharing the same court key points
+        points = np.concatenate([foot_positions, ball_positions])
+        frame_nums = np.concatenate([player_table.data['frame_idx'], ball_table.data['frame_idx']])
+        court_key_point_segments = CourtKeypointSegments.from_keypoints(original_court_key_points)
+        segment_indices = court_key_point_segments.get_segment_indices(frame_nums)
+        mini_court_positions = np.empty((len(points), 2))
+        for segment_index, (_, segment_key_points) in enumerate(court_key_point_segments):
+            in_segment = segment_indices == segment_index
+            if in_segment.any():
+                mini_court_positions[in_segment] = self.court_projector.project(points[in_segment], segment_key_points)
+        player_positions = mini_court_positions[:len(foot_positions)].tolist()
+        ball_mini_court_positions = mini_court_positions[len(foot_positions):].tolist()
+
+        output_player_boxes = [{} for _ in range(number_of_frames)]
+        for frame_num, player_id, position in zip(player_table.data['frame_idx'].tolist(), player_table.data['track_id'].tolist(), player_positions):
+            output_player_boxes[frame_num][player_id] = tuple(position)
+        output_ball_boxes = [{} for _ in range(len(ball_table))]
+        for frame_num, position in zip(ball_table.data['frame_idx'].tolist(), ball_mini_court_positions):
+            output_ball_boxes[frame_num][1] = tuple(position)
+
+        return output_player_boxes , output_ball_boxes
+
+    @timed(count_frames=lambda positions: len(positions[0]))
+    def convert_with_player_heights(self,player_boxes, ball_boxes, original_court_key_points ):
+        """Convert the bounding boxes of the players and the ball to mini court coordinates, for all frames in one pass.
+        A player's height in pixels is the rolling max of its bounding box height over frames [-20, +50), the closest key point
+        is chosen among key points 0, 2, 12 and 13, and the ball is placed relative to the player closest to it.
+
+        Args:
+            player_boxes: the bounding boxes of the players, DetectionTable or list of per-frame dictionaries
+            ball_boxes: the bounding boxes of the ball, DetectionTable or list of per-frame dictionaries
+            original_court_key_points: the key points of the court, or CourtKeypointSegments to look them up by frame
+
+        Returns:
+            the bounding boxes of the players and the ball in mini court coordinates
+        """
+        import pandas as pd
         player_heights = {
             1: constants.PLAYER_1_HEIGHT_METERS,
             2: constants.PLAYER_2_HEIGHT_METERS
         }
-
-        output_player_boxes= []
-        output_ball_boxes= []
-
-        for frame_num, player_bbox in enumerate(player_boxes):
-            ball_box = ball_boxes[frame_num][1]
-            ball_position = get_center_of_bbox(ball_box)
-            closest_player_id_to_ball = min(player_bbox.keys(), key=lambda x: measure_distance(ball_position, get_center_of_bbox(player_bbox[x])))
-
-            output_player_bboxes_dict = {}
-            for player_id, bbox in player_bbox.items():
-                foot_position = get_foot_position(bbox)
-
-                # Get The closest keypoint in pixels
-                closest_key_point_index = get_closest_keypoint_index(foot_position,original_court_key_points, [0,2,12,13])
-                closest_key_point = (original_court_key_points[closest_key_point_index*2], 
-                                     original_court_key_points[closest_key_point_index*2+1])
-
-                # Get Player height in pixels
-                frame_index_min = max(0, frame_num-20)
-                frame_index_max = min(len(player_boxes), frame_num+50)
-                bboxes_heights_in_pixels = [get_height_of_bbox(player_boxes[i][player_id]) for i in range (frame_index_min,frame_index_max)]
-                max_player_height_in_pixels = max(bboxes_heights_in_pixels)
-
-                mini_court_player_position = self.get_mini_court_coordinates(foot_position,
-                                                                            closest_key_point, 
-                                                                            closest_key_point_index, 
-                                                                            max_player_height_in_pixels,
-                                                                            player_heights[player_id]
-                                                                            )
-                
-                output_player_bboxes_dict[player_id] = mini_court_player_position
-
-                if closest_player_id_to_ball == player_id:
-                    # Get The closest keypoint in pixels
-                    closest_key_point_index = get_closest_keypoint_index(ball_position,original_court_key_points, [0,2,12,13])
-                    closest_key_point = (original_court_key_points[closest_key_point_index*2], 
-                                        original_court_key_points[closest_key_point_index*2+1])
-                    
-                    mini_court_player_position = self.get_mini_court_coordinates(ball_position,
-                                                                            closest_key_point, 
-                                                                            closest_key_point_index, 
-                                                                            max_player_height_in_pixels,
-                                                                            player_heights[player_id]
-                                                                            )
-                    output_ball_boxes.append({1:mini_court_player_position})
-            output_player_boxes.append(output_player_bboxes_dict)
+        height_window_before, height_window_after = 20, 50
+        candidate_key_point_indices = np.array([0,2,12,13])
+
+        player_table = to_detection_table(player_boxes)
+        ball_table = to_detection_table(ball_boxes)
+        number_of_frames = len(player_table)
+        player_ids = player_table.track_ids().tolist()
+        if not player_ids:
+            return [{} for _ in range(number_of_frames)], []
+        # key points of shape (frames, 14, 2)
+        court_key_point_segments = CourtKeypointSegments.from_keypoints(original_court_key_points)
+        segment_key_points = np.stack([np.asarray(segment_key_points).reshape(-1, 2) for _, segment_key_points in court_key_point_segments])
+        # positions and heights are cast to the type of the key points, as the scalar math in get_mini_court_coordinates() does
+        dtype = np.result_type(segment_key_points, 0.0)
+        key_points = segment_key_points.astype(dtype)[court_key_point_segments.get_segment_indices(np.arange(number_of_frames))]
+
+        # boxes of shape (players, frames, 4), NaN where a player is not detected
+        player_bboxes = np.stack([player_table.to_dense(player_id) for player_id in player_ids])
+        detected = ~np.isnan(player_bboxes[..., 0])
+        player_centers = np.trunc((player_bboxes[..., 0:2] + player_bboxes[..., 2:4]) / 2)
+        foot_positions = np.stack([np.trunc((player_bboxes[..., 0] + player_bboxes[..., 2]) / 2), player_bboxes[..., 3]], axis=-1)
+
+        ball_bboxes = ball_table.to_dense(1)
+        ball_positions = np.trunc((ball_bboxes[:, 0:2] + ball_bboxes[:, 2:4]) / 2)
+        ball_distances = (((ball_positions - player_centers)**2).sum(axis=-1))**0.5
+        closest_player_to_ball = np.argmin(np.where(detected, ball_distances, np.inf), axis=0)
+        frames_with_players = np.flatnonzero(detected.any(axis=0))
+
+        # max height over frames [frame-20, frame+50): a rolling max over 70 frames, ending 49 frames after the frame
+        player_bbox_heights = player_bboxes[..., 3] - player_bboxes[..., 1]
+        padded_heights = np.concatenate([player_bbox_heights, np.full((len(player_ids), height_window_after-1), np.nan)], axis=1)
+        max_player_heights = pd.DataFrame(padded_heights.T).rolling(height_window_before+height_window_after, min_periods=1).max().to_numpy().T[:, height_window_after-1:]
+
+        def project(positions, frames, heights_in_pixels, heights_in_meters):
+            # Get The closest keypoint in pixels
+            candidate_distances = np.abs(positions[:, 1:2].astype(dtype) - key_points[frames][:, candidate_key_point_indices, 1])
+            closest_key_point_indices = candidate_key_point_indices[np.argmin(candidate_distances, axis=1)]
+            return self.get_mini_court_coordinates_batch(positions,
+                                                         key_points[frames, closest_key_point_indices],
+                                                         closest_key_point_indices,
+                                                         heights_in_pixels,
+                                                         heights_in_meters)
+
+        output_player_boxes = [{} for _ in range(number_of_frames)]
+        for player_index, player_id in enumerate(player_ids):
+            frames = np.flatnonzero(detected[player_index])
+            if len(frames) == 0:
+                continue
+            heights_in_meters = np.full(len(frames), player_heights[player_id])
+            positions = project(foot_positions[player_index, frames], frames, max_player_heights[player_index, frames], heights_in_meters)
+            for frame_num, mini_court_player_position in zip(frames.tolist(), positions.tolist()):
+                output_player_boxes[frame_num][player_id] = tuple(mini_court_player_position)
+
+        # the ball is placed in frames with at least one player, using the height of the player closest to it
+        closest_player_index = closest_player_to_ball[frames_with_players]
+        heights_in_meters = np.array([player_heights[player_ids[i]] for i in closest_player_index.tolist()], dtype=np.float64)
+        ball_mini_court_positions = project(ball_positions[frames_with_players],
+                                            frames_with_players,
+                                            max_player_heights[closest_player_index, frames_with_players],
+                                            heights_in_meters)
+        output_ball_boxes = [{1: tuple(position)} for position in ball_mini_court_positions.tolist()]
 
         return output_player_boxes , output_ball_boxes
     
@@ -306,17 +467,33 @@ class MiniCourt:
         """Draw the player and ball positions on the mini court
 
         Args:
-            frames: list of frames
-            postions: the positions of the players and the ball
+            frames: list or iterable of frames
+            postions: the positions of the players and the ball, one dictionary per frame in frames
             color: the color of the points as a tuple (R,G,B), defaults to (0,255,0)
 
         Returns:
-            _type_: _description_
+            list: list of frames with the positions drawn
+        """
+        output_frames = []
+        for frame, frame_positions in zip(frames, postions):
+            frame = self.draw_frame_points(frame, frame_positions, color)
+            output_frames.append(frame)
+        return output_frames
+
+    def draw_frame_points(self, frame, frame_positions, color=(0,255,0)):
+        """Draw the player or ball positions of one frame on the mini court, in place
+
+        Args:
+            frame: frame of the video
+            frame_positions (dict): the positions on the mini court for the frame, keyed by track ID
+            color: the color of the points as a tuple (B,G,R), defaults to (0,255,0)
+
+        Returns:
+            frame with the positions drawn
         """
-        for frame_num, frame in enumerate(frames):
-            for _, position in postions[frame_num].items():
-                x,y = position
-                x= int(x)
-                y= int(y)
-                cv2.circle(frame, (x,y), 5, color, -1)
-        return frames
\ No newline at end of file
+        for _, position in frame_positions.items():
+            x,y = position
+            x= int(x)
+            y= int(y)
+            cv2.circle(frame, (x,y), 5, color, -1)
+        return frame
\ No newline at end of file
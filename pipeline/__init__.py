@@ -0,0 +1,7 @@
+from .threaded_pipeline import ThreadedPipeline, ThreadedVideoReader, ThreadedVideoWriter
+from .frame_compositor import FrameCompositor
+from .sharded_runner import ShardedRunner, reconcile_track_ids
+from .live_pipeline import LivePipeline, LiveVideoSource
+from .model_worker import ModelWorker
+from .job_server import JobServer, JobClient
+from .batch_runner import BatchRunner, get_batch_clips
\ No newline at end of file
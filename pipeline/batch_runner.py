@@ -0,0 +1,270 @@
+import csv
+import os
+import time
+from Utils.keypoint_segments import CourtKeypointSegments
+from Utils.video_utils import chunk_frames
+from .threaded_pipeline import ThreadedVideoReader
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.m4v')
+
+
+def get_batch_clips(clips_path, output_dir="Media/outputs"):
+    """List the clips of a batch and their output paths
+
+    Args:
+        clips_path (str): directory of clips (the videos directly in it, by name), or manifest file of clips: a CSV file without
+            header with the path of a clip in the first column and optionally its output path in the second, relative paths
+            being relative to the manifest
+        output_dir (str): directory of the annotated clips without an output path, named after the clip, defaults to "Media/outputs"
+
+    Returns:
+        list: list of (input video path, output video path)
+    """
+    if os.path.isdir(clips_path):
+        rows = [[os.path.join(clips_path, name)] for name in sorted(os.listdir(clips_path)) if name.lower().endswith(VIDEO_EXTENSIONS)]
+        manifest_dir = ""
+    else:
+        with open(clips_path, newline='') as f:
+            rows = [[value.strip() for value in row] for row in csv.reader(f) if row and row[0].strip() and not row[0].startswith('#')]
+        manifest_dir = os.path.dirname(clips_path)
+
+    clips = []
+    for row in rows:
+        input_video_path = os.path.join(manifest_dir, row[0])
+        if len(row) > 1 and row[1]:
+            output_video_path = os.path.join(manifest_dir, row[1])
+        else:
+            output_video_path = os.path.join(output_dir, os.path.splitext(os.path.basename(input_video_path))[0] + ".avi")
+        clips.append((input_video_path, output_video_path))
+    return clips
+
+
+class BatchClip:
+    """
+    Class to hold the detection state of one clip of a BatchRunner: its decoder, keypoint schedule, player tracks and detections
+    """
+    def __init__(self, clip_index, video_path, frames_per_round, keypoint_scheduler, player_cache=None, ball_cache=None):
+        """Constructor for BatchClip class
+
+        Args:
+            clip_index (int): index of the clip in the batch
+            video_path (str): path to the clip
+            frames_per_round (int): number of frames of the clip decoded and detected per round
+            keypoint_scheduler (KeypointScheduler): schedule of the court keypoint detections of the clip
+            player_cache (DetectionCache): cache of the player detections of the clip, defaults to None
+            ball_cache (DetectionCache): cache of the ball detections of the clip, defaults to None
+        """
+        self.clip_index = clip_index
+        self.video_path = video_path
+        self.chunks = iter(ThreadedVideoReader(video_path, frames_per_round, queue_size=2))
+        self.keypoint_scheduler = keypoint_scheduler
+        self.player_cache = player_cache
+        self.ball_cache = ball_cache
+        # detections read from a complete cache are not detected again
+        self.player_detections = player_cache.load_all() if player_cache is not None and player_cache.is_complete() else None
+        self.ball_detections = ball_cache.load_all() if ball_cache is not None and ball_cache.is_complete() else None
+        self.detect_players = self.player_detections is None
+        self.detect_ball = self.ball_detections is None
+        if self.detect_players:
+            self.player_detections = []
+        if self.detect_ball:
+            self.ball_detections = []
+        self.court_keypoints = CourtKeypointSegments()
+        self.track_state = None
+        self.number_of_frames = 0
+        self.start_time = time.perf_counter()
+
+    def get_results(self):
+        """Get the detections of the clip once every frame is detected, saving the detected ones to the caches
+
+        Returns:
+            dict: court_keypoints as CourtKeypointSegments, player_detections and ball_detections as lists with one dictionary per frame,
+                the number of frames and the seconds from the start of the clip to the end of its detection
+        """
+        if self.detect_players and self.player_cache is not None:
+            self.player_cache.save_all(self.player_detections)
+        if self.detect_ball and self.ball_cache is not None:
+            self.ball_cache.save_all(self.ball_detections)
+        return {
+            'court_keypoints': self.court_keypoints,
+            'player_detections': self.player_detections,
+            'ball_detections': self.ball_detections,
+            'number_of_frames': self.number_of_frames,
+            'seconds': time.perf_counter() - self.start_time,
+        }
+
+
+class BatchRunner:
+    """
+    Class to run the detection stage of the analysis on a batch of clips, keeping the models busy with large batches even
+    when each clip is short. Up to max_active_clips clips are decoded at a time, on their own threads, and detected in rounds
+    of frames_per_round frames per clip. The frames of all the active clips are sent to the ball model in shared batches of
+    batch_size frames, and the frames scheduled for the court keypoints (see KeypointScheduler) to the ResNet model in shared
+    batches of keypoint_batch_size frames, an incomplete batch waiting for the frames of the next round; the detections are
+    routed back to their clip by position.
+    The players are tracked, so the frames of a clip must reach the tracker in order and apart from the other clips: the player
+    model runs once per clip and round, on the clip's frames of the round, with the tracks and the track ID count of that clip
+    restored around the call (see PlayerTracker.set_track_state()), so that a clip gets the same tracks and track IDs as when it
+    is tracked alone. A clip is returned as soon as its last frame is detected and the next clip takes its place.
+    """
+    def __init__(self, player_tracker, ball_tracker, court_line_detector, max_active_clips=4, frames_per_round=8, batch_size=16,
+                 keypoint_batch_size=16, keypoint_scheduler_options=None, use_detection_cache=True):
+        """Constructor for BatchRunner class
+
+        Args:
+            player_tracker (PlayerTracker): tracker of the players, with a stride of 1 and no inference region
+            ball_tracker (BallTracker): tracker of the ball, without a search window and no inference region
+            court_line_detector (CourtLineDetector): detector of the court keypoints
+            max_active_clips (int): number of clips decoded and detected at a time, defaults to 4
+            frames_per_round (int): number of frames of each active clip detected per round, which is also the batch of the player model, defaults to 8
+            batch_size (int): number of frames, from all the active clips, sent to the ball model in one call, defaults to 16
+            keypoint_batch_size (int): number of scheduled frames, from all the active clips, sent to the keypoints model in one call, defaults to 16
+            keypoint_scheduler_options (dict): keyword arguments of the KeypointScheduler of each clip, defaults to None
+            use_detection_cache (bool): read the player and ball detections of a clip from the detection cache when it holds them,
+                and save them to it otherwise, defaults to True
+        """
+        if player_tracker.stride > 1 or player_tracker.inference_region is not None:
+            raise ValueError("The player tracker of a BatchRunner must have a stride of 1 and no inference region")
+        if ball_tracker.search_window_size is not None or ball_tracker.inference_region is not None:
+            raise ValueError("The ball tracker of a BatchRunner must have no search window and no inference region")
+        self.player_tracker = player_tracker
+        self.ball_tracker = ball_tracker
+        self.court_line_detector = court_line_detector
+        self.max_active_clips = max_active_clips
+        self.frames_per_round = frames_per_round
+        self.batch_size = batch_size
+        self.keypoint_batch_size = keypoint_batch_size
+        self.keypoint_scheduler_options = keypoint_scheduler_options or {}
+        self.use_detection_cache = use_detection_cache
+        # frames waiting for a full batch of the keypoints model, as (clip, frame index, frame), and of the ball model, as (clip, frame)
+        self.scheduled_keypoint_frames = []
+        self.pending_ball_frames = []
+        self.stats = {'rounds': 0, 'ball_calls': 0, 'ball_frames': 0, 'player_calls': 0, 'player_frames': 0,
+                      'keypoint_calls': 0, 'keypoint_frames': 0}
+
+    def start_clip(self, clip_index, video_path):
+        """Start decoding a clip
+
+        Args:
+            clip_index (int): index of the clip in the batch
+            video_path (str): path to the clip
+
+        Returns:
+            BatchClip: state of the clip
+        """
+        from court_line_detector import KeypointScheduler
+        player_cache = ball_cache = None
+        if self.use_detection_cache:
+            player_cache = self.player_tracker.get_detection_cache(video_path)
+            ball_cache = self.ball_tracker.get_detection_cache(video_path)
+        keypoint_scheduler = KeypointScheduler(self.court_line_detector, **self.keypoint_scheduler_options)
+        return BatchClip(clip_index, video_path, self.frames_per_round, keypoint_scheduler, player_cache, ball_cache)
+
+    def detect_scheduled_keypoints(self):
+        """Detect the court keypoints of the scheduled frames of all the clips in shared batches, and add them to the segments of their clips"""
+        for batch in chunk_frames(self.scheduled_keypoint_frames, self.keypoint_batch_size):
+            keypoints = self.court_line_detector.predict_batch([frame for _, _, frame in batch], batch_size=self.keypoint_batch_size)
+            for (clip, frame_num, _), frame_keypoints in zip(batch, keypoints):
+                clip.court_keypoints.add_segment(frame_num, frame_keypoints)
+            self.stats['keypoint_calls'] += 1
+            self.stats['keypoint_frames'] += len(batch)
+        self.scheduled_keypoint_frames = []
+
+    def detect_pending_ball_frames(self, full_batches_only=False):
+        """Detect the ball in the pending frames of all the clips in shared batches, and add the detections to their clips
+
+        Args:
+            full_batches_only (bool): leave the frames of an incomplete last batch pending for the next round, defaults to False
+        """
+        number_of_frames = len(self.pending_ball_frames)
+        if full_batches_only:
+            number_of_frames -= number_of_frames % self.batch_size
+        for batch in chunk_frames(self.pending_ball_frames[:number_of_frames], self.batch_size):
+            ball_detections = self.ball_tracker.detect_batch([frame for _, frame in batch])
+            for (clip, _), ball_dict in zip(batch, ball_detections):
+                clip.ball_detections.append(ball_dict)
+            self.stats['ball_calls'] += 1
+            self.stats['ball_frames'] += len(batch)
+        self.pending_ball_frames = self.pending_ball_frames[number_of_frames:]
+
+    def detect_round(self, round_chunks):
+        """Detect one round: the next frames of each active clip
+
+        Args:
+            round_chunks: list of (BatchClip, list of the next frames of the clip)
+        """
+        # court keypoints, batched across the clips once enough frames are scheduled
+        for clip, frames in round_chunks:
+            for frame_num, frame in enumerate(frames, clip.number_of_frames):
+                if clip.keypoint_scheduler.schedule(frame_num, frame):
+                    self.scheduled_keypoint_frames.append((clip, frame_num, frame))
+        if len(self.scheduled_keypoint_frames) >= self.keypoint_batch_size:
+            self.detect_scheduled_keypoints()
+
+        # ball, batched across the clips and rounds
+        self.pending_ball_frames.extend((clip, frame) for clip, frames in round_chunks if clip.detect_ball for frame in frames)
+        self.detect_pending_ball_frames(full_batches_only=True)
+
+        # players, tracked clip by clip with the tracks of each clip
+        for clip, frames in round_chunks:
+            if not clip.detect_players:
+                continue
+            self.player_tracker.set_track_state(clip.track_state)
+            clip.player_detections.extend(self.player_tracker.detect_batch(frames))
+            clip.track_state = self.player_tracker.get_track_state()
+            self.stats['player_calls'] += 1
+            self.stats['player_frames'] += len(frames)
+
+        for clip, frames in round_chunks:
+            clip.number_of_frames += len(frames)
+        self.stats['rounds'] += 1
+
+    def run(self, video_paths):
+        """Detect the court keypoints, players and ball of clips
+
+        Args:
+            video_paths: list of paths to the clips
+
+        Yields:
+            tuple: (index of the clip in video_paths, its detections as returned by BatchClip.get_results()), as each clip is done
+        """
+        pending_clips = list(enumerate(video_paths))
+        active_clips = []
+        while active_clips or pending_clips:
+            while pending_clips and len(active_clips) < self.max_active_clips:
+                active_clips.append(self.start_clip(*pending_clips.pop(0)))
+
+            round_chunks = []
+            finished_clips = []
+            for clip in active_clips:
+                frames = next(clip.chunks, None)
+                if frames is None:
+                    finished_clips.append(clip)
+                else:
+                    round_chunks.append((clip, frames))
+            if round_chunks:
+                self.detect_round(round_chunks)
+
+            if finished_clips:
+                # the keypoints and ball of a finished clip may still wait for a full batch
+                self.detect_scheduled_keypoints()
+                self.detect_pending_ball_frames()
+                for clip in finished_clips:
+                    active_clips.remove(clip)
+                    yield clip.clip_index, clip.get_results()
+        # the tracks of the last clip do not continue in the next video tracked with the model
+        self.player_tracker.reset_tracks()
+
+    def format_stats(self):
+        """Format the number of model calls and their mean batch size
+
+        Returns:
+            str: the summary
+        """
+        lines = [f"{self.stats['rounds']} rounds"]
+        for model in ('keypoint', 'ball', 'player'):
+            calls = self.stats[f'{model}_calls']
+            frames = self.stats[f'{model}_frames']
+            mean_batch_size = f"{frames / calls:.1f}" if calls else '-'
+            lines.append(f"{model:<9} {calls:>6} calls {frames:>8} frames  mean batch {mean_batch_size}")
+        return "\n".join(lines)
@@ -0,0 +1,67 @@
+import time
+from Utils.instrumentation import timed
+
+
+class FrameCompositor:
+    """
+    Class to draw all the annotation layers of a frame in one visit. Chaining the draw_* methods of each class walks every
+    frame of a chunk once per overlay and rebuilds the list of frames each time; the compositor instead applies every layer
+    to a frame, in order, while it is still in cache, before moving on to the next frame.
+    A layer is a callable layer(frame, frame_num) drawing in place on the frame, frame_num being the index of the frame in the video.
+    """
+    def __init__(self, layers=None):
+        """Constructor for FrameCompositor class
+
+        Args:
+            layers: list of (name, layer) pairs, drawn in order, defaults to None (no layers)
+        """
+        self.layers = []
+        self.layer_seconds = {}
+        for name, layer in layers or []:
+            self.add_layer(name, layer)
+
+    def add_layer(self, name, layer):
+        """Add a layer drawn on top of the previous ones
+
+        Args:
+            name (str): name of the layer, used in the timings
+            layer: callable layer(frame, frame_num) drawing in place on the frame
+        """
+        self.layers.append((name, layer))
+        self.layer_seconds[name] = 0.0
+
+    def compose_frame(self, frame, frame_num, timed=False):
+        """Draw all the layers on one frame, in place
+
+        Args:
+            frame: frame of the video
+            frame_num (int): index of the frame in the video
+            timed (bool): add the time spent in each layer to layer_seconds, defaults to False
+
+        Returns:
+            frame with all the layers drawn
+        """
+        if not timed:
+            for _, layer in self.layers:
+                layer(frame, frame_num)
+            return frame
+        for name, layer in self.layers:
+            start_time = time.perf_counter()
+            layer(frame, frame_num)
+            self.layer_seconds[name] += time.perf_counter() - start_time
+        return frame
+
+    @timed(count_frames=len)
+    def compose(self, frames, start_frame=0, timed=False):
+        """Draw all the layers on each frame. The signature matches the process_chunk callable of ThreadedPipeline,
+        so compose can be passed directly to it.
+
+        Args:
+            frames: list or iterable of frames
+            start_frame (int): index of the first frame of frames in the video, defaults to 0
+            timed (bool): add the time spent in each layer to layer_seconds, defaults to False
+
+        Returns:
+            list: list of frames with all the layers drawn
+        """
+        return [self.compose_frame(frame, frame_num, timed) for frame_num, frame in enumerate(frames, start_frame)]
@@ -0,0 +1,426 @@
+"""Local job server running analysis jobs in model workers that keep the models loaded.
+
+Start the server from the root of the repository:
+    python -m pipeline.job_server serve --workers 2 --preload
+
+Submit clips and wait for them:
+    python -m pipeline.job_server submit Media/rally_*.mp4 --output-dir Media/outputs --options '{"projection_method": "height"}' --wait
+
+HTTP API (JSON):
+    POST /jobs          {"input_video_path": ..., "output_video_path": ..., "options": {...keyword arguments of main()}} -> the job
+    GET  /jobs          all the jobs, and the number of jobs per status
+    GET  /jobs/<job_id> one job, with its status, progress and timings
+    GET  /health        the workers and the number of queued jobs
+"""
+import argparse
+import inspect
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from Utils.video_utils import get_video_frame_count
+from .model_worker import ModelWorker
+
+DEFAULT_PORT = 8765
+MODEL_PATHS = {
+    'keypoints': "Models/keypoints_model.pth",
+    'player': "Models/yolov8x.pt",
+    'ball': "Models/yolov5_best.pt",
+}
+
+
+class Job:
+    """
+    Class to hold an analysis job of the job server: its arguments, its status (queued, running, done or failed), its progress and its timings
+    """
+    def __init__(self, job_id, input_video_path, output_video_path, options=None):
+        """Constructor for Job class
+
+        Args:
+            job_id (int): ID of the job
+            input_video_path (str): path to the input video
+            output_video_path (str): path to save the annotated video
+            options (dict): other keyword arguments of main(), defaults to None
+        """
+        self.job_id = job_id
+        self.input_video_path = input_video_path
+        self.output_video_path = output_video_path
+        self.options = options or {}
+        self.status = 'queued'
+        self.worker_index = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.frames_done = None
+        self.frames_total = None
+        self.result = {}
+        self.error = None
+
+    def to_dict(self):
+        """Get the job as a JSON-serializable dictionary
+
+        Returns:
+            dict: arguments, status, worker, progress in frames, timings and error of the job
+        """
+        now = time.time()
+        return {
+            'job_id': self.job_id,
+            'input_video_path': self.input_video_path,
+            'output_video_path': self.output_video_path,
+            'options': self.options,
+            'status': self.status,
+            'worker': self.worker_index,
+            'frames_done': self.frames_done,
+            'frames_total': self.frames_total,
+            'submitted_at': self.submitted_at,
+            'queued_seconds': (self.started_at or now) - self.submitted_at,
+            'running_seconds': (self.finished_at or now) - self.started_at if self.started_at is not None else None,
+            'job_seconds': self.result.get('seconds'),
+            'model_load_seconds': self.result.get('model_load_seconds'),
+            'stage_seconds': self.result.get('stage_seconds'),
+            'error': self.error,
+        }
+
+
+class JobServer:
+    """
+    Class to run analysis jobs submitted over a localhost HTTP API. The jobs wait in a queue and are run by number_of_workers
+    ModelWorker processes, each loading the models once and keeping them loaded across jobs, so at most number_of_workers jobs
+    run at a time and a batch of short clips pays for the model loading once per worker and not once per clip.
+    """
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, number_of_workers=1, preload_model_paths=None, max_queued_jobs=None, job_target="main:main",
+                 progress_stage="FrameCompositor.compose"):
+        """Constructor for JobServer class
+
+        Args:
+            host (str): address the server listens on, defaults to "127.0.0.1" (local connections only)
+            port (int): port the server listens on, 0 for any free port, defaults to 8765
+            number_of_workers (int): number of model workers, i.e. of jobs running at a time, defaults to 1
+            preload_model_paths (dict): paths of the models loaded when each worker starts (see ModelWorker), None to load them on the first job, defaults to None
+            max_queued_jobs (int): maximum number of jobs waiting to run, further jobs being refused, None for no limit, defaults to None
+            job_target (str): "module:function" running a job, defaults to "main:main"
+            progress_stage (str): name of the timed stage whose frames are the frames done of a running job, None to report no
+                progress, defaults to "FrameCompositor.compose", the annotation of the frames by main() after their detection
+        """
+        self.host = host
+        self.port = port
+        self.number_of_workers = number_of_workers
+        self.preload_model_paths = preload_model_paths
+        self.max_queued_jobs = max_queued_jobs
+        self.job_target = job_target
+        self.progress_stage = progress_stage
+        self.jobs = {}
+        self.job_ids = itertools.count(1)
+        self.job_queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.workers = []
+        self.dispatcher_threads = []
+        self.http_server = None
+
+    def get_job_parameters(self):
+        """Get the names of the keyword arguments accepted by the job function
+
+        Returns:
+            set: names of the parameters, None if the function accepts any keyword argument
+        """
+        from .model_worker import load_job_target
+        parameters = inspect.signature(load_job_target(self.job_target)).parameters
+        if any(parameter.kind == inspect.Parameter.VAR_KEYWORD for parameter in parameters.values()):
+            return None
+        return set(parameters)
+
+    def start(self):
+        """Start the model workers, the dispatcher threads and the HTTP server
+
+        Returns:
+            JobServer: self
+        """
+        # importing main is cheap, its heavy modules being imported by the workers when the models load
+        self.job_parameters = self.get_job_parameters()
+        for worker_index in range(self.number_of_workers):
+            worker = ModelWorker(self.job_target, self.preload_model_paths, collect_stage_timings=True, progress_stage=self.progress_stage).start()
+            self.workers.append(worker)
+            thread = threading.Thread(target=self.dispatch, args=(worker_index,), name=f'dispatcher_{worker_index}', daemon=True)
+            thread.start()
+            self.dispatcher_threads.append(thread)
+
+        self.http_server = ThreadingHTTPServer((self.host, self.port), JobRequestHandler)
+        self.http_server.job_server = self
+        self.port = self.http_server.server_address[1]
+        threading.Thread(target=self.http_server.serve_forever, name='http_server', daemon=True).start()
+        return self
+
+    def submit(self, input_video_path, output_video_path, options=None):
+        """Add a job to the queue
+
+        Args:
+            input_video_path (str): path to the input video
+            output_video_path (str): path to save the annotated video
+            options (dict): other keyword arguments of main(), defaults to None
+
+        Returns:
+            Job: the queued job
+        """
+        options = options or {}
+        if not isinstance(options, dict):
+            raise ValueError("options must be a JSON object")
+        reserved_options = {'input_video_path', 'output_video_path'} & set(options)
+        if reserved_options:
+            raise ValueError(f"Options cannot set {', '.join(sorted(reserved_options))}, which are arguments of the job")
+        if not os.path.isfile(input_video_path):
+            raise ValueError(f"Input video not found: {input_video_path}")
+        if self.job_parameters is not None:
+            unknown_options = set(options) - self.job_parameters
+            if unknown_options:
+                raise ValueError(f"Unknown options: {', '.join(sorted(unknown_options))}")
+        with self.lock:
+            if self.max_queued_jobs is not None and self.job_queue.qsize() >= self.max_queued_jobs:
+                raise OverflowError("The job queue is full")
+            job = Job(next(self.job_ids), input_video_path, output_video_path, options)
+            self.jobs[job.job_id] = job
+        self.job_queue.put(job)
+        return job
+
+    def dispatch(self, worker_index):
+        """Run the queued jobs on one model worker, restarting the worker if its process dies
+
+        Args:
+            worker_index (int): index of the worker in workers
+        """
+        worker = self.workers[worker_index]
+        while True:
+            job = self.job_queue.get()
+            if job is None:
+                break
+            job.status = 'running'
+            job.worker_index = worker_index
+            job.started_at = time.time()
+            try:
+                if self.progress_stage is not None:
+                    frames_total = get_video_frame_count(job.input_video_path)
+                    # the container of some videos does not report their number of frames
+                    job.frames_total = frames_total if frames_total > 0 else None
+                    job.frames_done = 0
+                if not worker.is_alive():
+                    worker.start()
+                job.result = worker.run_job(lambda frames_done: setattr(job, 'frames_done', frames_done),
+                                            input_video_path=job.input_video_path, output_video_path=job.output_video_path, **job.options)
+                job.frames_done = job.result.get('frames_done', job.frames_done)
+                job.status = 'done'
+            except Exception as error:
+                # a failed job must not stop the dispatcher, or the queued jobs would never run
+                job.error = str(error) if isinstance(error, RuntimeError) else f"{type(error).__name__}: {error}"
+                job.status = 'failed'
+            job.finished_at = time.time()
+
+    def get_status(self):
+        """Get the state of the server
+
+        Returns:
+            dict: the workers, the number of queued jobs and the number of jobs per status
+        """
+        with self.lock:
+            jobs = list(self.jobs.values())
+        return {
+            'workers': [{'alive': worker.is_alive(), 'startup_seconds': worker.startup_seconds, 'model_load_seconds': worker.model_load_seconds}
+                        for worker in self.workers],
+            'queued_jobs': self.job_queue.qsize(),
+            'jobs_per_status': {status: sum(job.status == status for job in jobs) for status in ('queued', 'running', 'done', 'failed')},
+        }
+
+    def stop(self):
+        """Stop the HTTP server, then the workers once their current jobs are done; queued jobs are not run"""
+        if self.http_server is not None:
+            self.http_server.shutdown()
+            self.http_server.server_close()
+        while True:
+            try:
+                self.job_queue.get_nowait()
+            except queue.Empty:
+                break
+        for _ in self.dispatcher_threads:
+            self.job_queue.put(None)
+        for thread in self.dispatcher_threads:
+            thread.join()
+        for worker in self.workers:
+            worker.stop()
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """
+    Class to handle the HTTP requests of a JobServer, set as the job_server attribute of the HTTP server
+    """
+    def send_json(self, status_code, body):
+        """Send a JSON response
+
+        Args:
+            status_code (int): HTTP status code
+            body: JSON-serializable body
+        """
+        data = json.dumps(body).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        job_server = self.server.job_server
+        if self.path == '/health':
+            self.send_json(200, job_server.get_status())
+        elif self.path == '/jobs':
+            with job_server.lock:
+                jobs = list(job_server.jobs.values())
+            self.send_json(200, {'jobs': [job.to_dict() for job in jobs], **job_server.get_status()})
+        elif self.path.startswith('/jobs/'):
+            job_id = self.path[len('/jobs/'):]
+            job = job_server.jobs.get(int(job_id)) if job_id.isdigit() else None
+            if job is None:
+                self.send_json(404, {'error': f"Unknown job: {job_id}"})
+            else:
+                self.send_json(200, job.to_dict())
+        else:
+            self.send_json(404, {'error': f"Unknown path: {self.path}"})
+
+    def do_POST(self):
+        if self.path != '/jobs':
+            self.send_json(404, {'error': f"Unknown path: {self.path}"})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            job = self.server.job_server.submit(body['input_video_path'], body['output_video_path'], body.get('options'))
+        except (ValueError, KeyError, TypeError) as error:
+            self.send_json(400, {'error': f"Invalid job: {error}"})
+            return
+        except OverflowError as error:
+            self.send_json(503, {'error': str(error)})
+            return
+        self.send_json(202, job.to_dict())
+
+    def log_message(self, format, *args):
+        # the jobs are reported by the API, not on stderr
+        pass
+
+
+class JobClient:
+    """
+    Class to submit jobs to a JobServer and follow them
+    """
+    def __init__(self, url=f"http://127.0.0.1:{DEFAULT_PORT}"):
+        """Constructor for JobClient class
+
+        Args:
+            url (str): URL of the server, defaults to http://127.0.0.1:8765
+        """
+        self.url = url.rstrip('/')
+
+    def request(self, method, path, body=None):
+        """Send a request to the server
+
+        Args:
+            method (str): HTTP method
+            path (str): path of the request
+            body: JSON-serializable body, defaults to None
+
+        Returns:
+            the JSON body of the response
+        """
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.url + path, data=data, method=method, headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as error:
+            raise RuntimeError(json.loads(error.read()).get('error', str(error))) from None
+
+    def submit(self, input_video_path, output_video_path, **options):
+        """Submit a job
+
+        Args:
+            input_video_path (str): path to the input video, as seen by the server
+            output_video_path (str): path to save the annotated video, as seen by the server
+            **options: other keyword arguments of main()
+
+        Returns:
+            dict: the queued job
+        """
+        return self.request('POST', '/jobs', {'input_video_path': input_video_path, 'output_video_path': output_video_path, 'options': options})
+
+    def get_job(self, job_id):
+        """Get a job
+
+        Args:
+            job_id (int): ID of the job
+
+        Returns:
+            dict: the job
+        """
+        return self.request('GET', f'/jobs/{job_id}')
+
+    def wait(self, job_ids, poll_interval=0.5):
+        """Wait until jobs are done or failed
+
+        Args:
+            job_ids: IDs of the jobs
+            poll_interval (float): seconds between two polls, defaults to 0.5
+
+        Returns:
+            list: the finished jobs, in the order of job_ids
+        """
+        while True:
+            jobs = [self.get_job(job_id) for job_id in job_ids]
+            if all(job['status'] in ('done', 'failed') for job in jobs):
+                return jobs
+            time.sleep(poll_interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    serve_parser = subparsers.add_parser('serve', help="run the job server")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument("--workers", type=int, default=1, help="number of model workers, i.e. of jobs running at a time")
+    serve_parser.add_argument("--preload", action="store_true", help="load the models when the workers start")
+    serve_parser.add_argument("--max-queued-jobs", type=int, default=None)
+    submit_parser = subparsers.add_parser('submit', help="submit videos to a running job server")
+    submit_parser.add_argument("videos", nargs="+")
+    submit_parser.add_argument("--output-dir", default="Media/outputs")
+    submit_parser.add_argument("--options", default="{}", help="JSON of other keyword arguments of main()")
+    submit_parser.add_argument("--url", default=f"http://127.0.0.1:{DEFAULT_PORT}")
+    submit_parser.add_argument("--wait", action="store_true", help="wait for the jobs and print their timings")
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        job_server = JobServer(args.host, args.port, args.workers, MODEL_PATHS if args.preload else None, args.max_queued_jobs).start()
+        print(f"job server listening on http://{job_server.host}:{job_server.port} with {args.workers} workers")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            job_server.stop()
+        return
+
+    job_client = JobClient(args.url)
+    options = json.loads(args.options)
+    job_ids = []
+    for video_path in args.videos:
+        output_video_path = os.path.join(args.output_dir, os.path.splitext(os.path.basename(video_path))[0] + ".avi")
+        job = job_client.submit(os.path.abspath(video_path), os.path.abspath(output_video_path), **options)
+        job_ids.append(job['job_id'])
+        print(f"job {job['job_id']}: {video_path}")
+    if args.wait:
+        for job in job_client.wait(job_ids):
+            job_seconds = f"{job['job_seconds']:.2f}" if job['job_seconds'] is not None else '-'
+            frames = f", {job['frames_done']}/{job['frames_total']} frames" if job['frames_done'] is not None else ""
+            print(f"job {job['job_id']} {job['status']:<6} queued {job['queued_seconds']:.2f} s, ran {job_seconds} s{frames}"
+                  + (f"\n{job['error']}" if job['error'] else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+import cv2
+import numpy as np
+from Trackers.online_filters import FixedLagBallInterpolator, OnlineShotDetector
+from Utils.match_stats import MatchStatsAccumulator
+from Utils.player_stats_drawer import PlayerStatsPanel, PLAYER_STATS_COLUMNS
+from Utils.video_writers import DEFAULT_FPS, get_video_writer
+from mini_court.mini_court import MiniCourt
+from .frame_compositor import FrameCompositor
+from .threaded_pipeline import END_OF_VIDEO
+
+
+class LiveVideoSource:
+    """
+    Class to read frames from a cv2.VideoCapture source (a camera index, a stream URL or a video file) in a background thread.
+    Only the latest frames are kept: when the consumer falls behind, the oldest waiting frame is dropped instead of letting
+    the latency grow. A video file can be replayed at its frame rate to stand in for a camera.
+    """
+    def __init__(self, source, realtime=False, queue_size=2, drop_frames=None):
+        """Constructor for LiveVideoSource class
+
+        Args:
+            source: camera index (int), stream URL or path to a video file
+            realtime (bool): replay a video file at its frame rate instead of as fast as it decodes, defaults to False
+            queue_size (int): maximum number of frames waiting for the consumer, defaults to 2
+            drop_frames (bool): drop the oldest waiting frame when the queue is full instead of waiting,
+                defaults to True for cameras, streams and real-time replays and False for video files read as fast as possible
+        """
+        self.source = source
+        self.is_file = isinstance(source, str) and os.path.isfile(source)
+        self.realtime = realtime
+        self.drop_frames = drop_frames if drop_frames is not None else (realtime or not self.is_file)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.fps = DEFAULT_FPS
+        self.number_of_dropped_frames = 0
+        self.error = None
+
+    def start(self):
+        """Open the source and start the capture thread
+
+        Returns:
+            LiveVideoSource: self
+        """
+        self.capture = cv2.VideoCapture(self.source)
+        if not self.capture.isOpened():
+            raise IOError(f"Could not open video source {self.source}")
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS
+        self.thread = threading.Thread(target=self.read_frames, daemon=True)
+        self.thread.start()
+        return self
+
+    def read_frames(self):
+        """Read the frames and put (frame, capture time, video time in seconds) on the queue, followed by END_OF_VIDEO"""
+        try:
+            start_time = time.perf_counter()
+            frame_index = 0
+            while not self.stop_event.is_set():
+                if self.realtime and self.is_file:
+                    delay = start_time + frame_index / self.fps - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                ret, frame = self.capture.read()
+                if not ret:
+                    break
+                capture_time = time.perf_counter()
+                # files are timed by their frame rate, live sources by the clock
+                video_time = frame_index / self.fps if self.is_file else capture_time - start_time
+                frame_index += 1
+                self.put((frame, capture_time, video_time))
+        except Exception as error:
+            self.error = error
+        finally:
+            self.capture.release()
+            self.put(END_OF_VIDEO, drop=False)
+
+    def put(self, item, drop=None):
+        """Put an item on the queue, dropping the oldest waiting frame if the queue is full and frames may be dropped
+
+        Args:
+            item: item to put
+            drop (bool): whether a waiting frame may be dropped, defaults to drop_frames
+        """
+        drop = self.drop_frames if drop is None else drop
+        while not self.stop_event.is_set():
+            if drop:
+                try:
+                    self.queue.put_nowait(item)
+                    return
+                except queue.Full:
+                    try:
+                        self.queue.get_nowait()
+                        self.number_of_dropped_frames += 1
+                    except queue.Empty:
+                        pass
+            else:
+                try:
+                    self.queue.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+    def stop(self):
+        """Stop the capture thread"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def __iter__(self):
+        """Iterate over the captured frames
+
+        Yields:
+            tuple: (frame, capture time from time.perf_counter(), video time in seconds)
+        """
+        while True:
+            item = self.queue.get()
+            if item is END_OF_VIDEO:
+                if self.error is not None:
+                    raise self.error
+                return
+            yield item
+
+
+class LivePipeline:
+    """
+    Class to run the analysis on a live source frame by frame, with a bounded latency. The steps of the offline analysis that
+    look ahead over the whole video are replaced by causal, fixed-lag versions:
+    - missing ball detections are interpolated by FixedLagBallInterpolator, a frame waiting at most interpolation_lag frames,
+    - the player heights of the "height" projection are taken over frames [frame-20, frame+height_window_after] instead of [frame-20, frame+50),
+    - ball hits are detected by OnlineShotDetector, which confirms a hit 30 frames after it.
+    Annotated frames are therefore emitted interpolation_lag (+ height_window_after) frames after they are captured, and the stats
+    of a shot are shown once the next shot is confirmed, as its speeds are measured up to the next shot.
+    """
+    def __init__(self, player_tracker, ball_tracker, keypoint_scheduler, output_video_path=None, ball_detector=None,
+                 projection_method="homography", interpolation_lag=5, height_window_after=10,
+                 writer_backend='cv2', writer_options=None, display=False):
+        """Constructor for LivePipeline class
+
+        Args:
+            player_tracker (PlayerTracker): tracker of the players, tracking across the frames
+            ball_tracker (BallTracker): tracker of the ball
+            keypoint_scheduler (KeypointScheduler): scheduler of the court keypoint detection, see KeypointScheduler.update()
+            output_video_path (str): path of the annotated video, None to not save it, defaults to None
+            ball_detector (WindowedBallDetector): detector of the ball in a search window, None to detect in the whole frame, defaults to None
+            projection_method (str): "homography" or "height", see MiniCourt.convert_bounding_boxes_to_mini_court_coordinates(), defaults to "homography"
+            interpolation_lag (int): maximum number of frames a frame waits for the next ball detection, defaults to 5
+            height_window_after (int): number of frames after a frame in the player height window of the "height" projection, defaults to 10
+            writer_backend (str): backend of the video writer, see get_video_writer(), defaults to 'cv2'
+            writer_options (dict): keyword arguments of the video writer, defaults to None
+            display (bool): show the annotated frames in a window, defaults to False
+        """
+        self.player_tracker = player_tracker
+        self.ball_tracker = ball_tracker
+        self.keypoint_scheduler = keypoint_scheduler
+        self.output_video_path = output_video_path
+        self.detect_ball = ball_detector.detect_frame if ball_detector is not None else ball_tracker.detect_frame
+        if projection_method not in ("homography", "height"):
+            raise ValueError(f"Unknown projection method: {projection_method}")
+        self.projection_method = projection_method
+        self.height_window_before = 20
+        self.height_window_after = height_window_after if projection_method == "height" else 0
+        self.writer_backend = writer_backend
+        self.writer_options = writer_options or {}
+        self.display = display
+
+        self.ball_interpolator = FixedLagBallInterpolator(interpolation_lag)
+        self.shot_detector = OnlineShotDetector()
+        self.match_stats = MatchStatsAccumulator()
+        self.stats_panel = PlayerStatsPanel()
+        self.compositor = FrameCompositor([
+            ('player_bboxes', lambda frame, frame_num: self.player_tracker.draw_frame_bboxes(frame, self.current['players'])),
+            ('ball_bboxes', lambda frame, frame_num: self.ball_tracker.draw_frame_bboxes(frame, self.current['ball'])),
+            ('court_keypoints', lambda frame, frame_num: self.keypoint_scheduler.court_line_detector.draw_keypoints(frame, self.current['keypoints'])),
+            ('mini_court', lambda frame, frame_num: self.mini_court.draw_overlay(frame)),
+            ('mini_court_players', lambda frame, frame_num: self.mini_court.draw_frame_points(frame, self.current['player_positions'])),
+            ('mini_court_ball', lambda frame, frame_num: self.mini_court.draw_frame_points(frame, self.current['ball_position'], color=(0, 255, 255))),
+            ('player_stats', lambda frame, frame_num: self.stats_panel.draw(frame, self.match_stats.values_at(frame_num, PLAYER_STATS_COLUMNS))),
+            ('frame_number', lambda frame, frame_num: cv2.putText(frame, f"Frame: {frame_num+1}", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2, cv2.LINE_AA)),
+        ])
+        self.reset()
+
+    def reset(self):
+        """Reset the state of the pipeline before a new source"""
+        self.number_of_frames = 0
+        self.next_output_frame = 0
+        self.chosen_players = None
+        self.mini_court = None
+        self.writer = None
+        self.fps = DEFAULT_FPS
+        # per-frame state, from capture until the frame is emitted
+        self.frames = {}
+        self.projection_queue = deque()
+        self.height_window = deque()
+        # mini court positions and video times of the recent frames, for the speeds of the shots
+        self.recent_positions = {}
+        self.last_shot = None
+        self.latencies = []
+        self.number_of_dropped_frames = 0
+        self.wall_seconds = 0.0
+
+    def process_frame(self, frame, capture_time, video_time):
+        """Detect the players, the ball and the court keypoints of a captured frame, and emit the frames that are ready
+
+        Args:
+            frame: BGR frame
+            capture_time (float): time.perf_counter() when the frame was captured
+            video_time (float): time of the frame in the video in seconds
+        """
+        frame_num = self.number_of_frames
+        self.number_of_frames += 1
+        if self.mini_court is None:
+            self.mini_court = MiniCourt(frame)
+
+        keypoints = self.keypoint_scheduler.update(frame_num, frame)
+        player_dict = self.player_tracker.detect_frame(frame)
+        if self.chosen_players is None:
+            self.chosen_players = self.player_tracker.choose_players(keypoints, player_dict)
+        player_dict = {track_id: bbox for track_id, bbox in player_dict.items() if track_id in self.chosen_players}
+        ball_dict = self.detect_ball(frame)
+
+        self.frames[frame_num] = {
+            'frame': frame,
+            'capture_time': capture_time,
+            'video_time': video_time,
+            'keypoints': keypoints,
+            'players': player_dict,
+        }
+        for released_frame_num, interpolated_ball_dict in self.ball_interpolator.push(frame_num, ball_dict):
+            self.add_ball(released_frame_num, interpolated_ball_dict)
+        self.emit_ready_frames()
+
+    def add_ball(self, frame_num, ball_dict):
+        """Set the interpolated ball of a frame, and project the frames whose player height window is complete
+
+        Args:
+            frame_num (int): index of the frame
+            ball_dict (dict): dictionary containing the interpolated bounding box of the ball
+        """
+        self.frames[frame_num]['ball'] = ball_dict
+        self.projection_queue.append(frame_num)
+        if self.projection_method == "height":
+            # the boxes are kept here as the frames before a frame may already be emitted when it is projected
+            self.height_window.append((frame_num, self.frames[frame_num]['players'], ball_dict))
+            while self.height_window[0][0] < frame_num - self.height_window_before - self.height_window_after:
+                self.height_window.popleft()
+        while self.projection_queue and self.projection_queue[0] + self.height_window_after <= frame_num:
+            self.project_frame(self.projection_queue.popleft())
+
+    def project_frame(self, frame_num):
+        """Convert the players and the ball of a frame to mini court coordinates, and feed the ball to the shot detector
+
+        Args:
+            frame_num (int): index of the frame
+        """
+        state = self.frames[frame_num]
+        if self.projection_method == "homography":
+            player_positions, ball_positions = self.mini_court.convert_with_homography([state['players']], [state['ball']], state['keypoints'])
+            state['player_positions'] = player_positions[0]
+            state['ball_position'] = ball_positions[0]
+        else:
+            # the window of frames [frame-20, frame+height_window_after], with the key points of the frame
+            window = [frame_boxes for frame_boxes in self.height_window if frame_boxes[0] >= frame_num - self.height_window_before]
+            player_boxes = [player_dict for _, player_dict, _ in window]
+            ball_boxes = [ball_dict for _, _, ball_dict in window]
+            player_positions, ball_positions = self.mini_court.convert_with_player_heights(player_boxes, ball_boxes, state['keypoints'])
+            index = [window_frame_num for window_frame_num, _, _ in window].index(frame_num)
+            frames_with_players = [i for i, player_dict in enumerate(player_boxes) if player_dict]
+            state['player_positions'] = player_positions[index]
+            state['ball_position'] = ball_positions[frames_with_players.index(index)] if index in frames_with_players else {}
+            if not state['ball']:
+                # before the first ball detection the ball is unknown, and projecting it would give NaN positions
+                state['ball_position'] = {}
+
+        self.recent_positions[frame_num] = (state['player_positions'], state['ball_position'], state['video_time'])
+        shot_frame_num = self.shot_detector.push(state['ball'])
+        if shot_frame_num is not None:
+            self.add_shot(shot_frame_num)
+        # a hit is confirmed 30 frames after it, so older positions are no longer needed
+        self.recent_positions.pop(frame_num - self.shot_detector.following_frames - 1, None)
+
+    def add_shot(self, frame_num):
+        """Record the shot ending at a confirmed hit, from the previous hit to this one
+
+        Args:
+            frame_num (int): frame of the hit
+        """
+        player_positions, ball_position, video_time = self.recent_positions[frame_num]
+        if self.last_shot is not None:
+            start_frame, start_player_positions, start_ball_position, start_video_time = self.last_shot
+            if set(start_player_positions) >= {1, 2} and set(player_positions) >= {1, 2} and 1 in start_ball_position and 1 in ball_position:
+                self.match_stats.add_shot_from_positions(start_frame, video_time - start_video_time,
+                                                         start_player_positions, start_ball_position[1],
+                                                         player_positions, ball_position[1],
+                                                         self.mini_court.get_width_of_mini_court())
+        self.last_shot = (frame_num, player_positions, ball_position, video_time)
+
+    def emit_ready_frames(self):
+        """Annotate, write and show the frames projected to the mini court, in order"""
+        while self.next_output_frame in self.frames and 'player_positions' in self.frames[self.next_output_frame]:
+            frame_num = self.next_output_frame
+            self.current = self.frames.pop(frame_num)
+            frame = self.compositor.compose_frame(self.current['frame'], frame_num)
+            if self.output_video_path is not None:
+                if self.writer is None:
+                    self.writer = get_video_writer(self.output_video_path, self.fps, self.writer_backend, **self.writer_options)
+                self.writer.write(frame)
+            if self.display:
+                cv2.imshow("Live analysis", frame)
+                cv2.waitKey(1)
+            self.latencies.append(time.perf_counter() - self.current['capture_time'])
+            self.next_output_frame += 1
+
+    def flush(self):
+        """Release the frames still waiting at the end of the source"""
+        for frame_num, ball_dict in self.ball_interpolator.flush():
+            self.add_ball(frame_num, ball_dict)
+        while self.projection_queue:
+            self.project_frame(self.projection_queue.popleft())
+        self.emit_ready_frames()
+
+    def run(self, source, realtime=False, max_frames=None):
+        """Run the analysis on a source until it ends
+
+        Args:
+            source: camera index (int), stream URL or path to a video file, see LiveVideoSource
+            realtime (bool): replay a video file at its frame rate, defaults to False
+            max_frames (int): stop after this number of captured frames, None to run until the source ends, defaults to None
+
+        Returns:
+            dict: stats of the run, see get_stats()
+        """
+        self.reset()
+        video_source = LiveVideoSource(source, realtime=realtime).start()
+        self.fps = video_source.fps
+        start_time = time.perf_counter()
+        try:
+            for frame, capture_time, video_time in video_source:
+                self.process_frame(frame, capture_time, video_time)
+                if max_frames is not None and self.number_of_frames >= max_frames:
+                    break
+            self.flush()
+        finally:
+            video_source.stop()
+            self.number_of_dropped_frames = video_source.number_of_dropped_frames
+            if self.writer is not None:
+                self.writer.close()
+            if self.display:
+                cv2.destroyAllWindows()
+        self.wall_seconds = time.perf_counter() - start_time
+        return self.get_stats()
+
+    def get_stats(self):
+        """Get the stats of the last run
+
+        Returns:
+            dict: numbers of processed and dropped frames, throughput in frames/sec and end-to-end latency percentiles in milliseconds
+        """
+        latencies = np.array(self.latencies) * 1000
+        has_latencies = len(latencies) > 0
+        return {
+            'frames': len(self.latencies),
+            'dropped_frames': self.number_of_dropped_frames,
+            'fps': len(self.latencies) / self.wall_seconds if self.wall_seconds > 0 else 0.0,
+            'latency_p50_ms': float(np.percentile(latencies, 50)) if has_latencies else 0.0,
+            'latency_p90_ms': float(np.percentile(latencies, 90)) if has_latencies else 0.0,
+            'latency_p99_ms': float(np.percentile(latencies, 99)) if has_latencies else 0.0,
+            'latency_max_ms': float(latencies.max()) if has_latencies else 0.0,
+        }
+
+    def format_stats(self):
+        """Format the stats of the last run as text
+
+        Returns:
+            str: one line of stats
+        """
+        stats = self.get_stats()
+        return (f"frames={stats['frames']} dropped={stats['dropped_frames']} fps={stats['fps']:.2f} "
+                f"latency ms p50={stats['latency_p50_ms']:.1f} p90={stats['latency_p90_ms']:.1f} "
+                f"p99={stats['latency_p99_ms']:.1f} max={stats['latency_max_ms']:.1f}")
@@ -0,0 +1,236 @@
+import importlib
+import multiprocessing
+import queue
+import threading
+import time
+import traceback
+
+
+def load_job_target(job_target):
+    """Import the function running a job
+
+    Args:
+        job_target (str): "module:function", e.g. "main:main"
+
+    Returns:
+        the function
+    """
+    module_name, function_name = job_target.split(':')
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def preload_models(model_paths):
+    """Load models into the ModelRegistry of this process
+
+    Args:
+        model_paths (dict): paths of the models to load, keyed by 'keypoints', 'player' and 'ball'
+    """
+    from Utils.model_registry import model_registry, load_yolo_model
+    for kind in ('player', 'ball'):
+        if model_paths.get(kind) is not None:
+            model_registry.get(('yolo', model_paths[kind]), lambda model_path=model_paths[kind]: load_yolo_model(model_path))
+    if model_paths.get('keypoints') is not None:
+        from court_line_detector import CourtLineDetector
+        CourtLineDetector(model_paths['keypoints']).model
+
+
+def get_stage_frames(stage):
+    """Get the number of frames handled so far by a timed stage of the TimerRegistry
+
+    Args:
+        stage (str): name of the stage
+
+    Returns:
+        int: number of frames, 0 if the stage has not run
+    """
+    from Utils.instrumentation import timer_registry
+    with timer_registry.lock:
+        return timer_registry.stages.get(stage, {}).get('frames', 0)
+
+
+def report_progress(result_queue, progress_stage, progress_interval, stop_event):
+    """Put the number of frames handled by a stage on result_queue every progress_interval seconds, until stop_event is set
+
+    Args:
+        result_queue: queue of the messages of the worker
+        progress_stage (str): name of the timed stage whose frames are the progress of the job
+        progress_interval (float): seconds between two progress messages
+        stop_event: threading.Event set when the job is over
+    """
+    while not stop_event.wait(progress_interval):
+        result_queue.put({'frames_done': get_stage_frames(progress_stage)})
+
+
+def run_worker(job_queue, result_queue, job_target, preload_model_paths, collect_stage_timings=False, progress_stage=None, progress_interval=1.0):
+    """Loop of the worker process: import the analysis once, optionally load its models, then run the jobs of job_queue until None
+
+    Args:
+        job_queue: queue of the keyword arguments of the jobs, None to stop
+        result_queue: queue of the results, a ready message first and then, for each job, progress messages and its result
+        job_target (str): "module:function" of the function running a job
+        preload_model_paths (dict): paths of the models to load before the first job, None to load them on first use
+        collect_stage_timings (bool): time the stages of each job with the TimerRegistry, defaults to False
+        progress_stage (str): name of the timed stage whose frames are reported as the progress of a job, None to report no progress, defaults to None
+        progress_interval (float): seconds between two progress messages, defaults to 1.0
+    """
+    from Utils.instrumentation import timer_registry
+    from Utils.model_registry import model_registry
+    start_time = time.perf_counter()
+    try:
+        run_job = load_job_target(job_target)
+        if preload_model_paths:
+            preload_models(preload_model_paths)
+    except Exception:
+        result_queue.put({'ready': False, 'error': traceback.format_exc()})
+        return
+    result_queue.put({'ready': True, 'seconds': time.perf_counter() - start_time,
+                      'model_load_seconds': {str(key): seconds for key, seconds in model_registry.load_seconds.items()}})
+
+    while True:
+        job = job_queue.get()
+        if job is None:
+            break
+        loaded_before = set(model_registry.load_seconds)
+        # the progress is counted by the TimerRegistry too
+        if collect_stage_timings or progress_stage is not None:
+            timer_registry.reset()
+            timer_registry.enable()
+        if progress_stage is not None:
+            stop_event = threading.Event()
+            progress_thread = threading.Thread(target=report_progress, args=(result_queue, progress_stage, progress_interval, stop_event),
+                                               name='progress', daemon=True)
+            progress_thread.start()
+        start_time = time.perf_counter()
+        error = None
+        try:
+            run_job(**job)
+        except Exception:
+            error = traceback.format_exc()
+        if progress_stage is not None:
+            # the last progress message must come before the result
+            stop_event.set()
+            progress_thread.join()
+        result = {
+            'seconds': time.perf_counter() - start_time,
+            'error': error,
+            # models loaded by this job, which later jobs get warm
+            'model_load_seconds': {str(key): seconds for key, seconds in model_registry.load_seconds.items() if key not in loaded_before},
+        }
+        if progress_stage is not None:
+            result['frames_done'] = get_stage_frames(progress_stage)
+        if collect_stage_timings or progress_stage is not None:
+            timer_registry.disable()
+        if collect_stage_timings:
+            result['stage_seconds'] = {name: stage['total_seconds'] for name, stage in timer_registry.get_report()['stages'].items()}
+        result_queue.put(result)
+
+
+class ModelWorker:
+    """
+    Class to run analysis jobs in a persistent worker process. The worker imports the analysis and loads its models once, and
+    keeps them in its ModelRegistry across jobs, so a job only pays for the work on its video and not for starting up.
+    Jobs run one at a time, in the order they are submitted.
+    """
+    def __init__(self, job_target="main:main", preload_model_paths=None, collect_stage_timings=False, progress_stage=None, progress_interval=1.0):
+        """Constructor for ModelWorker class
+
+        Args:
+            job_target (str): "module:function" of the function running a job with the keyword arguments of the job, defaults to "main:main"
+            preload_model_paths (dict): paths of the models loaded when the worker starts, keyed by 'keypoints', 'player' and 'ball',
+                None to load them on first use, defaults to None
+            collect_stage_timings (bool): return the time spent in each timed stage of a job (see TimerRegistry), defaults to False
+            progress_stage (str): name of the timed stage whose frames are the progress of a job, e.g. "FrameCompositor.compose"
+                for main(), None to report no progress, defaults to None
+            progress_interval (float): seconds between two progress reports of the worker, defaults to 1.0
+        """
+        self.job_target = job_target
+        self.preload_model_paths = preload_model_paths
+        self.collect_stage_timings = collect_stage_timings
+        self.progress_stage = progress_stage
+        self.progress_interval = progress_interval
+        self.process = None
+        self.startup_seconds = None
+        self.model_load_seconds = {}
+
+    def start(self):
+        """Start the worker process and wait until it is ready
+
+        Returns:
+            ModelWorker: self
+        """
+        # a spawned worker does not inherit the state of the parent, e.g. its torch threads
+        context = multiprocessing.get_context('spawn')
+        self.job_queue = context.Queue()
+        self.result_queue = context.Queue()
+        start_time = time.perf_counter()
+        self.process = context.Process(target=run_worker, args=(self.job_queue, self.result_queue, self.job_target, self.preload_model_paths,
+                                                                self.collect_stage_timings, self.progress_stage, self.progress_interval),
+                                       name='model_worker', daemon=True)
+        self.process.start()
+        ready = self.get_result()
+        if not ready['ready']:
+            self.process.join()
+            raise RuntimeError(f"The model worker failed to start:\n{ready['error']}")
+        self.startup_seconds = time.perf_counter() - start_time
+        self.model_load_seconds = ready['model_load_seconds']
+        return self
+
+    def run_job(self, progress_callback=None, **job):
+        """Run a job in the worker and wait for it
+
+        Args:
+            progress_callback: function called with the number of frames done each time the worker reports the progress of
+                the job (see progress_stage), defaults to None
+            **job: keyword arguments of the job function, e.g. input_video_path and output_video_path for main()
+
+        Returns:
+            dict: seconds spent on the job in the worker, the load times of the models the job loaded, with
+                collect_stage_timings the seconds spent in each timed stage, and with progress_stage the frames done
+        """
+        if self.process is None:
+            self.start()
+        self.job_queue.put(job)
+        result = self.get_result()
+        # the progress messages of the job come before its result
+        while 'seconds' not in result:
+            if progress_callback is not None:
+                progress_callback(result['frames_done'])
+            result = self.get_result()
+        if result['error'] is not None:
+            raise RuntimeError(f"The job failed in the model worker:\n{result['error']}")
+        return result
+
+    def get_result(self):
+        """Wait for the next message of the worker
+
+        Returns:
+            dict: the message
+        """
+        while True:
+            try:
+                return self.result_queue.get(timeout=1)
+            except queue.Empty:
+                if not self.process.is_alive():
+                    self.process = None
+                    raise RuntimeError("The model worker exited unexpectedly")
+
+    def is_alive(self):
+        """Check if the worker process is running
+
+        Returns:
+            bool: True if the worker process is running
+        """
+        return self.process is not None and self.process.is_alive()
+
+    def stop(self):
+        """Stop the worker process after its current job"""
+        if self.process is not None:
+            self.job_queue.put(None)
+            self.process.join()
+            self.process = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.stop()
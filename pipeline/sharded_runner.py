@@ -0,0 +1,240 @@
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+from Utils.bbox_utils import get_iou
+from Utils.keypoint_segments import CourtKeypointSegments
+from Utils.video_utils import iter_video_frames, get_video_frame_count
+
+# models of the worker process, created once per worker by init_worker()
+worker_models = {}
+
+
+def init_worker(player_model_path, ball_model_path, keypoints_model_path, threads_per_worker, tracker_options, keypoint_scheduler_options):
+    """Load the models of a worker process. Each worker holds its own models, so the models are loaded once per worker
+    and not once per shard.
+
+    Args:
+        player_model_path (str): path to the player detection model
+        ball_model_path (str): path to the ball detection model
+        keypoints_model_path (str): path to the court keypoints model, None to skip the court keypoints
+        threads_per_worker (int): number of threads each worker may use for inference
+        tracker_options (dict): keyword arguments of the trackers, {'player': {...}, 'ball': {...}}
+        keypoint_scheduler_options (dict): keyword arguments of the KeypointScheduler
+    """
+    # keep the workers from oversubscribing the cores
+    cv2.setNumThreads(1)
+    try:
+        import torch
+        torch.set_num_threads(threads_per_worker)
+    except ImportError:
+        pass
+
+    from Trackers import PlayerTracker, BallTracker
+    worker_models['player_tracker'] = PlayerTracker(player_model_path, **tracker_options.get('player', {}))
+    worker_models['ball_tracker'] = BallTracker(ball_model_path, **tracker_options.get('ball', {}))
+    worker_models['keypoint_scheduler'] = None
+    if keypoints_model_path is not None:
+        from court_line_detector import CourtLineDetector, KeypointScheduler
+        worker_models['keypoint_scheduler'] = KeypointScheduler(CourtLineDetector(keypoints_model_path, num_threads=threads_per_worker),
+                                                                **keypoint_scheduler_options)
+
+
+def run_shard(video_path, start_frame, end_frame):
+    """Detect the players, the ball and the court keypoints in one shard of a video, in a worker process
+
+    Args:
+        video_path (str): path to the video
+        start_frame (int): first frame of the shard, including the overlap with the previous shard
+        end_frame (int): frame after the last frame of the shard
+
+    Returns:
+        dict: start_frame, the per-frame player and ball detections of the shard, the court keypoint segments as a list of
+            (frame index in the video, keypoints) and the time spent on the shard
+    """
+    start_time = time.perf_counter()
+    player_tracker = worker_models['player_tracker']
+    ball_tracker = worker_models['ball_tracker']
+    keypoint_scheduler = worker_models['keypoint_scheduler']
+
+    # the tracks of the previous shard handled by this worker do not continue in this one
+    player_tracker.reset_tracks()
+    player_detections = player_tracker.detect_frames(iter_video_frames(video_path, start_frame, end_frame))
+    ball_detections = ball_tracker.detect_frames(iter_video_frames(video_path, start_frame, end_frame))
+    court_keypoints = []
+    if keypoint_scheduler is not None:
+        segments = keypoint_scheduler.detect_keypoints(iter_video_frames(video_path, start_frame, end_frame))
+        court_keypoints = [(start_frame + segment_start, keypoints) for segment_start, keypoints in segments]
+
+    return {
+        'start_frame': start_frame,
+        'player_detections': player_detections,
+        'ball_detections': ball_detections,
+        'court_keypoints': court_keypoints,
+        'seconds': time.perf_counter() - start_time,
+    }
+
+
+def reconcile_track_ids(previous_detections, current_detections, next_track_id, iou_threshold=0.5):
+    """Map the track IDs of a shard to the track IDs of the previous shard, by matching the boxes of the two shards in the frames they share.
+    Each pair of tracks is scored by its mean IoU over the shared frames, and pairs are matched greedily by decreasing score.
+    Tracks of the shard that match no previous track get new IDs.
+
+    Args:
+        previous_detections: per-frame detection dictionaries of the previous shard (with final track IDs) in the shared frames
+        current_detections: per-frame detection dictionaries of the shard (with its own track IDs), starting at the first shared frame
+        next_track_id (int): first unused final track ID
+        iou_threshold (float): minimum mean IoU for two tracks to be the same, defaults to 0.5
+
+    Returns:
+        tuple: (dictionary mapping the track IDs of the shard to final track IDs, next unused final track ID)
+    """
+    iou_sums = {}
+    frame_counts = {}
+    for previous_dict, current_dict in zip(previous_detections, current_detections):
+        for current_id, current_bbox in current_dict.items():
+            frame_counts[current_id] = frame_counts.get(current_id, 0) + 1
+            for previous_id, previous_bbox in previous_dict.items():
+                iou_sums[(current_id, previous_id)] = iou_sums.get((current_id, previous_id), 0.0) + get_iou(current_bbox, previous_bbox)
+
+    # a pair's score counts the frames where only one of the two tracks is detected as 0
+    scores = sorted(((iou_sum / frame_counts[current_id], current_id, previous_id) for (current_id, previous_id), iou_sum in iou_sums.items()), reverse=True)
+    track_id_map = {}
+    matched_previous_ids = set()
+    for score, current_id, previous_id in scores:
+        if score < iou_threshold:
+            break
+        if current_id in track_id_map or previous_id in matched_previous_ids:
+            continue
+        track_id_map[current_id] = previous_id
+        matched_previous_ids.add(previous_id)
+
+    current_ids = sorted({track_id for current_dict in current_detections for track_id in current_dict})
+    for current_id in current_ids:
+        if current_id not in track_id_map:
+            track_id_map[current_id] = next_track_id
+            next_track_id += 1
+    return track_id_map, next_track_id
+
+
+class ShardedRunner:
+    """
+    Class to run the detection stage of the analysis on a long video across processes. The video is split into shards of
+    consecutive frames, each shard is detected in a ProcessPoolExecutor worker holding its own models, and the results are
+    stitched in order. Each shard also decodes and detects the last overlap frames of the previous shard, so that its tracker
+    has warmed up by the shard boundary and its player tracks can be matched to the previous shard's tracks on those frames;
+    the duplicated overlap frames are then dropped.
+    """
+    def __init__(self, video_path, player_model_path, ball_model_path, keypoints_model_path=None, number_of_workers=None,
+                 shard_size=None, overlap=32, iou_threshold=0.5, tracker_options=None, keypoint_scheduler_options=None):
+        """Constructor for ShardedRunner class
+
+        Args:
+            video_path (str): path to the video
+            player_model_path (str): path to the player detection model
+            ball_model_path (str): path to the ball detection model
+            keypoints_model_path (str): path to the court keypoints model, None to skip the court keypoints, defaults to None
+            number_of_workers (int): number of worker processes, defaults to the number of cores
+            shard_size (int): number of frames of a shard without its overlap, defaults to the video split evenly across the workers
+            overlap (int): number of frames of the previous shard detected again at the start of a shard, defaults to 32
+            iou_threshold (float): minimum mean IoU over the overlap for two player tracks to be the same, defaults to 0.5
+            tracker_options (dict): keyword arguments of the trackers, {'player': {...}, 'ball': {...}}, defaults to None
+            keypoint_scheduler_options (dict): keyword arguments of the KeypointScheduler of each worker, defaults to None
+        """
+        self.video_path = video_path
+        self.player_model_path = player_model_path
+        self.ball_model_path = ball_model_path
+        self.keypoints_model_path = keypoints_model_path
+        self.number_of_workers = number_of_workers or os.cpu_count() or 1
+        self.shard_size = shard_size
+        self.overlap = overlap
+        self.iou_threshold = iou_threshold
+        self.tracker_options = tracker_options or {}
+        self.keypoint_scheduler_options = keypoint_scheduler_options or {}
+        self.shard_seconds = []
+
+    def get_shards(self, number_of_frames):
+        """Split the frames of the video into shards
+
+        Args:
+            number_of_frames (int): number of frames of the video
+
+        Returns:
+            list: list of (start frame including the overlap, first frame kept, frame after the last frame) of each shard
+        """
+        shard_size = self.shard_size or max(math.ceil(number_of_frames / self.number_of_workers), 1)
+        shards = []
+        for core_start in range(0, number_of_frames, shard_size):
+            shards.append((max(core_start - self.overlap, 0), core_start, min(core_start + shard_size, number_of_frames)))
+        return shards
+
+    def stitch(self, shards, results):
+        """Stitch the results of the shards: player track IDs are reconciled across the boundaries, the overlap frames are
+        dropped, and the court keypoint segments are merged
+
+        Args:
+            shards: shards returned by get_shards()
+            results: results of run_shard() for each shard, in the same order
+
+        Returns:
+            dict: player_detections and ball_detections as lists with one dictionary per frame, and court_keypoints as CourtKeypointSegments
+        """
+        player_detections = []
+        ball_detections = []
+        court_keypoints = CourtKeypointSegments()
+        next_track_id = 1
+        for (start_frame, core_start, end_frame), result in zip(shards, results):
+            overlap = core_start - start_frame
+            shard_player_detections = result['player_detections']
+            # the shards are cut from the frame count of the container, which can disagree with the number of decoded frames
+            if not len(shard_player_detections) == len(result['ball_detections']) == end_frame - start_frame:
+                raise RuntimeError(f"The shard of frames {start_frame} to {end_frame} returned {len(shard_player_detections)} player "
+                                   f"and {len(result['ball_detections'])} ball detections instead of {end_frame - start_frame}, "
+                                   f"run the video without sharding")
+            if core_start == 0:
+                track_id_map = {track_id: track_id for player_dict in shard_player_detections for track_id in player_dict}
+                next_track_id = max(track_id_map.values(), default=0) + 1
+            else:
+                track_id_map, next_track_id = reconcile_track_ids(player_detections[start_frame:core_start],
+                                                                  shard_player_detections,
+                                                                  next_track_id,
+                                                                  self.iou_threshold)
+            for player_dict in shard_player_detections[overlap:]:
+                player_detections.append({track_id_map[track_id]: bbox for track_id, bbox in player_dict.items()})
+            ball_detections.extend(result['ball_detections'][overlap:])
+
+            # the keypoints in force at the first kept frame, then the segments starting after it
+            shard_segments = CourtKeypointSegments()
+            for segment_start, keypoints in result['court_keypoints']:
+                shard_segments.add_segment(segment_start, keypoints)
+            if len(shard_segments):
+                court_keypoints.add_segment(core_start, shard_segments.get_keypoints(core_start))
+                for segment_start, keypoints in shard_segments:
+                    if segment_start > core_start:
+                        court_keypoints.add_segment(segment_start, keypoints)
+
+        return {
+            'player_detections': player_detections,
+            'ball_detections': ball_detections,
+            'court_keypoints': court_keypoints if len(court_keypoints) else None,
+        }
+
+    def run(self):
+        """Run the detection of the shards in the worker processes and stitch the results
+
+        Returns:
+            dict: player_detections, ball_detections and court_keypoints of the whole video, see stitch()
+        """
+        shards = self.get_shards(get_video_frame_count(self.video_path))
+        threads_per_worker = max((os.cpu_count() or 1) // self.number_of_workers, 1)
+        # spawned workers do not inherit the inference threads of the parent process
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=self.number_of_workers, mp_context=context, initializer=init_worker,
+                                 initargs=(self.player_model_path, self.ball_model_path, self.keypoints_model_path,
+                                           threads_per_worker, self.tracker_options, self.keypoint_scheduler_options)) as executor:
+            futures = [executor.submit(run_shard, self.video_path, start_frame, end_frame) for start_frame, _, end_frame in shards]
+            results = [future.result() for future in futures]
+        self.shard_seconds = [result['seconds'] for result in results]
+        return self.stitch(shards, results)
@@ -0,0 +1,301 @@
+import queue
+import threading
+import time
+from Utils.video_utils import read_video_chunks, save_video
+from Utils.video_writers import DEFAULT_FPS
+
+# marks the end of the video in a queue, so that each stage stops once it has seen all the frames
+END_OF_VIDEO = object()
+
+
+class StageStats:
+    """
+    Class to record the throughput of one stage of the pipeline and the occupancy of the queue feeding it
+    """
+    def __init__(self, name):
+        """Constructor for StageStats class
+
+        Args:
+            name (str): name of the stage
+        """
+        self.name = name
+        self.frames = 0
+        self.busy_seconds = 0.0
+        self.queue_samples = 0
+        self.queue_total = 0
+        self.queue_max = 0
+
+    def add_frames(self, number_of_frames, seconds):
+        """Record frames handled by the stage and the time spent working on them
+
+        Args:
+            number_of_frames (int): number of frames handled
+            seconds (float): time spent working on the frames, excluding the time spent waiting on queues
+        """
+        self.frames += number_of_frames
+        self.busy_seconds += seconds
+
+    def sample_queue(self, occupancy):
+        """Record the number of chunks waiting in the queue feeding the stage
+
+        Args:
+            occupancy (int): number of chunks in the queue
+        """
+        self.queue_samples += 1
+        self.queue_total += occupancy
+        self.queue_max = max(self.queue_max, occupancy)
+
+    def to_dict(self):
+        """Summary of the stage
+
+        Returns:
+            dict: frames, busy time, frames per second and mean/max occupancy of the input queue
+        """
+        return {
+            'frames': self.frames,
+            'busy_seconds': self.busy_seconds,
+            'frames_per_second': self.frames / self.busy_seconds if self.busy_seconds > 0 else float('nan'),
+            'mean_queue_occupancy': self.queue_total / self.queue_samples if self.queue_samples > 0 else 0.0,
+            'max_queue_occupancy': self.queue_max,
+        }
+
+
+class ThreadedVideoReader:
+    """
+    Class to decode a video in chunks of frames on a background thread. The decoded chunks wait in a bounded queue,
+    so decoding runs ahead of the consumer by at most queue_size chunks.
+    """
+    def __init__(self, video_path, chunk_size=64, queue_size=4):
+        """Constructor for ThreadedVideoReader class
+
+        Args:
+            video_path (str): path to the video
+            chunk_size (int): number of frames in a chunk
+            queue_size (int): maximum number of decoded chunks waiting to be consumed
+        """
+        self.video_path = video_path
+        self.chunk_size = chunk_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stats = StageStats('decode')
+        self.stop_event = threading.Event()
+        self.error = None
+        self.thread = None
+
+    def start(self):
+        """Start the decoding thread"""
+        self.thread = threading.Thread(target=self.decode, name='decode', daemon=True)
+        self.thread.start()
+
+    def decode(self):
+        """Decode the video and put the chunks on the queue, followed by END_OF_VIDEO"""
+        try:
+            chunks = read_video_chunks(self.video_path, self.chunk_size)
+            while not self.stop_event.is_set():
+                start_time = time.perf_counter()
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                self.stats.add_frames(len(chunk), time.perf_counter() - start_time)
+                self.put(chunk)
+            chunks.close()
+        except Exception as error:
+            self.error = error
+        finally:
+            self.put(END_OF_VIDEO)
+
+    def put(self, item):
+        """Put an item on the queue, giving up if the consumer has stopped"""
+        while True:
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                if self.stop_event.is_set():
+                    return
+
+    def stop(self):
+        """Stop the decoding thread before the end of the video"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def __iter__(self):
+        """Iterate over the decoded chunks, starting the decoding thread if needed
+
+        Yields:
+            list: the next chunk of frames of the video
+        """
+        if self.thread is None:
+            self.start()
+        try:
+            while True:
+                item = self.queue.get()
+                if item is END_OF_VIDEO:
+                    break
+                yield item
+        finally:
+            self.stop()
+        if self.error is not None:
+            raise self.error
+
+    def iter_frames(self):
+        """Iterate over the decoded frames one at a time
+
+        Yields:
+            frame: the next frame of the video
+        """
+        for chunk in self:
+            yield from chunk
+
+
+class ThreadedVideoWriter:
+    """
+    Class to encode chunks of frames on a background thread, fed by a bounded queue
+    """
+    def __init__(self, output_path, queue_size=4, fps=DEFAULT_FPS, backend='cv2', writer_options=None):
+        """Constructor for ThreadedVideoWriter class
+
+        Args:
+            output_path (str): path to save the video
+            queue_size (int): maximum number of chunks waiting to be encoded
+            fps (float): frame rate of the video, defaults to 24
+            backend (str): video writer backend, 'cv2' or 'ffmpeg', see save_video(), defaults to 'cv2'
+            writer_options (dict): options of the video writer, defaults to None
+        """
+        self.output_path = output_path
+        self.fps = fps
+        self.backend = backend
+        self.writer_options = writer_options or {}
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stats = StageStats('encode')
+        self.error = None
+        self.end_of_video_taken = False
+        self.thread = threading.Thread(target=self.encode, name='encode', daemon=True)
+        self.thread.start()
+
+    def queued_frames(self):
+        """Take chunks from the queue until END_OF_VIDEO, timing the encoder between chunks
+
+        Yields:
+            frame: the next frame to encode
+        """
+        while True:
+            self.stats.sample_queue(self.queue.qsize())
+            chunk = self.queue.get()
+            if chunk is END_OF_VIDEO:
+                self.end_of_video_taken = True
+                return
+            start_time = time.perf_counter()
+            yield from chunk
+            self.stats.add_frames(len(chunk), time.perf_counter() - start_time)
+
+    def encode(self):
+        """Encode the queued frames to the output video"""
+        try:
+            save_video(self.queued_frames(), self.output_path, self.fps, self.backend, **self.writer_options)
+        except Exception as error:
+            self.error = error
+            # keep draining so that the producer never blocks on a full queue, unless the writer failed on closing,
+            # after END_OF_VIDEO was taken
+            while not self.end_of_video_taken:
+                self.end_of_video_taken = self.queue.get() is END_OF_VIDEO
+
+    def write_chunk(self, frames):
+        """Queue a chunk of frames to be encoded, blocking while the queue is full
+
+        Args:
+            frames: list of frames
+        """
+        if self.error is not None:
+            raise self.error
+        self.queue.put(frames)
+
+    def close(self):
+        """Signal the end of the video and wait for the encoder to finish"""
+        self.queue.put(END_OF_VIDEO)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+class ThreadedPipeline:
+    """
+    Class to run a video through a processing function with decoding and encoding on their own threads.
+    The processing stage (inference and drawing) runs on the calling thread, fed by a bounded queue of decoded chunks,
+    and feeds a bounded queue of chunks to encode, so that I/O overlaps with compute.
+    """
+    def __init__(self, input_video_path, process_chunk, output_video_path=None, chunk_size=64, queue_size=4, fps=DEFAULT_FPS, writer_backend='cv2', writer_options=None):
+        """Constructor for ThreadedPipeline class
+
+        Args:
+            input_video_path (str): path to the input video
+            process_chunk: function called as process_chunk(frames, chunk_start) for each chunk of frames, where chunk_start
+                is the index of the first frame of the chunk. Returns the frames to encode
+            output_video_path (str): path to save the processed video, None to skip encoding
+            chunk_size (int): number of frames in a chunk
+            queue_size (int): maximum number of chunks waiting in each queue
+            fps (float): frame rate of the output video, defaults to 24
+            writer_backend (str): video writer backend of the output video, 'cv2' or 'ffmpeg', defaults to 'cv2'
+            writer_options (dict): options of the video writer, see save_video(), defaults to None
+        """
+        self.input_video_path = input_video_path
+        self.process_chunk = process_chunk
+        self.output_video_path = output_video_path
+        self.chunk_size = chunk_size
+        self.queue_size = queue_size
+        self.fps = fps
+        self.writer_backend = writer_backend
+        self.writer_options = writer_options
+        self.stats = {}
+
+    def run(self):
+        """Run the pipeline until the end of the video
+
+        Returns:
+            dict: per-stage throughput and queue occupancy, see StageStats.to_dict()
+        """
+        reader = ThreadedVideoReader(self.input_video_path, self.chunk_size, self.queue_size)
+        writer = ThreadedVideoWriter(self.output_video_path, self.queue_size, self.fps, self.writer_backend, self.writer_options) if self.output_video_path is not None else None
+        process_stats = StageStats('process')
+        wall_start_time = time.perf_counter()
+
+        try:
+            reader.start()
+            chunk_start = 0
+            while True:
+                process_stats.sample_queue(reader.queue.qsize())
+                chunk = reader.queue.get()
+                if chunk is END_OF_VIDEO:
+                    break
+                start_time = time.perf_counter()
+                output_frames = self.process_chunk(chunk, chunk_start)
+                process_stats.add_frames(len(chunk), time.perf_counter() - start_time)
+                if writer is not None:
+                    writer.write_chunk(output_frames)
+                chunk_start += len(chunk)
+        finally:
+            reader.stop()
+            if writer is not None:
+                writer.close()
+        if reader.error is not None:
+            raise reader.error
+
+        self.stats = {'wall_seconds': time.perf_counter() - wall_start_time}
+        for stats in (reader.stats, process_stats) + ((writer.stats,) if writer is not None else ()):
+            self.stats[stats.name] = stats.to_dict()
+        return self.stats
+
+    def format_stats(self):
+        """Format the stats of the last run as a table
+
+        Returns:
+            str: one line per stage with frames/sec and queue occupancy
+        """
+        lines = [f"{'stage':<8} {'frames':>8} {'frames/sec':>11} {'mean queue':>11} {'max queue':>10}"]
+        for name, stats in self.stats.items():
+            if name == 'wall_seconds':
+                continue
+            lines.append(f"{name:<8} {stats['frames']:>8} {stats['frames_per_second']:>11.1f} "
+                         f"{stats['mean_queue_occupancy']:>11.2f} {stats['max_queue_occupancy']:>10}")
+        lines.append(f"total wall time: {self.stats.get('wall_seconds', 0.0):.2f}s")
+        return "\n".join(lines)
@@ -0,0 +1,66 @@
+import os
+from Utils.detection_cache import DetectionCache
+
+
+def make_files(tmp_path):
+    video_path = tmp_path / 'video.mp4'
+    model_path = tmp_path / 'model.pt'
+    video_path.write_bytes(b'video')
+    model_path.write_bytes(b'model')
+    return str(video_path), str(model_path)
+
+
+def detect_chunk_recording(calls):
+    def detect_chunk(frames):
+        frames = list(frames)
+        calls.append(frames)
+        return [{1: [frame, frame, frame + 1, frame + 1]} for frame in frames]
+    return detect_chunk
+
+
+def test_key_depends_on_video_model_and_params(tmp_path):
+    video_path, model_path = make_files(tmp_path)
+    cache_dir = str(tmp_path / 'cache')
+    cache = DetectionCache(cache_dir, video_path, model_path, {'conf': 0.15})
+    assert DetectionCache(cache_dir, video_path, model_path, {'conf': 0.15}).directory == cache.directory
+    assert DetectionCache(cache_dir, video_path, model_path, {'conf': 0.2}).directory != cache.directory
+    assert DetectionCache(cache_dir, video_path, model_path, {'conf': 0.15}, chunk_size=8).directory != cache.directory
+    # a video with another content gets another cache
+    with open(video_path, 'ab') as f:
+        f.write(b'more')
+    os.utime(video_path, ns=(1, 1))
+    assert DetectionCache(cache_dir, video_path, model_path, {'conf': 0.15}).directory != cache.directory
+
+
+def test_get_or_detect_then_load(tmp_path):
+    video_path, model_path = make_files(tmp_path)
+    cache = DetectionCache(str(tmp_path / 'cache'), video_path, model_path, {}, chunk_size=4)
+    calls = []
+    detections = cache.get_or_detect(range(10), detect_chunk_recording(calls))
+    assert [len(chunk) for chunk in calls] == [4, 4, 2]
+    assert cache.is_complete() and cache.get_number_of_frames() == 10
+    assert cache.get_or_detect(range(10), detect_chunk_recording(calls)) == detections
+    assert len(calls) == 3
+    assert cache.load_range(3, 9) == detections[3:9]
+
+
+def test_resume_detects_only_missing_chunks(tmp_path):
+    video_path, model_path = make_files(tmp_path)
+    cache = DetectionCache(str(tmp_path / 'cache'), video_path, model_path, {}, chunk_size=4)
+    saved_chunk = [{1: ['saved']}] * 4
+    cache.save_chunk(0, saved_chunk)
+    calls = []
+    detections = cache.get_or_detect(range(10), detect_chunk_recording(calls))
+    assert calls == [[4, 5, 6, 7], [8, 9]]
+    assert detections[:4] == saved_chunk
+    assert len(detections) == 10
+
+
+def test_not_resumable_detects_a_partial_cache_whole(tmp_path):
+    video_path, model_path = make_files(tmp_path)
+    cache = DetectionCache(str(tmp_path / 'cache'), video_path, model_path, {}, chunk_size=4)
+    cache.save_chunk(0, [{1: ['saved']}] * 4)
+    calls = []
+    detections = cache.get_or_detect(range(10), detect_chunk_recording(calls), resumable=False)
+    assert calls == [list(range(10))]
+    assert cache.load_all() == detections
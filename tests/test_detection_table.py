@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from Utils.detection_table import DetectionTable, to_detection_table
+
+# frame 1 has no detection, frame 3 (the last frame) has none either
+DETECTIONS = [
+    {1: [10.0, 20.0, 30.0, 40.0], 2: [50.0, 60.0, 70.0, 80.0]},
+    {},
+    {2: [51.5, 61.5, 71.5, 81.5]},
+    {},
+]
+
+
+def test_from_dicts_round_trip():
+    table = DetectionTable.from_dicts(DETECTIONS)
+    assert len(table) == len(DETECTIONS)
+    assert table.to_dicts() == DETECTIONS
+    assert list(table) == DETECTIONS
+    assert table[-1] == {}
+
+
+def test_empty_table():
+    table = DetectionTable.from_dicts([{}, {}])
+    assert len(table) == 2
+    assert table.to_dicts() == [{}, {}]
+
+
+def test_slice_is_relative_to_its_first_frame():
+    table = DetectionTable.from_dicts(DETECTIONS)
+    assert table[1:3].to_dicts() == DETECTIONS[1:3]
+    assert table[2:].to_dicts() == DETECTIONS[2:]
+    with pytest.raises(IndexError):
+        table[len(DETECTIONS)]
+
+
+def test_from_arrays_sorts_rows_by_frame():
+    table = DetectionTable.from_arrays([2, 0, 0], [2, 1, 2], [DETECTIONS[2][2], DETECTIONS[0][1], DETECTIONS[0][2]], number_of_frames=4)
+    assert table.to_dicts() == DETECTIONS
+
+
+def test_dense_round_trip_keeps_missing_frames():
+    table = DetectionTable.from_dicts(DETECTIONS)
+    dense = table.to_dense(2)
+    assert np.isnan(dense[1]).all() and np.isnan(dense[3]).all()
+    assert DetectionTable.from_dense(dense, track_id=2).to_dicts() == [{2: bbox} if bbox else {} for bbox in (d.get(2) for d in DETECTIONS)]
+
+
+def test_filter_tracks():
+    table = DetectionTable.from_dicts(DETECTIONS)
+    assert table.track_ids().tolist() == [1, 2]
+    assert table.filter_tracks([1]).to_dicts() == [{1: DETECTIONS[0][1]}, {}, {}, {}]
+
+
+@pytest.mark.parametrize('extension', ['.npy', '.npz'])
+def test_save_and_load_keep_trailing_empty_frames(tmp_path, extension):
+    path = str(tmp_path / f'detections{extension}')
+    DetectionTable.from_dicts(DETECTIONS).save(path)
+    loaded = DetectionTable.load(path)
+    assert len(loaded) == len(DETECTIONS)
+    assert loaded.to_dicts() == DETECTIONS
+
+
+def test_to_detection_table_keeps_tables():
+    table = DetectionTable.from_dicts(DETECTIONS)
+    assert to_detection_table(table) is table
+    assert to_detection_table(DETECTIONS).to_dicts() == DETECTIONS
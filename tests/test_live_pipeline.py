@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from Utils import save_video
+from Trackers import PlayerTracker, BallTracker
+from court_line_detector import KeypointScheduler
+from pipeline.live_pipeline import LivePipeline
+from benchmarks.run_benchmarks import COURT_KEYPOINTS_1080P
+
+WIDTH, HEIGHT = 960, 540
+COURT_KEYPOINTS = np.array(COURT_KEYPOINTS_1080P, dtype=np.float32) / 2
+NUMBER_OF_FRAMES = 40
+FIRST_BALL_FRAME = 11
+
+
+class StubCourtLineDetector:
+    """Court line detector returning the same keypoints for every frame"""
+    def predict_batch(self, images, batch_size=16):
+        return [COURT_KEYPOINTS.copy() for _ in images]
+
+    def draw_keypoints(self, image, keypoints):
+        return image
+
+
+def get_player_dict(frame_num):
+    # the near player at the bottom of the court, the far player at the top
+    return {1: [460.0 + frame_num, 350.0, 495.0 + frame_num, 450.0], 2: [465.0 - frame_num, 110.0, 490.0 - frame_num, 160.0]}
+
+
+def get_ball_dict(frame_num):
+    # no ball in the first frames, longer than the interpolation lag
+    if frame_num < FIRST_BALL_FRAME:
+        return {}
+    return {1: [400.0 + 2 * frame_num, 150.0 + 5 * frame_num, 408.0 + 2 * frame_num, 158.0 + 5 * frame_num]}
+
+
+@pytest.fixture
+def video_path(tmp_path):
+    path = str(tmp_path / 'input.avi')
+    save_video([np.full((HEIGHT, WIDTH, 3), 90, np.uint8) for _ in range(NUMBER_OF_FRAMES)], path, 24)
+    return path
+
+
+@pytest.mark.parametrize('projection_method', ['homography', 'height'])
+def test_missing_ball_at_the_start(tmp_path, video_path, projection_method):
+    player_tracker = PlayerTracker('player.pt')
+    ball_tracker = BallTracker('ball.pt')
+    frame_nums = {'player': 0, 'ball': 0}
+
+    def detect_players(frame):
+        frame_nums['player'] += 1
+        return get_player_dict(frame_nums['player'] - 1)
+
+    def detect_ball(frame):
+        frame_nums['ball'] += 1
+        return get_ball_dict(frame_nums['ball'] - 1)
+
+    player_tracker.detect_frame = detect_players
+    ball_tracker.detect_frame = detect_ball
+    output_video_path = str(tmp_path / f'output_{projection_method}.avi')
+    live_pipeline = LivePipeline(player_tracker, ball_tracker, KeypointScheduler(StubCourtLineDetector()), output_video_path,
+                                 projection_method=projection_method, interpolation_lag=5)
+    stats = live_pipeline.run(video_path)
+    assert stats['frames'] == NUMBER_OF_FRAMES
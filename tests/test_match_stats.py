@@ -0,0 +1,98 @@
+import math
+from copy import deepcopy
+import pytest
+import constants
+from Utils.match_stats import MatchStatsAccumulator
+from Utils.conversions import convert_pixel_distance_to_meters
+
+INITIAL_STATS = {
+    'frame_num': 0,
+    'player_1_number_of_shots': 0,
+    'player_1_total_shot_speed': 0,
+    'player_1_last_shot_speed': 0,
+    'player_1_total_player_speed': 0,
+    'player_1_last_player_speed': 0,
+    'player_2_number_of_shots': 0,
+    'player_2_total_shot_speed': 0,
+    'player_2_last_shot_speed': 0,
+    'player_2_total_player_speed': 0,
+    'player_2_last_player_speed': 0,
+}
+# (frame of the shot, player who shot, ball speed, opponent speed)
+SHOTS = [(12, 1, 90.0, 10.0), (40, 2, 120.0, 14.0), (75, 1, 80.0, 9.0), (76, 2, 60.0, 0.0)]
+
+
+def divide(total, count):
+    # float division as done by the pandas columns of the per-frame stats table
+    if count == 0:
+        return math.nan if total == 0 else math.copysign(math.inf, total)
+    return total / count
+
+
+def get_reference_stats(shots, number_of_frames):
+    """Per-frame stats built as one row per frame forward-filled from the rows of the shots"""
+    rows = [dict(INITIAL_STATS)]
+    for frame_num, player, ball_speed, opponent_speed in shots:
+        row = deepcopy(rows[-1])
+        row['frame_num'] = frame_num
+        opponent = 1 if player == 2 else 2
+        row[f'player_{player}_number_of_shots'] += 1
+        row[f'player_{player}_total_shot_speed'] += ball_speed
+        row[f'player_{player}_last_shot_speed'] = ball_speed
+        row[f'player_{opponent}_total_player_speed'] += opponent_speed
+        row[f'player_{opponent}_last_player_speed'] = opponent_speed
+        rows.append(row)
+    per_frame = []
+    for frame_num in range(number_of_frames):
+        row = dict([row for row in rows if row['frame_num'] <= frame_num][-1])
+        row['player_1_average_shot_speed'] = divide(row['player_1_total_shot_speed'], row['player_1_number_of_shots'])
+        row['player_2_average_shot_speed'] = divide(row['player_2_total_shot_speed'], row['player_2_number_of_shots'])
+        row['player_1_average_player_speed'] = divide(row['player_1_total_player_speed'], row['player_2_number_of_shots'])
+        row['player_2_average_player_speed'] = divide(row['player_2_total_player_speed'], row['player_1_number_of_shots'])
+        del row['frame_num']
+        per_frame.append(row)
+    return per_frame
+
+
+def assert_same_stats(stats, reference):
+    assert stats.keys() == reference.keys()
+    for key, value in reference.items():
+        if math.isnan(value):
+            assert math.isnan(stats[key]), key
+        else:
+            assert stats[key] == pytest.approx(value), key
+
+
+def test_stats_match_per_frame_table():
+    match_stats = MatchStatsAccumulator()
+    for shot in SHOTS:
+        match_stats.add_shot(*shot[:3], 1 if shot[1] == 2 else 2, shot[3])
+    reference = get_reference_stats(SHOTS, 100)
+    for frame_num in range(100):
+        assert_same_stats(match_stats.stats_at(frame_num), reference[frame_num])
+
+
+def test_values_at_follows_columns():
+    match_stats = MatchStatsAccumulator()
+    match_stats.add_shot(10, 2, 100.0, 1, 12.0)
+    assert match_stats.values_at(9, ['player_2_number_of_shots']) == [0]
+    assert match_stats.values_at(10, ['player_2_last_shot_speed', 'player_1_last_player_speed']) == [100.0, 12.0]
+
+
+def test_shots_out_of_order_are_refused():
+    match_stats = MatchStatsAccumulator()
+    match_stats.add_shot(10, 1, 100.0, 2, 12.0)
+    with pytest.raises(ValueError):
+        match_stats.add_shot(5, 2, 100.0, 1, 12.0)
+
+
+def test_add_shot_from_positions():
+    match_stats = MatchStatsAccumulator()
+    mini_court_width = 250
+    # player 1 is next to the ball and shoots it 100 pixels away in 2 seconds, while player 2 moves 30 pixels
+    match_stats.add_shot_from_positions(5, 2.0, {1: (0, 0), 2: (0, 200)}, (5, 5), {1: (0, 0), 2: (30, 200)}, (105, 5), mini_court_width)
+    stats = match_stats.stats_at(5)
+    meters_per_pixel = convert_pixel_distance_to_meters(1, constants.DOUBLE_LINE_WIDTH, mini_court_width)
+    assert stats['player_1_number_of_shots'] == 1
+    assert stats['player_1_last_shot_speed'] == pytest.approx(100 * meters_per_pixel / 2.0 * 3.6)
+    assert stats['player_2_last_player_speed'] == pytest.approx(30 * meters_per_pixel / 2.0 * 3.6)
@@ -0,0 +1,64 @@
+import pytest
+from Trackers.ball_tracker import BallTracker
+from Trackers.online_filters import FixedLagBallInterpolator, OnlineShotDetector
+
+
+def get_ball_dict(frame_num):
+    # ball going down for 40 frames, up for 40 frames, and so on
+    phase = frame_num % 80
+    y = phase * 5.0 if phase < 40 else (80 - phase) * 5.0
+    return {1: [100.0 + frame_num, y, 110.0 + frame_num, y + 10.0]}
+
+
+def run_interpolator(interpolator, ball_detections):
+    released = []
+    for frame_num, ball_dict in enumerate(ball_detections):
+        released.extend(interpolator.push(frame_num, ball_dict))
+    released.extend(interpolator.flush())
+    return released
+
+
+def test_short_gaps_match_offline_interpolation():
+    # gaps of at most lag frames, including at the start of the video
+    missing_frames = {0, 1, 5, 6, 7, 20, 30, 31, 32, 33, 34}
+    ball_detections = [{} if frame_num in missing_frames else get_ball_dict(frame_num) for frame_num in range(40)]
+    released = run_interpolator(FixedLagBallInterpolator(lag=5), ball_detections)
+    assert [frame_num for frame_num, _ in released] == list(range(40))
+    offline = BallTracker('ball.pt').interpolate_ball_positions(ball_detections)
+    for (_, ball_dict), offline_dict in zip(released, offline):
+        assert ball_dict[1] == pytest.approx(offline_dict[1])
+
+
+def test_long_gaps_are_released_after_the_lag():
+    ball_detections = [get_ball_dict(0)] + [{}] * 10 + [get_ball_dict(11)]
+    interpolator = FixedLagBallInterpolator(lag=3)
+    released_at = {}
+    for frame_num, ball_dict in enumerate(ball_detections):
+        for released_frame_num, released_dict in interpolator.push(frame_num, ball_dict):
+            released_at[released_frame_num] = (frame_num, released_dict)
+    assert sorted(released_at) == list(range(12))
+    for frame_num, (push_frame_num, ball_dict) in released_at.items():
+        assert push_frame_num - frame_num <= 3
+    # frames released before the next detection keep the last detected position
+    assert released_at[1][1] == get_ball_dict(0)
+    assert released_at[7][1] == get_ball_dict(0)
+
+
+def test_frames_before_any_detection_are_released_empty():
+    released = run_interpolator(FixedLagBallInterpolator(lag=2), [{}, {}, {}, {}])
+    assert released == [(0, {}), (1, {}), (2, {}), (3, {})]
+
+
+def test_online_shot_detection_matches_offline():
+    ball_positions = [get_ball_dict(frame_num) for frame_num in range(300)]
+    online_detector = OnlineShotDetector()
+    online_hits = []
+    for frame_num, ball_dict in enumerate(ball_positions):
+        hit = online_detector.push(ball_dict)
+        if hit is not None:
+            # a hit is confirmed following_frames frames after it
+            assert frame_num - hit == online_detector.following_frames
+            online_hits.append(hit)
+    offline_hits = BallTracker('ball.pt').get_ball_shot_frames(ball_positions)
+    assert offline_hits
+    assert online_hits == offline_hits
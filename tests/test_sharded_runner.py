@@ -0,0 +1,63 @@
+import pytest
+
+from pipeline.sharded_runner import ShardedRunner, reconcile_track_ids
+
+
+def get_player_dict(frame_num):
+    # two players walking in opposite directions
+    return {1: [10.0 + frame_num, 100.0, 50.0 + frame_num, 200.0], 2: [400.0 - frame_num, 300.0, 440.0 - frame_num, 420.0]}
+
+
+def test_overlapping_boxes_keep_their_track_id():
+    previous = [get_player_dict(frame_num) for frame_num in range(5)]
+    # the shard tracked the same players with its own IDs, swapped, plus a player only it has seen
+    current = [{7: player_dict[2], 3: player_dict[1], 9: [600.0, 0.0, 640.0, 80.0]} for player_dict in previous]
+    track_id_map, next_track_id = reconcile_track_ids(previous, current, next_track_id=3)
+    assert track_id_map == {3: 1, 7: 2, 9: 3}
+    assert next_track_id == 4
+
+
+def test_tracks_below_the_iou_threshold_get_new_ids():
+    previous = [{1: [0.0, 0.0, 10.0, 10.0]}]
+    current = [{1: [8.0, 8.0, 18.0, 18.0]}]
+    track_id_map, next_track_id = reconcile_track_ids(previous, current, next_track_id=2)
+    assert track_id_map == {1: 2}
+    assert next_track_id == 3
+
+
+def test_stitch_matches_an_unsharded_run():
+    number_of_frames = 50
+    video_detections = [get_player_dict(frame_num) for frame_num in range(number_of_frames)]
+    ball_detections = [{1: [float(frame_num)] * 4} for frame_num in range(number_of_frames)]
+    runner = ShardedRunner('video.mp4', 'player.pt', 'ball.pt', number_of_workers=3, overlap=4)
+    shards = runner.get_shards(number_of_frames)
+    assert shards[0] == (0, 0, 17) and shards[1] == (13, 17, 34) and shards[-1][2] == number_of_frames
+
+    results = []
+    for shard_index, (start_frame, core_start, end_frame) in enumerate(shards):
+        # each shard numbers its tracks from its own first ID
+        id_offset = 10 * shard_index
+        results.append({
+            'player_detections': [{track_id + id_offset: bbox for track_id, bbox in video_detections[frame_num].items()}
+                                  for frame_num in range(start_frame, end_frame)],
+            'ball_detections': ball_detections[start_frame:end_frame],
+            'court_keypoints': [(start_frame, [shard_index] * 28)],
+        })
+    stitched = runner.stitch(shards, results)
+    assert stitched['player_detections'] == video_detections
+    assert stitched['ball_detections'] == ball_detections
+    # the keypoints of each shard are in force from its first kept frame
+    assert [stitched['court_keypoints'].get_keypoints(frame_num)[0] for frame_num in (0, 16, 17, 34, 49)] == [0, 0, 1, 2, 2]
+
+
+def test_stitch_rejects_a_shard_with_missing_frames():
+    runner = ShardedRunner('video.mp4', 'player.pt', 'ball.pt', number_of_workers=2, overlap=4)
+    shards = runner.get_shards(20)
+    # the last shard decoded fewer frames than the container reported
+    results = [{
+        'player_detections': [get_player_dict(frame_num) for frame_num in range(start_frame, min(end_frame, 18))],
+        'ball_detections': [{} for _ in range(start_frame, min(end_frame, 18))],
+        'court_keypoints': [],
+    } for start_frame, _, end_frame in shards]
+    with pytest.raises(RuntimeError, match="without sharding"):
+        runner.stitch(shards, results)
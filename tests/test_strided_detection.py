@@ -0,0 +1,32 @@
+from Trackers import StridedDetector
+from benchmarks.benchmark_strided_detection import evaluate
+
+
+def get_player_dict(frame_num):
+    # a player walking slowly, who jumps 100 pixels at frame 21
+    x = 10.0 + frame_num + (100.0 if frame_num >= 21 else 0.0)
+    return {1: [x, 100.0, x + 40.0, 200.0]}
+
+
+def run_strided_detector(motion_threshold, number_of_frames=40):
+    ground_truth = [get_player_dict(frame_num) for frame_num in range(number_of_frames)]
+    # the frames are the frame indices, and detecting a frame looks it up in the ground truth
+    strided_detector = StridedDetector(lambda frame_num: ground_truth[frame_num], stride=4, motion_threshold=motion_threshold)
+    detections = strided_detector.detect_frames(range(number_of_frames))
+    assert len(detections) == number_of_frames
+    return evaluate(detections, ground_truth), strided_detector.number_of_detected_frames
+
+
+def test_slow_motion_is_interpolated():
+    metrics, number_of_detected_frames = run_strided_detector(motion_threshold=0.25, number_of_frames=21)
+    assert number_of_detected_frames == 6
+    assert metrics['max_center_error'] < 1e-9
+
+
+def test_large_jump_between_keyframes_lowers_the_max_error():
+    interpolated_metrics, interpolated_detected_frames = run_strided_detector(motion_threshold=1000.0)
+    fallback_metrics, fallback_detected_frames = run_strided_detector(motion_threshold=0.25)
+    assert interpolated_metrics['max_center_error'] > 50.0
+    # the frames between the keyframes around the jump are detected instead of interpolated
+    assert fallback_metrics['max_center_error'] < 1e-9
+    assert fallback_detected_frames > interpolated_detected_frames